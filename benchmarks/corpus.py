@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import csv
+import sys
+import json
+import math
+import codecs
+import random
+import bisect
+from datetime import date
+
+# Synthetic collections for benchmarking: texts drawn from a Zipfian
+# vocabulary (common English function words at the top, made-up words
+# below), dates clustered around a centre per label, and place names from
+# the geodict gazetteer, mentioned in the texts and used as places of
+# publication. A corpus is determined by its size and seed, and is kept on
+# disk to be reused by later runs.
+
+FORMAT_VERSION = 1
+
+FUNCTION_WORDS = [
+    'the', 'of', 'and', 'to', 'in', 'a', 'is', 'that', 'for', 'it', 'as',
+    'was', 'with', 'be', 'by', 'on', 'not', 'he', 'this', 'are', 'or',
+    'his', 'from', 'at', 'which', 'but', 'have', 'an', 'had', 'they',
+    ]
+
+_onsets = ['b', 'c', 'd', 'f', 'g', 'h', 'j', 'k', 'l', 'm', 'n', 'p', 'r',
+           's', 't', 'v', 'w', 'z', 'br', 'ch', 'cl', 'dr', 'gr', 'pl',
+           'sh', 'st', 'th', 'tr']
+_nuclei = ['a', 'e', 'i', 'o', 'u', 'ai', 'ea', 'ou', 'io']
+_codas = ['', '', 'n', 'r', 's', 't', 'l', 'm', 'nd', 'st', 'ng']
+
+DEFAULT_VOCABULARY = 50000
+DEFAULT_LABELS = 8
+DEFAULT_PLACES = 500
+MEAN_WORDS = 300
+
+
+def _make_word(rng):
+    syllables = rng.randint(1, 4)
+    return u''.join(rng.choice(_onsets) + rng.choice(_nuclei)
+                    + rng.choice(_codas) for i in range(syllables))
+
+
+def make_vocabulary(rng, size=DEFAULT_VOCABULARY):
+    """Function words, then made-up alphabetic words, by rank"""
+
+    vocab = [unicode(x) for x in FUNCTION_WORDS]
+    seen = set(vocab)
+    while len(vocab) < size:
+        word = _make_word(rng)
+        if word not in seen:
+            seen.add(word)
+            vocab.append(word)
+    return vocab
+
+
+class Zipf:
+
+    """
+    Draws ranks 0..n-1 with probability proportional to 1 / (rank + 1) ** s
+    """
+
+    def __init__(self, n, s=1.07):
+        self.cumulative = []
+        total = 0.0
+        for rank in xrange(n):
+            total += 1.0 / (rank + 1) ** s
+            self.cumulative.append(total)
+        self.total = total
+
+    def draw(self, rng):
+        return bisect.bisect_left(self.cumulative, rng.random()
+                                  * self.total)
+
+
+def geodict_places(database_path, count=DEFAULT_PLACES):
+    """
+    (name, geonameid, lat, lon) of the most populous cities in the
+    gazetteer, through sqlite3 or, under Jython, its JDBC driver
+    """
+
+    query = 'SELECT city, geonameid, lat, lon FROM cities ' \
+        + 'ORDER BY population DESC LIMIT ' + str(int(count))
+    try:
+        import sqlite3
+        connection = sqlite3.connect(database_path)
+        try:
+            return [tuple(row) for row in
+                    connection.execute(query).fetchall()]
+        finally:
+            connection.close()
+    except ImportError:
+        pass
+    from lib.classpath import classPathHacker
+    classPathHacker().addFile(os.path.join(os.path.dirname(database_path),
+                              'sqlite-jdbc-3.7.2.jar'))
+    from lib.geodict import jsqlite3
+    cursor = jsqlite3.connect(database_path).cursor()
+    cursor.execute(query)
+    return [tuple(row) for row in cursor.fetchall()]
+
+
+def _label_centres(rng, labels):
+    return [date(rng.randint(1860, 1990), 1, 1).toordinal() for i in
+            range(labels)]
+
+
+def generate(
+    directory,
+    docs,
+    places,
+    seed=0,
+    vocabulary=DEFAULT_VOCABULARY,
+    labels=DEFAULT_LABELS,
+    ):
+    """
+    Write a collection of docs texts and its metadata CSV to directory
+    (unless it is already there); returns the corpus description
+    """
+
+    info_filename = os.path.join(directory, 'corpus.json')
+    if os.path.exists(info_filename):
+        with codecs.open(info_filename, 'r', encoding='utf-8') as f:
+            info = json.load(f)
+        if info.get('version') == FORMAT_VERSION:
+            return info
+
+    rng = random.Random(seed)
+    vocab = make_vocabulary(rng, vocabulary)
+    zipf = Zipf(len(vocab))
+    label_names = [u'label' + unicode(i) for i in range(labels)]
+    centres = _label_centres(rng, labels)
+    texts_dir = os.path.join(directory, 'texts')
+    if not os.path.exists(texts_dir):
+        os.makedirs(texts_dir)
+
+    csv_filename = os.path.join(directory, 'collection.csv')
+    tokens = 0
+    with open(csv_filename, 'wb') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(['filename', 'itemID', 'title', 'label', 'key',
+                        'year', 'date', 'place'])
+        for doc in xrange(docs):
+            label = rng.randrange(labels)
+            length = max(20, int(rng.lognormvariate(math.log(MEAN_WORDS),
+                         0.5)))
+            words = [vocab[zipf.draw(rng)] for i in xrange(length)]
+
+            # a few place mentions per text, in the "in <place>" form the
+            # gazetteer looks for
+
+            for i in range(rng.randint(0, 4)):
+                place = rng.choice(places)[0]
+                words.insert(rng.randrange(len(words) + 1), u'in '
+                             + place)
+            lines = [u' '.join(words[i:i + 12]) for i in xrange(0,
+                     len(words), 12)]
+            text = u'.\n'.join(lines) + u'.\n'
+            tokens += len(text.split())
+            filename = os.path.join(texts_dir, str(doc) + '.txt')
+            with codecs.open(filename, 'w', encoding='utf-8') as f:
+                f.write(text)
+
+            if rng.random() < 0.01:
+                date_str = u''
+            else:
+                ordinal = int(rng.gauss(centres[label], 3650))
+                ordinal = min(max(ordinal, date(1800, 1, 1).toordinal()),
+                              date(2010, 12, 31).toordinal())
+                date_str = date.fromordinal(ordinal).isoformat()
+                if rng.random() < 0.1:
+                    date_str = date_str[:4] + u'-00-00'
+            place_of_publication = (rng.choice(places)[0] if rng.random()
+                                    < 0.7 else u'')
+            row = [filename, unicode(doc), u'Document ' + unicode(doc),
+                   label_names[label], u'K' + unicode(doc), date_str[:4],
+                   date_str, place_of_publication]
+            writer.writerow([unicode(x).encode('utf-8') for x in row])
+            if doc % 1000 == 999:
+                sys.stderr.write('generated {:} of {:} texts\n'.format(doc
+                                 + 1, docs))
+
+    info = {
+        'version': FORMAT_VERSION,
+        'docs': docs,
+        'seed': seed,
+        'tokens': tokens,
+        'csv': csv_filename,
+        'places': [list(x) for x in places],
+        }
+    with codecs.open(info_filename, 'w', encoding='utf-8') as f:
+        json.dump(info, f)
+    return info
+
+
+def generate_dfr(
+    directory,
+    docs,
+    seed=0,
+    vocabulary=DEFAULT_VOCABULARY,
+    ):
+    """
+    Write a JSTOR Data for Research download of docs articles to directory
+    (unless it is already there): citations.CSV and, for each article,
+    wordcounts/wordcounts_<doi>.CSV of words and their counts
+    """
+
+    info_filename = os.path.join(directory, 'dfr.json')
+    if os.path.exists(info_filename):
+        with codecs.open(info_filename, 'r', encoding='utf-8') as f:
+            info = json.load(f)
+        if info.get('version') == FORMAT_VERSION:
+            return info
+
+    rng = random.Random(seed)
+    vocab = make_vocabulary(rng, vocabulary)
+    zipf = Zipf(len(vocab))
+    wordcounts_dir = os.path.join(directory, 'wordcounts')
+    if not os.path.exists(wordcounts_dir):
+        os.makedirs(wordcounts_dir)
+
+    tokens = 0
+    with open(os.path.join(directory, 'citations.CSV'), 'wb') as \
+        citations_file:
+        writer = csv.writer(citations_file)
+        writer.writerow(['id', 'doi', 'title', 'author', 'journaltitle',
+                        'volume', 'issue', 'pubdate', 'pagerange',
+                        'publisher', 'type', 'reviewed-work'])
+        for doc in xrange(docs):
+            doi = '10.2307/' + str(1000000 + doc)
+            length = max(200, int(rng.lognormvariate(math.log(MEAN_WORDS
+                         * 10), 0.5)))
+            counts = {}
+            for i in xrange(length):
+                word = vocab[zipf.draw(rng)]
+                counts[word] = counts.get(word, 0) + 1
+            tokens += length
+            with open(os.path.join(wordcounts_dir, 'wordcounts_'
+                      + doi.replace('/', '_') + '.CSV'), 'wb') as f:
+                counts_writer = csv.writer(f)
+                counts_writer.writerow(['WORDCOUNTS', 'WEIGHT'])
+                for (word, count) in sorted(counts.iteritems(), key=lambda \
+                        x: -x[1]):
+                    counts_writer.writerow([word.encode('utf-8'), count])
+            year = rng.randint(1900, 2000)
+            writer.writerow([doi, doi, 'Article ' + str(doc), 'Author',
+                            'Journal', str(rng.randint(1, 90)),
+                            str(rng.randint(1, 4)), '{:}-{:02d}-01T00:00:00Z'.format(year,
+                            rng.randint(1, 12)), 'pp. 1-20', 'Publisher',
+                            'fla', ''])
+
+    info = {
+        'version': FORMAT_VERSION,
+        'docs': docs,
+        'seed': seed,
+        'tokens': tokens,
+        'directory': directory,
+        }
+    with codecs.open(info_filename, 'w', encoding='utf-8') as f:
+        json.dump(info, f)
+    return info
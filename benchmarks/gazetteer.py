@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Geoparser benchmark: geodict over a fixed set of texts.
+
+    jython benchmarks/gazetteer.py [--repeat 3] [--json FILE]
+        [--update-golden]
+
+Runs GeodictParser.find_locations_in_text against the bundled geodict.db
+on the texts in data/geoparser/texts.json -- short, medium and long
+documents mixing English, French, German, Spanish, Italian, Greek and
+Russian prose, with ambiguous names (Nice, Reading, Bath) and diacritics.
+For each size it reports characters per second, gazetteer queries per
+document and places found, and checks the places against the golden
+<id>_geodict.json files beside the texts (the format the geoparser writes
+next to each document). Exits with status 1 if any text differs.
+"""
+
+import os
+import sys
+import json
+import time
+import codecs
+import argparse
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROCESSORS_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), 'chrome',
+                              'content', 'papermachines', 'processors')
+for path in (os.path.dirname(BENCHMARKS_DIR), PROCESSORS_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+DATA_DIR = os.path.join(BENCHMARKS_DIR, 'data', 'geoparser')
+
+GOLDEN_DIR = os.path.join(DATA_DIR, 'golden')
+
+DATABASE = os.path.join(PROCESSORS_DIR, 'lib', 'geodict', 'geodict.db')
+
+# the gazetteer stores coordinates as single-precision floats
+
+COORDINATE_TOLERANCE = 1e-4
+
+
+def load_texts(filename=os.path.join(DATA_DIR, 'texts.json')):
+    with codecs.open(filename, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_parser(database_path=DATABASE):
+    """The geoparser's own parser, counting the queries it makes"""
+
+    try:
+        from lib.classpath import classPathHacker
+        classPathHacker().addFile(os.path.join(PROCESSORS_DIR, 'lib',
+                                  'geodict', 'sqlite-jdbc-3.7.2.jar'))
+    except ImportError:
+        pass
+    import geoparser
+    parser = geoparser.get_parser(database_path)
+    queries = [0]
+    get_cities = parser.data.get_cities
+
+    def counted_get_cities(*args):
+        queries[0] += 1
+        return get_cities(*args)
+
+    parser.data.get_cities = counted_get_cities
+    return (parser, queries)
+
+
+def golden_filename(text_id):
+    return os.path.join(GOLDEN_DIR, text_id + '_geodict.json')
+
+
+def same_places(found, expected):
+    if len(found) != len(expected):
+        return False
+    for ((place, reference), (golden, golden_reference)) in zip(found,
+            expected):
+        if list(reference) != list(golden_reference):
+            return False
+        for key in ('name', 'entityURI', 'type'):
+            if place[key] != golden[key]:
+                return False
+        for key in ('latitude', 'longitude'):
+            if abs(place[key] - golden[key]) > COORDINATE_TOLERANCE:
+                return False
+    return True
+
+
+def run(
+    texts,
+    parser,
+    queries,
+    repeat=1,
+    update_golden=False,
+    ):
+    """Per-tier results and the ids of texts that differ from golden"""
+
+    import geoparser
+    tiers = dict((tier, {
+        'documents': 0,
+        'characters': 0,
+        'seconds': 0.0,
+        'queries': 0,
+        'places': 0,
+        'mismatches': 0,
+        }) for tier in texts['tiers'])
+    mismatches = []
+    if update_golden and not os.path.exists(GOLDEN_DIR):
+        os.makedirs(GOLDEN_DIR)
+
+    for entry in texts['texts']:
+        tier = tiers[entry['tier']]
+        text = entry['text']
+        best = None
+        for i in range(repeat):
+            queries[0] = 0
+            start = time.time()
+            found = list(geoparser.find_places(text,
+                         parser.find_locations_in_text))
+            seconds = time.time() - start
+            best = (seconds if best is None else min(best, seconds))
+        tier['documents'] += 1
+        tier['characters'] += len(text)
+        tier['seconds'] += best
+        tier['queries'] += queries[0]
+        tier['places'] += len(found)
+
+        if update_golden:
+            with codecs.open(golden_filename(entry['id']), 'w',
+                             encoding='utf-8') as f:
+                json.dump(found, f, sort_keys=True)
+            continue
+        try:
+            with codecs.open(golden_filename(entry['id']), 'r',
+                             encoding='utf-8') as f:
+                expected = json.load(f)
+        except IOError:
+            expected = None
+        if expected is None or not same_places(found, expected):
+            tier['mismatches'] += 1
+            mismatches.append(entry['id'])
+
+    for tier in tiers.itervalues():
+        tier['seconds'] = round(tier['seconds'], 4)
+        tier['characters_per_second'] = (round(tier['characters']
+                / tier['seconds'], 1) if tier['seconds'] else None)
+        tier['queries_per_document'] = (round(tier['queries']
+                / float(tier['documents']), 1) if tier['documents'
+                ] else None)
+    return (tiers, mismatches)
+
+
+def report(tiers, order):
+    lines = ['{:<8} {:>5} {:>9} {:>9} {:>11} {:>10} {:>7} {:>10}'.format(
+        'size',
+        'docs',
+        'chars',
+        'seconds',
+        'chars/s',
+        'queries/doc',
+        'places',
+        'mismatches',
+        )]
+    for name in order:
+        tier = tiers[name]
+        lines.append('{:<8} {:>5} {:>9} {:>9.3f} {:>11} {:>10} {:>7} {:>10}'.format(
+            name,
+            tier['documents'],
+            tier['characters'],
+            tier['seconds'],
+            tier['characters_per_second'] or '-',
+            tier['queries_per_document'] or '-',
+            tier['places'],
+            tier['mismatches'],
+            ))
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs per text; the fastest is kept')
+    parser.add_argument('--json', default=None,
+                        help='also write the results to this file')
+    parser.add_argument('--update-golden', action='store_true',
+                        help='rewrite the golden files from this run')
+    options = parser.parse_args(argv)
+
+    texts = load_texts()
+    start = time.time()
+    (geodict, queries) = load_parser()
+    load_seconds = time.time() - start
+    (tiers, mismatches) = run(texts, geodict, queries,
+                              max(options.repeat, 1),
+                              options.update_golden)
+
+    print 'gazetteer loaded in {:.2f} s'.format(load_seconds)
+    print '\n'.join(report(tiers, texts['tiers']))
+    if options.json is not None:
+        with codecs.open(options.json, 'w', encoding='utf-8') as f:
+            json.dump({
+                'started': time.strftime('%Y-%m-%dT%H:%M:%S',
+                        time.localtime(start)),
+                'platform': sys.platform,
+                'version': sys.version,
+                'load_seconds': round(load_seconds, 3),
+                'tiers': tiers,
+                'mismatches': mismatches,
+                }, f, indent=1, sort_keys=True)
+    if options.update_golden:
+        print 'golden files written to ' + GOLDEN_DIR
+    elif mismatches:
+        print 'differs from golden: ' + ', '.join(mismatches)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
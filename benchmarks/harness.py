@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import codecs
+import shutil
+import logging
+import threading
+import traceback
+from lib.memory import used_memory
+
+# Runs processors in this interpreter, as `jython <processor>.py args.json`
+# would, while a sampler thread records memory use more often than the
+# processor's own metrics do; each stage's peak is the largest sample taken
+# during its span(s).
+
+
+class MemorySampler(threading.Thread):
+
+    """
+    Samples used_memory() every interval seconds until stopped
+    """
+
+    def __init__(self, interval=0.05):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.interval = interval
+        self.samples = []
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.samples.append((time.time(), used_memory()))
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.samples.append((time.time(), used_memory()))
+
+    def peak(self, start=None, end=None):
+        values = [used for (t, used) in self.samples if (start is None
+                  or t >= start) and (end is None or t <= end)]
+        if not values:
+
+            # a span shorter than the interval: the last sample before it
+
+            values = [used for (t, used) in self.samples if start is None
+                      or t < start][-1:]
+        return (max(values) if values else None)
+
+
+def _reset_logging():
+    root = logging.getLogger('')
+    for handler in root.handlers[:]:
+        try:
+            handler.close()
+        except:
+            pass
+        root.removeHandler(handler)
+
+
+def copy_csv(csv_file, run_dir):
+    """
+    A copy of a corpus CSV in run_dir. The metadata cache is written next
+    to the CSV (<csv>.metadata), so each benchmark gets its own and its
+    cold phase starts without one
+    """
+
+    copy = os.path.join(run_dir, os.path.basename(csv_file))
+    shutil.copyfile(csv_file, copy)
+    if os.path.exists(copy + '.metadata'):
+        os.remove(copy + '.metadata')
+    return copy
+
+
+def write_args(
+    filename,
+    cwd,
+    csv_file,
+    out_dir,
+    collection_name,
+    extra_args=(),
+    named_args=None,
+    ):
+    args = [cwd, csv_file, out_dir, collection_name] + list(extra_args)
+    if named_args is not None:
+        args += ['json', json.dumps(named_args)]
+    with codecs.open(filename, 'w', encoding='utf-8') as f:
+        json.dump(args, f)
+    return filename
+
+
+def run_processor(
+    module_name,
+    class_name,
+    args_filename,
+    setup=None,
+    ):
+    """
+    Instantiate and run one processor; returns its metrics, with the peak
+    memory of each stage and of the whole run, or the error it failed with
+    """
+
+    with codecs.open(args_filename, 'r', encoding='utf-8') as f:
+        out_dir = json.load(f)[2]
+    if not os.path.exists(os.path.join(out_dir, 'logs')):
+        os.makedirs(os.path.join(out_dir, 'logs'))
+
+    saved_argv = sys.argv
+    saved_cwd = os.getcwd()
+    sys.argv = [module_name + '.py', args_filename]
+    sampler = MemorySampler()
+    sampler.start()
+    start = time.time()
+    processor = None
+    result = {}
+    try:
+        module = __import__(module_name)
+        processor = getattr(module, class_name)(track_progress=True)
+        processor.cache_results = False
+        if setup is not None:
+            setup(processor)
+        processor.run()
+    except SystemExit, e:
+        result['error'] = 'exited with ' + str(e.code)
+    except:
+        result['error'] = traceback.format_exc()
+    finally:
+        end = time.time()
+        sampler.stop()
+        sys.argv = saved_argv
+        os.chdir(saved_cwd)
+        _reset_logging()
+
+    result['seconds'] = round(end - start, 3)
+    result['peak_memory'] = sampler.peak()
+    if processor is not None and getattr(processor, 'metrics', None) \
+        is not None:
+        metrics = processor.metrics.to_dict()
+        peaks = {}
+        for (name, span_start, span_end) in processor.metrics.events:
+            peak = sampler.peak(span_start, span_end)
+            if peak is not None:
+                peaks[name] = max(peaks.get(name, 0), peak)
+        for span in metrics['spans']:
+            span['peak_memory'] = max(span['peak_memory'],
+                                      peaks.get(span['name']))
+        result['spans'] = metrics['spans']
+        result['counters'] = metrics['counters']
+    return result
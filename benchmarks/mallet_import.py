@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+MALLET import benchmark: the steps before topic modeling, one at a time.
+
+    jython benchmarks/mallet_import.py [--scales 1000,10000]
+        [--only plain,stemming,tfidf,dfr,bulkloader] [--json FILE]
+
+Imports a synthetic collection the way the topic modeling processors do --
+tokenizing, stemming and stopword filtering (_import_files), reading JSTOR
+wordcounts (_import_dfr), the tf-idf filter and building instances with
+Csv2Vectors or BulkLoader -- without training a model. Each variant starts
+from an empty output directory, so nothing comes from the import cache.
+Reports seconds, tokens/s and peak memory for each stage.
+"""
+
+import os
+import sys
+import json
+import time
+import codecs
+import argparse
+import tempfile
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROCESSORS_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), 'chrome',
+                              'content', 'papermachines', 'processors')
+for path in (os.path.dirname(BENCHMARKS_DIR), PROCESSORS_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from benchmarks import corpus, harness, suite
+
+DEFAULT_SCALES = [1000, 10000]
+
+# name: (stemming, tf-idf, JSTOR wordcounts, BulkLoader)
+
+VARIANTS = [
+    ('plain', False, False, False, False),
+    ('stemming', True, False, False, False),
+    ('tfidf', True, True, False, False),
+    ('dfr', True, True, True, False),
+    ('bulkloader', True, False, False, True),
+    ]
+
+# stages whose input is the collection's texts, JSTOR wordcounts, the
+# imported texts before tf-idf, and the texts MALLET reads
+
+STAGE_INPUT = {
+    'tokenize': 'texts',
+    'import': 'texts',
+    'dfr': 'dfr',
+    'tf-idf': 'pre_tfidf',
+    'instances': 'imported',
+    }
+
+
+def count_tokens(filename):
+    """Words in the text field of a MALLET import file"""
+
+    tokens = 0
+    if not os.path.exists(filename):
+        return 0
+    with codecs.open(filename, 'r', encoding='utf-8') as f:
+        for line in f:
+            tokens += len(line.split(u'\t', 2)[-1].split())
+    return tokens
+
+
+def run_variant(
+    variant,
+    info,
+    dfr_info,
+    out_dir,
+    stoplist,
+    workers=None,
+    ):
+    (name, stemming, tfidf, dfr, bulkloader) = \
+        [x for x in VARIANTS if x[0] == variant][0]
+    run_dir = os.path.join(out_dir, name)
+    if not os.path.exists(run_dir):
+        os.makedirs(run_dir)
+    named_args = {'stoplist': stoplist}
+    if workers is not None:
+        named_args['threads'] = workers
+    args_filename = harness.write_args(os.path.join(run_dir, 'args.json'),
+            PROCESSORS_DIR, harness.copy_csv(info['csv'], run_dir),
+            run_dir, 'benchmark', [], named_args)
+    processors = []
+
+    def setup(processor):
+        processors.append(processor)
+        processor.dry_run = False
+        processor.dfr = dfr
+        if dfr:
+            processor.dfr_dir = dfr_info['directory']
+        processor.use_bulkloader = bulkloader
+        processor.process = lambda : \
+            processor._setup_mallet_instances(sequence=True,
+                tfidf=tfidf, stemming=stemming)
+
+    result = harness.run_processor('mallet', 'Mallet', args_filename,
+                                   setup)
+    if not processors or not hasattr(processors[0], 'texts_file'):
+        return result
+
+    texts_file = processors[0].texts_file
+    tokens = {
+        'texts': info['tokens'],
+        'dfr': (dfr_info['tokens'] if dfr else 0),
+        'pre_tfidf': count_tokens(texts_file + '-pre_tf-idf'),
+        'imported': count_tokens(texts_file),
+        }
+    for span in result.get('spans', []):
+        source = STAGE_INPUT.get(span['name'])
+        if source is None:
+            continue
+        span['tokens'] = tokens[source]
+        if span['name'] == 'import':
+            span['tokens'] += tokens['dfr']
+        if span['seconds'] > 0:
+            span['tokens_per_second'] = round(span['tokens']
+                    / span['seconds'], 1)
+    return result
+
+
+def report(results):
+    lines = []
+    for (scale, runs) in sorted(results['scales'].iteritems(), key=lambda \
+                                x: int(x[0])):
+        lines.append('{:} documents'.format(scale))
+        lines.append('  {:<12} {:<10} {:>9} {:>12} {:>10} {:>9}'.format(
+            'variant',
+            'stage',
+            'seconds',
+            'tokens',
+            'tokens/s',
+            'peak',
+            ))
+        for (variant, stemming, tfidf, dfr, bulkloader) in VARIANTS:
+            if variant not in runs:
+                continue
+            result = runs[variant]
+            if 'error' in result:
+                lines.append('  {:<12} error: {:}'.format(variant,
+                             result['error'].strip().splitlines()[-1]))
+                continue
+            for span in result.get('spans', []):
+                lines.append('  {:<12} {:<10} {:>9.2f} {:>12} {:>10} {:>9}'.format(
+                    variant,
+                    span['name'],
+                    span['seconds'],
+                    span.get('tokens', '-'),
+                    span.get('tokens_per_second', '-'),
+                    suite._megabytes(span.get('peak_memory')),
+                    ))
+            lines.append('  {:<12} {:<10} {:>9.2f} {:>12} {:>10} {:>9}'.format(
+                variant,
+                'total',
+                result['seconds'],
+                '',
+                '',
+                suite._megabytes(result.get('peak_memory')),
+                ))
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scales', default=','.join(str(x) for x in
+                        DEFAULT_SCALES))
+    parser.add_argument('--only', default=None,
+                        help='comma-separated variant names')
+    parser.add_argument('--out', default=os.path.join(tempfile.gettempdir(),
+                        'papermachines-benchmark'))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--json', default=None,
+                        help='also write the results to this file')
+    options = parser.parse_args(argv)
+
+    names = [x[0] for x in VARIANTS]
+    if options.only is not None:
+        names = [x for x in options.only.split(',') if x in names]
+    scales = [int(x) for x in options.scales.split(',')]
+
+    stoplist = suite.copy_stoplist(options.out)
+    places = corpus.geodict_places(os.path.join(PROCESSORS_DIR, 'lib',
+                                   'geodict', 'geodict.db'))
+    results = {'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'platform': sys.platform, 'version': sys.version,
+               'threads': options.threads, 'scales': {}}
+    for scale in scales:
+        info = corpus.generate(os.path.join(options.out, 'corpus-'
+                               + str(scale) + '-' + str(options.seed)),
+                               scale, places, options.seed)
+        dfr_info = None
+        if 'dfr' in names:
+            dfr_info = corpus.generate_dfr(os.path.join(options.out, 'dfr-'
+                    + str(scale) + '-' + str(options.seed)), scale,
+                    options.seed)
+        runs_dir = os.path.join(options.out, 'mallet_import-' + str(scale),
+                                str(int(time.time())))
+        results['scales'][str(scale)] = runs = {}
+        for name in names:
+            sys.stderr.write('importing {:} documents: {:}\n'.format(scale,
+                             name))
+            runs[name] = run_variant(name, info, dfr_info, runs_dir,
+                    stoplist, options.threads)
+
+    print '\n'.join(report(results))
+    if options.json is not None:
+        with codecs.open(options.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+        print 'results written to ' + options.json
+
+
+if __name__ == '__main__':
+    main()
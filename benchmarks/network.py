@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Network benchmarks: processors that call web services, against local
+stand-ins.
+
+    jython benchmarks/network.py [--scales 100,1000] [--latency 0.05]
+        [--jitter 0.05] [--failure-rate 0.01] [--only dbpedia,geoparser]
+
+Starts stand-in Spotlight, geonames and translation services (see
+standins.py) and points the processors at them through lib.services, then
+runs DBpedia annotation, geoparsing and the translated word cloud on a
+synthetic collection, cold and warm, as suite.py does. Half the places in
+the collection are made up, so geodict misses them and the geoparser asks
+geonames. Reports documents/s and the requests made and failed.
+"""
+
+import os
+import sys
+import json
+import time
+import codecs
+import random
+import argparse
+import tempfile
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROCESSORS_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), 'chrome',
+                              'content', 'papermachines', 'processors')
+for path in (os.path.dirname(BENCHMARKS_DIR), PROCESSORS_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from benchmarks import corpus, harness, suite, standins
+from lib.services import environment_variable
+
+DEFAULT_SCALES = [100, 1000]
+
+# name: (module, class, positional args, named args)
+
+NETWORK = [
+    ('dbpedia', 'dbpedia', 'DBpedia', [], {}),
+    ('geoparser', 'geoparser_export', 'GeoparserExport', [], {}),
+    ('translate', 'wordcloud_translate', 'WordCloudTranslate', [],
+     {'lang_from': 'French', 'lang_to': 'English'}),
+    ]
+
+
+def invented_places(rng, count):
+    """(name, geonameid, lat, lon) of places no gazetteer knows"""
+
+    places = []
+    names = set()
+    while len(places) < count:
+        name = u'Port ' + corpus._make_word(rng).capitalize()
+        if name in names:
+            continue
+        names.add(name)
+        places.append((name, 9000000 + len(places), round(rng.uniform(-60,
+                      70), 4), round(rng.uniform(-180, 180), 4)))
+    return places
+
+
+def run_network_benchmark(
+    name,
+    info,
+    server,
+    out_dir,
+    stoplist,
+    workers=None,
+    ):
+    (module_name, class_name, extra_args, named_args) = [x for x in
+            NETWORK if x[0] == name][0][1:]
+    named_args = dict(named_args, stoplist=stoplist)
+    if workers is not None:
+        named_args['threads'] = workers
+    run_dir = os.path.join(out_dir, name)
+    if not os.path.exists(run_dir):
+        os.makedirs(run_dir)
+    args_filename = harness.write_args(os.path.join(run_dir, 'args.json'),
+            PROCESSORS_DIR, harness.copy_csv(info['csv'], run_dir),
+            run_dir, 'benchmark', extra_args, named_args)
+
+    results = {}
+    for phase in ('cold', 'warm'):
+        before = server.stats()
+        result = harness.run_processor(module_name, class_name,
+                args_filename)
+        after = server.stats()
+        for key in ('requests', 'failures'):
+            result[key] = sum(after[key].values()) \
+                - sum(before[key].values())
+        if result['seconds'] > 0:
+            result['docs_per_second'] = round(info['docs']
+                    / result['seconds'], 1)
+            result['requests_per_second'] = round(result['requests']
+                    / result['seconds'], 1)
+        results[phase] = result
+        if 'error' in result:
+            break
+    return results
+
+
+def report(results):
+    lines = []
+    for (scale, runs) in sorted(results['scales'].iteritems(), key=lambda \
+                                x: int(x[0])):
+        lines.append('{:} documents'.format(scale))
+        lines.append('  {:<12} {:<5} {:>9} {:>8} {:>9} {:>10} {:>9}'.format(
+            'processor',
+            'phase',
+            'seconds',
+            'docs/s',
+            'requests',
+            'requests/s',
+            'failures',
+            ))
+        for (name, module_name, class_name, extra_args, named_args) in \
+            NETWORK:
+            for phase in ('cold', 'warm'):
+                result = runs.get(name, {}).get(phase)
+                if result is None:
+                    continue
+                if 'error' in result:
+                    lines.append('  {:<12} {:<5} error: {:}'.format(name,
+                                 phase, result['error'].strip().splitlines()[-1]))
+                    continue
+                lines.append('  {:<12} {:<5} {:>9.2f} {:>8} {:>9} {:>10} {:>9}'.format(
+                    name,
+                    phase,
+                    result['seconds'],
+                    result.get('docs_per_second', '-'),
+                    result['requests'],
+                    result.get('requests_per_second', '-'),
+                    result['failures'],
+                    ))
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scales', default=','.join(str(x) for x in
+                        DEFAULT_SCALES))
+    parser.add_argument('--only', default=None,
+                        help='comma-separated benchmark names')
+    parser.add_argument('--out', default=os.path.join(tempfile.gettempdir(),
+                        'papermachines-benchmark'))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='seconds each request waits')
+    parser.add_argument('--jitter', type=float, default=0.05,
+                        help='up to this many seconds more')
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help='fraction of requests answered with 503')
+    parser.add_argument('--json', default=None,
+                        help='also write the results to this file')
+    options = parser.parse_args(argv)
+
+    names = [x[0] for x in NETWORK]
+    if options.only is not None:
+        names = [x for x in options.only.split(',') if x in names]
+    scales = [int(x) for x in options.scales.split(',')]
+
+    stoplist = suite.copy_stoplist(options.out)
+    known = corpus.geodict_places(os.path.join(PROCESSORS_DIR, 'lib',
+                                  'geodict', 'geodict.db'))
+    places = known + invented_places(random.Random(options.seed),
+            len(known))
+    server = standins.StandInServer(places, options.latency,
+                                    options.jitter, options.failure_rate,
+                                    options.seed).start()
+    saved_environment = dict(os.environ)
+    for (service, url) in server.service_urls().iteritems():
+        os.environ[environment_variable(service)] = url
+
+    results = {
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'platform': sys.platform,
+        'version': sys.version,
+        'threads': options.threads,
+        'latency': options.latency,
+        'jitter': options.jitter,
+        'failure_rate': options.failure_rate,
+        'scales': {},
+        }
+    try:
+        for scale in scales:
+            info = corpus.generate(os.path.join(options.out,
+                                   'network-corpus-' + str(scale) + '-'
+                                   + str(options.seed)), scale, places,
+                                   options.seed)
+            runs_dir = os.path.join(options.out, 'network-' + str(scale),
+                                    str(int(time.time())))
+            results['scales'][str(scale)] = runs = {}
+            for name in names:
+                sys.stderr.write('running {:} on {:} documents\n'.format(name,
+                                 scale))
+                runs[name] = run_network_benchmark(name, info, server,
+                        runs_dir, stoplist, options.threads)
+    finally:
+        server.stop()
+        os.environ.clear()
+        os.environ.update(saved_environment)
+
+    print '\n'.join(report(results))
+    if options.json is not None:
+        with codecs.open(options.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+        print 'results written to ' + options.json
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import re
+import json
+import time
+import random
+import urlparse
+import threading
+import SocketServer
+import BaseHTTPServer
+
+# Local stand-ins for the web services the processors call, answering in
+# the shape the real ones do:
+#
+#   POST /rest/annotate  DBpedia Spotlight: a resource for each known place
+#                        name in the text
+#   GET  /searchJSON     geonames: the place named by q, if known
+#   GET  /translate      a translation of text (from, to), as a JSON string
+#
+# Every request waits latency seconds (plus up to jitter more), and fails
+# with 503 at failure_rate, both drawn from a seeded generator so runs can
+# be repeated. Requests are served on their own threads, as a real service
+# would serve concurrent clients.
+
+PATHS = {
+    '/rest/annotate': 'spotlight',
+    '/searchJSON': 'geonames',
+    '/translate': 'translate',
+    }
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self.server.respond(self, None)
+
+    def do_POST(self):
+        length = int(self.headers.getheader('content-length') or 0)
+        self.server.respond(self, self.rfile.read(length))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer(SocketServer.ThreadingMixIn,
+                    BaseHTTPServer.HTTPServer):
+
+    """
+    Spotlight, geonames and translation stand-ins on a local port
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        places,
+        latency=0.0,
+        jitter=0.0,
+        failure_rate=0.0,
+        seed=0,
+        ):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0),
+                _Handler)
+        self.places = dict((name, (geonameid, lat, lon)) for (name,
+                           geonameid, lat, lon) in places)
+        self.pattern = re.compile(u'|'.join(re.escape(name) for name in
+                                  sorted(self.places, key=len,
+                                  reverse=True)), re.UNICODE)
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = dict((name, 0) for name in PATHS.itervalues())
+        self.failures = dict((name, 0) for name in PATHS.itervalues())
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:' + str(self.server_address[1])
+
+    def service_urls(self):
+        """{service name: URL}, as lib.services reads them"""
+
+        return dict((name, self.url + path) for (path, name) in
+                    PATHS.iteritems())
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever,
+                name='stand-in services')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
+
+    def stats(self):
+        with self.lock:
+            return {'requests': dict(self.requests),
+                    'failures': dict(self.failures)}
+
+    def respond(self, handler, body):
+        parts = urlparse.urlsplit(handler.path)
+        (path, query) = (parts.path, parts.query)
+        service = PATHS.get(path)
+        if service is None:
+            handler.send_error(404)
+            return
+        with self.lock:
+            self.requests[service] += 1
+            delay = self.latency + self.rng.random() * self.jitter
+            failed = self.rng.random() < self.failure_rate
+            if failed:
+                self.failures[service] += 1
+        time.sleep(delay)
+        if failed:
+            handler.send_error(503)
+            return
+
+        params = urlparse.parse_qs((body if body is not None else query),
+                                   keep_blank_values=True)
+        params = dict((key, values[0].decode('utf-8')) for (key, values) in
+                      params.iteritems())
+        answer = getattr(self, '_' + service)(params)
+        data = json.dumps(answer)
+        handler.send_response(200)
+        handler.send_header('Content-Type',
+                            'application/json; charset=utf-8')
+        handler.send_header('Content-Length', str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _spotlight(self, params):
+        text = params.get('text', u'')
+        resources = []
+        for match in self.pattern.finditer(text):
+            name = match.group(0)
+            resources.append({
+                '@URI': 'http://dbpedia.org/resource/' + name.replace(u' '
+                        , u'_'),
+                '@support': str(len(name) * 37),
+                '@types': 'DBpedia:Place,DBpedia:PopulatedPlace',
+                '@surfaceForm': name,
+                '@offset': str(match.start()),
+                '@similarityScore': '0.9',
+                '@percentageOfSecondRank': '0.01',
+                })
+        answer = {
+            '@text': text,
+            '@confidence': params.get('confidence', u'0.2'),
+            '@support': params.get('support', u'20'),
+            '@types': '',
+            '@sparql': '',
+            '@policy': 'whitelist',
+            }
+        if resources:
+            answer['Resources'] = resources
+        return answer
+
+    def _geonames(self, params):
+        name = params.get('q', u'')
+        if name not in self.places:
+            return {'totalResultsCount': 0, 'geonames': []}
+        (geonameid, lat, lon) = self.places[name]
+        return {'totalResultsCount': 1, 'geonames': [{
+            'name': name,
+            'toponymName': name,
+            'geonameId': geonameid,
+            'lat': str(lat),
+            'lng': str(lon),
+            'fcl': 'P',
+            'fcode': 'PPL',
+            'fcodeName': 'populated place',
+            'population': 0,
+            }]}
+
+    def _translate(self, params):
+        return u'{:}:{:}'.format(params.get('to', u'').lower(),
+                                 params.get('text', u''))
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Throughput benchmarks for the processors on synthetic collections.
+
+    jython benchmarks/suite.py [--scales 1000,10000,100000]
+        [--only wordcloud,ngrams] [--save-baseline NAME] [--compare NAME]
+
+Every processor runs twice per scale: cold (empty output directory) and
+warm (token store, term matrices etc. left by the cold run; the result
+cache is always bypassed). Results go to <out>/results-<time>.json.
+"""
+
+import os
+import sys
+import json
+import time
+import codecs
+import shutil
+import argparse
+import tempfile
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROCESSORS_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), 'chrome',
+                              'content', 'papermachines', 'processors')
+for path in (os.path.dirname(BENCHMARKS_DIR), PROCESSORS_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from benchmarks import corpus, harness
+
+DEFAULT_SCALES = [1000, 10000, 100000]
+
+
+def _mallet_import(processor):
+    processor.dry_run = False
+    processor.dfr = False
+    processor.process = lambda : \
+        processor._setup_mallet_instances(sequence=True, tfidf=True,
+            stemming=True)
+
+
+# name: (module, class, positional args, named args, setup)
+
+SUITE = [
+    ('wordcloud', 'wordcloud', 'WordCloud', [], {}, None),
+    ('wordcloud_multiple-plain', 'wordcloud_multiple',
+     'MultipleWordClouds', ['plain'], {}, None),
+    ('wordcloud_multiple-tfidf', 'wordcloud_multiple',
+     'MultipleWordClouds', ['tfidf'], {}, None),
+    ('wordcloud_multiple-dunning', 'wordcloud_multiple',
+     'MultipleWordClouds', ['dunning'], {}, None),
+    ('wordcloud_multiple-mww', 'wordcloud_multiple',
+     'MultipleWordClouds', ['mww'], {}, None),
+    ('ngrams', 'ngrams', 'NGrams', [], {'n': 2, 'interval': 365}, None),
+    ('phrasenet', 'phrasenet', 'PhraseNet', ['x and y'], {}, None),
+    ('geoparser_export', 'geoparser_export', 'GeoparserExport', [], {},
+     None),
+    ('mallet_import', 'mallet', 'Mallet', [], {}, _mallet_import),
+    ]
+
+
+def seed_geonames_cache(out_dir, places):
+    """
+    Answers for every place of publication, so the geoparser never asks
+    geonames.org during a benchmark
+    """
+
+    cache = {}
+    for (name, geonameid, lat, lon) in places:
+        cache[name] = {
+            'name': name,
+            'fcodeName': 'populated place',
+            'geonameId': geonameid,
+            'lat': lat,
+            'lng': lon,
+            'entityURI': 'http://sws.geonames.org/' + str(geonameid),
+            }
+    with codecs.open(os.path.join(out_dir, 'geoparser.cache'), 'w',
+                     encoding='utf-8') as f:
+        json.dump(cache, f)
+
+
+def copy_stoplist(directory):
+    """
+    The extension writes stopwords.txt beside the processors on first
+    use; benchmarks keep their copy in their own directory instead and
+    pass its path to each processor
+    """
+
+    stoplist = os.path.join(directory, 'stopwords.txt')
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    shutil.copyfile(os.path.join(PROCESSORS_DIR, 'stopwords',
+                    'stopwords_en.txt'), stoplist)
+    return stoplist
+
+
+def run_benchmark(
+    name,
+    info,
+    out_dir,
+    stoplist,
+    workers=None,
+    ):
+    (module_name, class_name, extra_args, named_args, setup) = \
+        [x for x in SUITE if x[0] == name][0][1:]
+    named_args = dict(named_args, stoplist=stoplist)
+    if workers is not None:
+        named_args['threads'] = workers
+    run_dir = os.path.join(out_dir, name)
+    if not os.path.exists(run_dir):
+        os.makedirs(run_dir)
+    seed_geonames_cache(run_dir, info['places'])
+    args_filename = harness.write_args(os.path.join(run_dir, 'args.json'),
+            PROCESSORS_DIR, harness.copy_csv(info['csv'], run_dir),
+            run_dir, 'benchmark', extra_args, named_args)
+
+    results = {}
+    for phase in ('cold', 'warm'):
+        result = harness.run_processor(module_name, class_name,
+                args_filename, setup)
+        if result['seconds'] > 0:
+            result['docs_per_second'] = round(info['docs']
+                    / result['seconds'], 1)
+            result['tokens_per_second'] = round(info['tokens']
+                    / result['seconds'], 1)
+        results[phase] = result
+        if 'error' in result:
+            break
+    return results
+
+
+def compare(results, baseline):
+    """Lines of wall-time ratios against a baseline (>1 is slower)"""
+
+    lines = []
+    for (scale, runs) in sorted(results['scales'].items(), key=lambda x: \
+                                int(x[0])):
+        for (name, phases) in sorted(runs.items()):
+            for (phase, result) in sorted(phases.items()):
+                try:
+                    before = baseline['scales'][scale][name][phase]['seconds']
+                except KeyError:
+                    continue
+                if before > 0 and 'error' not in result:
+                    lines.append('{:>7} {:<28} {:<5} {:8.2f}s  was {:8.2f}s  x{:.2f}'.format(scale,
+                                 name, phase, result['seconds'], before,
+                                 result['seconds'] / before))
+    return lines
+
+
+def _megabytes(used):
+    return ('{:.1f} MB'.format(used / 1048576.0) if used is not None else '-')
+
+
+def report(results):
+    lines = []
+    for (scale, runs) in sorted(results['scales'].items(), key=lambda x: \
+                                int(x[0])):
+        for (name, phases) in sorted(runs.items()):
+            for (phase, result) in sorted(phases.items()):
+                if 'error' in result:
+                    lines.append('{:>7} {:<28} {:<5} failed: {:}'.format(scale,
+                                 name, phase,
+                                 result['error'].strip().splitlines()[-1]))
+                    continue
+                lines.append('{:>7} {:<28} {:<5} {:8.2f}s {:>10} docs/s {:>12} tokens/s  peak {:}'.format(
+                    scale,
+                    name,
+                    phase,
+                    result['seconds'],
+                    result.get('docs_per_second'),
+                    result.get('tokens_per_second'),
+                    _megabytes(result['peak_memory']),
+                    ))
+                for span in result.get('spans', []):
+                    lines.append('{:>44} {:<14} {:8.2f}s  peak {:}'.format('',
+                                 span['name'], span['seconds'],
+                                 _megabytes(span['peak_memory'])))
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scales', default=','.join(str(x) for x in
+                        DEFAULT_SCALES))
+    parser.add_argument('--only', default=None,
+                        help='comma-separated benchmark names')
+    parser.add_argument('--out', default=os.path.join(tempfile.gettempdir(),
+                        'papermachines-benchmark'))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--save-baseline', default=None)
+    parser.add_argument('--compare', default=None)
+    options = parser.parse_args(argv)
+
+    names = [x[0] for x in SUITE]
+    if options.only is not None:
+        names = [x for x in options.only.split(',') if x in names]
+    scales = [int(x) for x in options.scales.split(',')]
+    baselines_dir = os.path.join(options.out, 'baselines')
+
+    stoplist = copy_stoplist(options.out)
+    places = corpus.geodict_places(os.path.join(PROCESSORS_DIR, 'lib',
+                                   'geodict', 'geodict.db'))
+    results = {'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'platform': sys.platform, 'version': sys.version,
+               'threads': options.threads, 'scales': {}}
+    for scale in scales:
+        info = corpus.generate(os.path.join(options.out, 'corpus-'
+                               + str(scale) + '-' + str(options.seed)),
+                               scale, places, options.seed)
+        runs_dir = os.path.join(options.out, 'runs-' + str(scale))
+        results['scales'][str(scale)] = runs = {}
+        for name in names:
+            sys.stderr.write('running {:} on {:} documents\n'.format(name,
+                             scale))
+            runs[name] = run_benchmark(name, info, os.path.join(runs_dir,
+                    str(int(time.time()))), stoplist, options.threads)
+
+    results_filename = os.path.join(options.out, 'results-'
+                                    + time.strftime('%Y%m%d-%H%M%S') + '.json')
+    with codecs.open(results_filename, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=1, sort_keys=True)
+    print '\n'.join(report(results))
+    print 'results written to ' + results_filename
+
+    if options.compare is not None:
+        with codecs.open(os.path.join(baselines_dir, options.compare
+                         + '.json'), 'r', encoding='utf-8') as f:
+            print '\n'.join(compare(results, json.load(f)))
+    if options.save_baseline is not None:
+        if not os.path.exists(baselines_dir):
+            os.makedirs(baselines_dir)
+        with codecs.open(os.path.join(baselines_dir, options.save_baseline
+                         + '.json'), 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+        print 'saved as baseline ' + options.save_baseline
+
+
+if __name__ == '__main__':
+    main()
@@ -21,12 +21,24 @@ Zotero.PaperMachines = {
 	processors_dir: null,
 	java_exe: null,
 	jython_path: null,
+	server_process: null,
+	server_timer: null,
+	server_waiting: [],
+	server_poll_ms: 500,
+	server_start_timeout: 60000,
+	server_jobs: {},
 	processors: ["wordcloud", "ngrams", "phrasenet", "mallet", "geoparser", "dbpedia", "view-output", "export-output", "reset-output"], // "mallet_classify",
 	processNames: null, // see locale files
 	prompts: null,
 	paramLabels: null,
 	lang: null,
 	experimentalFeatures: ["mallet_dmr", "mallet_dmr_jstor", "mallet_classify", "mallet_lda_MI"],
+	// pure-Python processors, run by the CPython interpreter in the python_exe preference
+	// when one is set; everything else (MALLET, the geoparser's database, translation)
+	// needs Jython. A CPython run ignores the settings that only concern the JVM: it gets
+	// no -Xmx (so increasemem doesn't apply) and never goes through the processor server.
+	// See _pythonExecutable
+	cpythonProcessors: ["wordcloud", "wordcloud_multiple", "wordcloud_chronological", "wordcloud_large", "ngrams", "phrasenet"],
 	wordcloudFilters: [{"name": "none (raw frequency)", "label": " ", "value": "plain", "default": true},
 				{"name": "tf*idf", "label": " ", "value": "tfidf"},
 				{"name": "Dunning's log-likelihood", "label": " ", "value": "dunning"},
@@ -208,6 +220,18 @@ Zotero.PaperMachines = {
 				if (pathParts[0] == "search") {
 					var ids = Zotero.PaperMachines.search(queryString);
 					_uri = "data:application/json," + encodeURIComponent(JSON.stringify(ids));
+				} else if (pathParts[0] == "cancel" || pathParts[0] == "rerun") {
+					var processPath = pathParts.slice(1).join('/');
+					if (pathParts[0] == "cancel") {
+						Zotero.PaperMachines.cancelProcess(processPath);
+					} else {
+						Zotero.PaperMachines._runProcessPath(processPath);
+					}
+					var processResult = Zotero.PaperMachines._getProcessParams(processPath);
+					if (processResult) {
+						_uri = "data:text/html,";
+						_uri += encodeURIComponent(Zotero.PaperMachines._generateProgressPage(processResult));
+					}
 				} else {
 					var file1 = Zotero.PaperMachines.out_dir.clone();
 					if (pathParts.indexOf("support") != -1) {
@@ -256,6 +280,10 @@ Zotero.PaperMachines = {
 									_uri += encodeURIComponent(Zotero.PaperMachines._generateErrorPage(processResult));
 									Zotero.PaperMachines._runProcessPath(path);
 									break;
+								case "cancelled":
+									_uri = "data:text/html,";
+									_uri += encodeURIComponent(Zotero.PaperMachines._generateCancelledPage(processResult));
+									break;
 								default:
 									Zotero.PaperMachines.LOG(processResult);
 							}
@@ -436,6 +464,28 @@ Zotero.PaperMachines = {
 		}
 		return file;
 	},
+	_getOutputFiles: function (outfile) {
+		// data chunks and the shared metadata file written alongside an output
+		var files = {"chunks": [], "metadata": null};
+		var filesFile = this._getLocalFile(outfile.replace(".html", "-files.json"));
+		if (filesFile.exists()) {
+			try {
+				files = JSON.parse(Zotero.File.getContents(filesFile));
+			} catch (e) {
+				Zotero.PaperMachines.ERROR(e);
+			}
+			files.list = filesFile;
+		}
+		var dir = filesFile.parent;
+		var toFile = function (name) {
+			var file = dir.clone();
+			file.append(name);
+			return file;
+		};
+		files.chunks = files.chunks.map(toFile);
+		if (files.metadata) files.metadata = toFile(files.metadata);
+		return files;
+	},
 	_getOrCreateNode: function (node, parent, dir_or_file) {
 		try {
 			parent = parent || this.pm_dir;
@@ -486,6 +536,28 @@ Zotero.PaperMachines = {
 		var sql = "SELECT id FROM processed_collections WHERE process_path = ? AND status = 'running';";
 		return Zotero.PaperMachines.DB.query(sql, [processPath]);
 	},
+	/**
+	 * The sentinel file that asks a running processor to stop; processors look
+	 * for it once per document or iteration (see processors/lib/cancel.py).
+	 * @param {String} progressfile the run's progress.html path
+	 * @return {nsIFile}
+	*/
+	_cancelFile: function (progressfile) {
+		return Zotero.PaperMachines._getLocalFile(progressfile.replace("progress.html", ".cancel"));
+	},
+	/**
+	 * Asks a running process to stop. It ends as "cancelled", keeping what it
+	 * finished for the next run, and is not restarted automatically.
+	 * @param {String} processPath e.g. "mallet_lda/<collection id>/..."
+	*/
+	cancelProcess: function (processPath) {
+		var processResult = Zotero.PaperMachines._getProcessParams(processPath);
+		if (!processResult || processResult["status"] != "running") return;
+		var cancelFile = Zotero.PaperMachines._cancelFile(processResult["progressfile"]);
+		if (!cancelFile.exists()) {
+			Zotero.PaperMachines._getOrCreateFile(cancelFile.leafName, Zotero.PaperMachines.out_dir);
+		}
+	},
 	_runProcessPath: function (processPath) {
 		var processPathParts = processPath.split('/'),
 			processor = processPathParts[0],
@@ -515,6 +587,9 @@ Zotero.PaperMachines = {
 		var progressFile = Zotero.PaperMachines._getOrCreateFile(processor + thisID + "progress.html", Zotero.PaperMachines.out_dir);
 		var outFile = Zotero.PaperMachines.out_dir.clone();
 
+		var cancelFile = Zotero.PaperMachines._cancelFile(progressFile.path);
+		if (cancelFile.exists()) cancelFile.remove(false);
+
 		var args = [Zotero.PaperMachines.processors_dir.path, csv.path, Zotero.PaperMachines.out_dir.path, collectionName];
 		args = args.concat(additional_args);
 
@@ -535,31 +610,371 @@ Zotero.PaperMachines = {
 		Zotero.PaperMachines.DB.query(sql, [processPath, thisID, processor, "running", progressFile.path, outFile.path]);
 
 		var callback = function (finished) {
-			if (finished) {
-				var sql_update = "UPDATE processed_collections SET status = 'done' WHERE process_path = ?;";
-				Zotero.PaperMachines.DB.query(sql_update, [this.processPath]);
-			} else {
-				var sql_update = "UPDATE processed_collections SET status = 'failed' WHERE process_path = ?;";
-				Zotero.PaperMachines.DB.query(sql_update, [this.processPath]);
-			}
+			var status = finished ? "done" : "failed";
+			// a cancelled run exits normally (or, stopped inside MALLET, with status 130),
+			// so the last line of its structured progress says whether it stopped early
+			if (cancelFile.exists()) {
+				var stage = Zotero.PaperMachines._readProgressStage(progressFile.path.replace(".html", ".jsonl"));
+				if (stage && stage.state == "cancelled") status = "cancelled";
+				cancelFile.remove(false);
+			}
+			var sql_update = "UPDATE processed_collections SET status = ? WHERE process_path = ?;";
+			Zotero.PaperMachines.DB.query(sql_update, [status, processPath]);
 		};
 
+		// the heap estimate is made here, once, and handed to the processor after the
+		// args file (see processors/lib/memory.py); it picks -Xmx below too
+		var estimate = Zotero.PaperMachines._estimateHeap(processor, csv, additional_args || []);
+		var estimate_mb = estimate ? Math.ceil(estimate.bytes / 1048576) : null;
+		if (estimate_mb !== null) procArgs.push(String(estimate_mb));
+
+		// a CPython run is a process of its own, outside the server's job queue; the files it
+		// shares with other runs (token store, term matrices, metadata and stem caches,
+		// shared metadata) take the same file locks under either interpreter, so it may run
+		// alongside them. It still gets the heap estimate, which it checks against the
+		// memory available rather than -Xmx
+		var python_file = Zotero.PaperMachines._pythonExecutable(processor);
+		if (python_file) {
+			Zotero.PaperMachines.LOG(python_file.path + " " + procArgs.join(" "));
+			proc.init(python_file);
+			proc.runAsync(procArgs, procArgs.length, new Zotero.PaperMachines.processObserver(processor, processPath, callback));
+			return;
+		}
+
 		var observer = new Zotero.PaperMachines.processObserver(processor, processPath, callback);
+		var heap_mb = Zotero.PaperMachines._heapMegabytes(processor, estimate);
 
-		var java_exe_file = Zotero.PaperMachines._getLocalFile(Zotero.PaperMachines.java_exe);
+		var launch = function () {
+			var java_exe_file = Zotero.PaperMachines._getLocalFile(Zotero.PaperMachines.java_exe);
+
+			if (processor.indexOf("mallet") != -1) {
+				procArgs = ["-Djava.util.logging.config.file="+loggingProperties].concat(procArgs);
+			}
+			procArgs = ["-Xmx" + heap_mb + "m", "-Dfile.encoding=UTF8","-jar", Zotero.PaperMachines.jython_path].concat(procArgs);
 
+			Zotero.PaperMachines.LOG(java_exe_file.path + " " + procArgs.map(function(d) { return d.indexOf(" ") != -1 ? '"' + d + '"' : d; }).join(" "));
 
+			proc.init(java_exe_file);
+			proc.runAsync(procArgs, procArgs.length, observer);
+		};
+
+		// MALLET can only be cancelled by ending its process, which mustn't be the
+		// server other jobs share (see processors/lib/cancel.py); and the server's heap
+		// is fixed when it starts, so a run estimated to need more gets a JVM of its own
 		if (processor.indexOf("mallet") != -1) {
-			procArgs = ["-Djava.util.logging.config.file="+loggingProperties].concat(procArgs);
+			launch();
+			return;
+		}
+		if (heap_mb > Zotero.PaperMachines._serverHeapMegabytes()) {
+			Zotero.PaperMachines.LOG(processName + " needs " + heap_mb + " MB; running it outside the processor server");
+			launch();
+			return;
 		}
-		var mem_alloc = Preferences.get("extensions.papermachines.general.increasemem") ?
-			"-Xmx4g" : "-Xmx1g";
-		procArgs = [mem_alloc, "-Dfile.encoding=UTF8","-jar", this.jython_path].concat(procArgs);
 
-		Zotero.PaperMachines.LOG(java_exe_file.path + " " + procArgs.map(function(d) { return d.indexOf(" ") != -1 ? '"' + d + '"' : d; }).join(" "));
+		var job = {"processor": processor_file.path, "args": argFile.path, "heap_estimate_mb": estimate_mb};
+		Zotero.PaperMachines._submitToServer(job, processPath, observer, launch);
+	},
+	/**
+	 * The CPython interpreter to run a processor with, or false to run it under Jython
+	 * (the processor needs Java, or no interpreter is set in the python_exe preference).
+	 * Processors run this way ignore the increasemem and processor_server preferences
+	 * @param {String} processor processor name, e.g. "wordcloud"
+	 * @return {nsIFile|Boolean}
+	*/
+	_pythonExecutable: function (processor) {
+		if (Zotero.PaperMachines.cpythonProcessors.indexOf(processor) == -1) return false;
+		var python_exe = Preferences.get("extensions.papermachines.general.python_exe");
+		if (!python_exe || python_exe == "") return false;
+		var python_file = Zotero.PaperMachines._getLocalFile(python_exe);
+		if (!python_file.exists()) {
+			Zotero.PaperMachines.ERROR("Python executable " + python_exe + " not found; using Jython");
+			return false;
+		}
+		return python_file;
+	},
+	/**
+	 * Picks the heap (-Xmx, in MB) for a processor run: its estimated peak, at least
+	 * the processor server's heap (the default before estimates) and at most a share of
+	 * the machine's RAM; without an estimate, the processor server's heap.
+	 * @param {String} processor processor name, e.g. "mallet_lda"
+	 * @param {Object} estimate from _estimateHeap, or false
+	 * @return {Number}
+	*/
+	_heapMegabytes: function (processor, estimate) {
+		var fallback = Zotero.PaperMachines._serverHeapMegabytes();
+		if (!estimate) return fallback;
+		var mb = Math.ceil(estimate.bytes / 1048576);
+		mb = Math.max(mb, estimate.model["minimum_mb"], fallback);
+		var ram = Zotero.PaperMachines._physicalMemory();
+		if (ram) mb = Math.min(mb, Math.floor(ram / 1048576 * estimate.model["maximum_ram_fraction"]));
+		Zotero.PaperMachines.LOG("Estimated heap for " + processor + ": " + mb + " MB");
+		return mb;
+	},
+	/**
+	 * The processor server's heap in MB, set by the increasemem preference
+	 * @return {Number}
+	*/
+	_serverHeapMegabytes: function () {
+		return Preferences.get("extensions.papermachines.general.increasemem") ? 4096 : 1024;
+	},
+	/**
+	 * A processor run's peak heap, predicted from the corpus stats an earlier run on
+	 * the collection left with its manifest and the per-unit costs in
+	 * processors/heap.json: a base plus a cost for each document, token, word of
+	 * vocabulary and so on, or the peak measured last time, scaled to the number of
+	 * documents, if larger. This is the only estimate; processors are given it.
+	 * @param {String} processor processor name, e.g. "mallet_lda"
+	 * @param {nsIFile} csv the collection's metadata CSV
+	 * @param {Array} additional_args processor arguments, possibly with named args
+	 * @return {Object} {bytes, model}, or false without stats
+	*/
+	_estimateHeap: function (processor, csv, additional_args) {
+		try {
+			return Zotero.PaperMachines._estimateHeapFromStats(processor, csv, additional_args);
+		} catch (e) {
+			Zotero.PaperMachines.ERROR(e);
+			return false;
+		}
+	},
+	_estimateHeapFromStats: function (processor, csv, additional_args) {
+		var modelFile = Zotero.PaperMachines.processors_dir.clone();
+		modelFile.append("heap.json");
+		var statsFile = Zotero.PaperMachines.out_dir.clone();
+		statsFile.append("manifest");
+		statsFile.append(csv.leafName.replace(".csv", "") + ".stats.json");
+		if (!modelFile.exists() || !statsFile.exists()) return false;
+
+		var model = JSON.parse(Zotero.File.getContents(modelFile));
+		var stats = JSON.parse(Zotero.File.getContents(statsFile));
+		if (!("documents" in stats)) return false;
+
+		var named_args = {};
+		var json_at = additional_args.indexOf("json");
+		if (json_at != -1) named_args = JSON.parse(additional_args[json_at + 1]);
+
+		var n = parseInt(named_args["n"] || 1, 10),
+			topics = parseInt(named_args["topics"] || 0, 10),
+			documents = stats["documents"] || 0,
+			tokens = stats["tokens"] || 0,
+			vocabulary = stats["vocabulary"] || 0;
+		var features = {
+			"documents": documents,
+			"tokens": tokens,
+			"vocabulary": vocabulary,
+			"ngram_tokens": tokens * Math.max(n - 1, 0),
+			"topic_vocabulary": topics * vocabulary,
+			"topic_documents": topics * documents
+		};
+
+		// costs for the longest matching processor name prefix
+		var match = null;
+		for (var key in model["processors"]) {
+			if (processor.indexOf(key) == 0 && (match === null || key.length > match.length)) match = key;
+		}
+		var costs = model["processors"][match === null ? "default" : match];
+
+		var bytes = model["base_mb"] * 1048576;
+		for (var feature in costs) {
+			bytes += costs[feature] * (features[feature] || 0);
+		}
+		var observed = (stats["peak_heap"] || {})[processor];
+		if (observed && observed[1]) {
+			bytes = Math.max(bytes, observed[0] * documents / observed[1]);
+		}
+		return {"bytes": bytes * model["headroom"], "model": model};
+	},
+	_physicalMemory: function () {
+		try {
+			return Components.classes["@mozilla.org/system-info;1"]
+				.getService(Components.interfaces.nsIPropertyBag2)
+				.getProperty("memsize");
+		} catch (e) {
+			return false;
+		}
+	},
+	_serverPortFile: function () {
+		var port_file = Zotero.PaperMachines.processors_dir.clone();
+		port_file.append("server.port");
+		return port_file;
+	},
+	/**
+	 * Starts a long-lived Jython interpreter that runs processor jobs sent over a local
+	 * socket, so each analysis skips JVM start-up, module imports and jar loading
+	*/
+	startProcessorServer: function () {
+		if (!Preferences.get("extensions.papermachines.general.processor_server")) return;
+		if (Zotero.PaperMachines.server_process && Zotero.PaperMachines.server_process.isRunning) return;
+		if (!Zotero.PaperMachines.java_exe) return;
+
+		var server_file = Zotero.PaperMachines.processors_dir.clone();
+		server_file.append("server.py");
+		if (!server_file.exists()) return;
+
+		var port_file = Zotero.PaperMachines._serverPortFile();
+		if (port_file.exists()) port_file.remove(false);
 
-		proc.init(java_exe_file);
-		proc.runAsync(procArgs, procArgs.length, observer);
+		var procArgs = ["-Xmx" + Zotero.PaperMachines._serverHeapMegabytes() + "m", "-Dfile.encoding=UTF8", "-jar", this.jython_path,
+			server_file.path, port_file.path, Zotero.PaperMachines.log_dir.path];
+
+		try {
+			var proc = Components.classes["@mozilla.org/process/util;1"]
+				.createInstance(Components.interfaces.nsIProcess);
+			proc.init(Zotero.PaperMachines._getLocalFile(Zotero.PaperMachines.java_exe));
+			proc.runAsync(procArgs, procArgs.length, null);
+			Zotero.PaperMachines.server_process = proc;
+		} catch (e) {
+			Zotero.PaperMachines.ERROR(e);
+		}
+	},
+	/**
+	 * The processor server's port and the token it requires on every request, both
+	 * from the port file it writes (readable only by this user) once it listens
+	 * @return {Object} {port, token}, or false if no server has written one
+	*/
+	_getServerAddress: function () {
+		var port_file = Zotero.PaperMachines._serverPortFile();
+		if (!port_file.exists()) return false;
+		try {
+			var address = JSON.parse(Zotero.File.getContents(port_file));
+			if (typeof address.port != "number" || typeof address.token != "string") return false;
+			return address;
+		} catch (e) {
+			return false;
+		}
+	},
+	/**
+	 * Calls onReady with the processor server's address as soon as it listens,
+	 * starting the server if none is running, or with false if it doesn't come up
+	 * within server_start_timeout; callers arriving meanwhile wait for the same server
+	 * @param {Function} onReady called with {port, token} or false
+	*/
+	_whenServerReady: function (onReady) {
+		var address = Zotero.PaperMachines._getServerAddress();
+		if (address) {
+			onReady(address);
+			return;
+		}
+		Zotero.PaperMachines.server_waiting.push(onReady);
+		if (Zotero.PaperMachines.server_timer) return;
+
+		Zotero.PaperMachines.startProcessorServer();
+		var waited = 0;
+		var timer = Components.classes["@mozilla.org/timer;1"]
+			.createInstance(Components.interfaces.nsITimer);
+		Zotero.PaperMachines.server_timer = timer;
+		timer.initWithCallback({
+			notify: function () {
+				waited += Zotero.PaperMachines.server_poll_ms;
+				var address = Zotero.PaperMachines._getServerAddress();
+				var server = Zotero.PaperMachines.server_process;
+				if (!address && waited < Zotero.PaperMachines.server_start_timeout
+						&& server && server.isRunning) return;
+				timer.cancel();
+				Zotero.PaperMachines.server_timer = null;
+				if (!address) Zotero.PaperMachines.ERROR("Processor server did not start");
+				var waiting = Zotero.PaperMachines.server_waiting;
+				Zotero.PaperMachines.server_waiting = [];
+				waiting.forEach(function (f) { f(address); });
+			}
+		}, Zotero.PaperMachines.server_poll_ms, Components.interfaces.nsITimer.TYPE_REPEATING_SLACK);
+	},
+	/**
+	 * Runs a job on the processor server, waiting for the server to start if need be;
+	 * falls back to launching the processor itself if the server is switched off,
+	 * doesn't start, or refuses the job. While the server has other jobs to finish
+	 * first, server_jobs[processPath] says so (see _generateProgressPage).
+	 * @param {Object} job processor path and args file
+	 * @param {String} processPath
+	 * @param {processObserver} observer told the job's exit status
+	 * @param {Function} fallback launches the processor in a JVM of its own
+	*/
+	_submitToServer: function (job, processPath, observer, fallback) {
+		if (!Preferences.get("extensions.papermachines.general.processor_server")) {
+			fallback();
+			return;
+		}
+		Zotero.PaperMachines._whenServerReady(function (address) {
+			if (!address) {
+				fallback();
+				return;
+			}
+			Zotero.PaperMachines.LOG("Sending " + job["processor"] + " to processor server");
+			Zotero.PaperMachines._sendToServer(address, job, processPath, observer, fallback);
+		});
+	},
+	_sendToServer: function (address, job, processPath, observer, fallback) {
+		try {
+			var transport = Components.classes["@mozilla.org/network/socket-transport-service;1"]
+				.getService(Components.interfaces.nsISocketTransportService)
+				.createTransport(null, 0, "127.0.0.1", address.port, null);
+			var outstream = transport.openOutputStream(Components.interfaces.nsITransport.OPEN_BLOCKING, 0, 0);
+			var converter = Components.classes["@mozilla.org/intl/converter-output-stream;1"]
+				.createInstance(Components.interfaces.nsIConverterOutputStream);
+			converter.init(outstream, "UTF-8", 0, 0);
+			job["token"] = address.token;
+			converter.writeString(JSON.stringify(job) + "\n");
+			converter.flush();
+
+			var instream = transport.openInputStream(0, 0, 0);
+			var scriptable = Components.classes["@mozilla.org/scriptableinputstream;1"]
+				.createInstance(Components.interfaces.nsIScriptableInputStream);
+			scriptable.init(instream);
+			var pump = Components.classes["@mozilla.org/network/input-stream-pump;1"]
+				.createInstance(Components.interfaces.nsIInputStreamPump);
+			pump.init(instream, -1, -1, 0, 0, false);
+		} catch (e) {
+			Zotero.PaperMachines.ERROR(e);
+			Zotero.PaperMachines._forgetServer();
+			fallback();
+			return;
+		}
+
+		// one JSON line per state: "queued" (with the number of jobs ahead) and
+		// "running" while it lasts, then "done" or "failed" with the exit status
+		var response = "";
+		var result = null;
+		var answered = false;
+		pump.asyncRead({
+			onStartRequest: function (request, context) {},
+			onDataAvailable: function (request, context, stream, offset, count) {
+				response += scriptable.read(count);
+				var lines = response.split("\n");
+				response = lines.pop();
+				lines.forEach(function (line) {
+					try {
+						var reply = JSON.parse(line);
+					} catch (e) {
+						return;
+					}
+					answered = true;
+					if (reply["status"] == "queued" || reply["status"] == "running") {
+						Zotero.PaperMachines.server_jobs[processPath] = reply;
+					} else {
+						result = reply;
+					}
+				});
+			},
+			onStopRequest: function (request, context, status) {
+				scriptable.close();
+				converter.close();
+				delete Zotero.PaperMachines.server_jobs[processPath];
+				if (!answered || (result && result["error"])) {
+					// a stale port file, or a server that turned the job away
+					Zotero.PaperMachines.ERROR("Processor server did not take the job" + (result ? ": " + result["error"] : ""));
+					if (!answered) Zotero.PaperMachines._forgetServer();
+					fallback();
+				} else if (result) {
+					observer.exited(result["exit"]);
+				} else {
+					Zotero.PaperMachines.ERROR("Processor server closed the connection without a result");
+					observer.exited(1);
+				}
+			}
+		}, null);
+	},
+	_forgetServer: function () {
+		var port_file = Zotero.PaperMachines._serverPortFile();
+		if (port_file.exists()) port_file.remove(false);
 	},
 	replaceTagsBoxWithWordCloud: function (uri) {
 		var ZoteroPane = Zotero.PaperMachines.getZoteroPane();
@@ -1183,6 +1598,8 @@ Zotero.PaperMachines = {
 
 		var new_aux = Zotero.PaperMachines._getOrCreateDir("support", Zotero.PaperMachines.out_dir);
 		Zotero.PaperMachines._copyAllFiles(Zotero.PaperMachines.aux_dir, new_aux);
+
+		Zotero.PaperMachines.startProcessorServer();
 	},
 	_copyOrMoveAllFiles: function (copy_or_move, source, target, recursive) {
 		var files = source.directoryEntries;
@@ -1228,6 +1645,7 @@ Zotero.PaperMachines = {
 			}
 		} catch (e) { Zotero.PaperMachines.ERROR(e); }
 
+		var stage = Zotero.PaperMachines._readProgressStage(processResult["progressfile"].replace(".html",".jsonl"));
 
 		var collectionName = Zotero.PaperMachines.getGroupName(thisGroup);
 		var progbar_str = '<html><head><meta charset="UTF-8"/><meta http-equiv="refresh" content="5;URL=' + 
@@ -1237,16 +1655,68 @@ Zotero.PaperMachines = {
 			} catch (e) {
 				progbar_str += '<div>' + collectionName + '</div>';
 			}
-			if (typeof iterations === "number") {
+			var serverJob = Zotero.PaperMachines.server_jobs[processResult["process_path"]];
+			if (serverJob && serverJob["status"] == "queued") {
+				progbar_str += '<div>' + Zotero.PaperMachines.processNames["queued"].replace("%n", serverJob["ahead"]) + '</div>';
+			}
+			if (stage) {
+				progbar_str += '<div>' + Zotero.PaperMachines._describeProgressStage(stage) + '</div>';
+				if (typeof stage.total === "number" && stage.total > 0) {
+					progbar_str += '<progress id="progressBar" max="' + stage.total.toString() + '" value="';
+					progbar_str += Math.min(stage.done, stage.total).toString();
+					progbar_str += '"/>';
+				} else {
+					progbar_str += '<progress id="progressBar"/>';
+				}
+			} else if (typeof iterations === "number") {
 				progbar_str += '<progress id="progressBar" max="1000" value="';
 				progbar_str += iterations.toString();
 				progbar_str += '"/>';
 			} else {
 				progbar_str += '<progress id="progressBar"/>';
 			}
+			if (Zotero.PaperMachines._cancelFile(processResult["progressfile"]).exists()) {
+				progbar_str += '<div>' + Zotero.PaperMachines.processNames["cancelling"] + '</div>';
+			} else {
+				progbar_str += '<div><a href="zotero://papermachines/cancel/' + processResult["process_path"] + '">';
+				progbar_str += Zotero.PaperMachines.processNames["cancel"] + '</a></div>';
+			}
 			progbar_str += '</body></html>';
 		return progbar_str;
 	},
+	/**
+	 * The latest line of a processor's structured progress (progress.jsonl, written
+	 * by processors/lib/progress.py): stage, unit, done, total, rate and eta.
+	 * @param {String} path the .jsonl file
+	 * @return {Object} the stage, or false if there is none yet
+	*/
+	_readProgressStage: function (path) {
+		try {
+			var progressFile = Zotero.PaperMachines._getLocalFile(path);
+			if (!progressFile.exists()) return false;
+			var lines = Zotero.File.getContents(progressFile).split("\n").filter(function (line) {
+				return line.length > 0;
+			});
+			if (lines.length == 0) return false;
+			return JSON.parse(lines[lines.length - 1]);
+		} catch (e) {
+			Zotero.PaperMachines.ERROR(e);
+			return false;
+		}
+	},
+	_describeProgressStage: function (stage) {
+		var str = stage.stage + ": " + stage.done.toString();
+		if (typeof stage.total === "number") str += " / " + stage.total.toString();
+		str += " " + stage.unit;
+		if (typeof stage.rate === "number") str += " (" + stage.rate.toFixed(1) + "/s)";
+		if (typeof stage.eta === "number" && stage.state == "running") {
+			var seconds = Math.round(stage.eta);
+			var minutes = Math.floor(seconds / 60);
+			seconds = seconds % 60;
+			str += ", " + minutes.toString() + ":" + (seconds < 10 ? "0" : "") + seconds.toString() + " left";
+		}
+		return str;
+	},
 	_generateErrorPage: function (processResult) {
 		var thisGroup = Zotero.PaperMachines.getGroupByID(processResult["collection"]);
 
@@ -1274,6 +1744,21 @@ Zotero.PaperMachines = {
 			logpage_str += '</body></html>';
 		return logpage_str;
 	},
+	_generateCancelledPage: function (processResult) {
+		var thisGroup = Zotero.PaperMachines.getGroupByID(processResult["collection"]);
+		var collectionName = Zotero.PaperMachines.getGroupName(thisGroup);
+		var page_str = '<html><head><meta charset="UTF-8"/></head><body>';
+			try {
+				page_str += '<div>' + Zotero.PaperMachines.processNames[processResult["processor"]] + ': ' + collectionName + '</div>';
+			} catch (e) {
+				page_str += '<div>' + collectionName + '</div>';
+			}
+			page_str += "<div>" + Zotero.PaperMachines.processNames["cancelled"] + "</div>";
+			page_str += '<div><a href="zotero://papermachines/rerun/' + processResult["process_path"] + '">';
+			page_str += Zotero.PaperMachines.processNames["rerun"] + '</a></div>';
+			page_str += '</body></html>';
+		return page_str;
+	},
 	getThisGroupID: function () {
 		var ZoteroPane = Zotero.PaperMachines.getZoteroPane();
 		return Zotero.PaperMachines.getItemGroupID(ZoteroPane.getItemGroup());
@@ -1356,6 +1841,14 @@ Zotero.PaperMachines = {
 					file.copyTo(new_dir, file.leafName);
 					var file2 = Zotero.PaperMachines._getLocalFile(export_processes[i].replace('.html', '.js'));
 					if (file2.exists()) file2.copyTo(new_dir, file2.leafName);
+					var extra = Zotero.PaperMachines._getOutputFiles(export_processes[i]);
+					if (extra.metadata) extra.chunks.push(extra.metadata);
+					for (var j in extra.chunks) {
+						var file3 = extra.chunks[j];
+						var target = new_dir.clone();
+						target.append(file3.leafName);
+						if (file3.exists() && !target.exists()) file3.copyTo(new_dir, file3.leafName);
+					}
 				}
 			}
 		}
@@ -1374,6 +1867,12 @@ Zotero.PaperMachines = {
 				if (file.exists()) file.remove(false);
 				var file2 = Zotero.PaperMachines._getLocalFile(reset_processes[i].replace('.html', '.js'));
 				if (file2.exists()) file2.remove(false);
+				// the shared metadata file stays; other outputs load it too
+				var extra = Zotero.PaperMachines._getOutputFiles(reset_processes[i]);
+				for (var j in extra.chunks) {
+					if (extra.chunks[j].exists()) extra.chunks[j].remove(false);
+				}
+				if (extra.list) extra.list.remove(false);
 
 				Zotero.PaperMachines.DB.query("DELETE FROM processed_collections WHERE collection=? AND outfile=?;", [thisID, reset_processes[i]]);
 			}
@@ -1962,18 +2461,24 @@ Zotero.PaperMachines.processObserver.prototype = {
 		case "process-finished":
 			var exitValue = subject.QueryInterface(Components.interfaces.nsIProcess).exitValue; 
 			if (typeof exitValue == "number") {
-				if (exitValue == 0) { //success
-					Zotero.PaperMachines.LOG("Process " + this.processName + " finished successfully.");
-					this.callback(true);				
-				} else {
-					Zotero.PaperMachines.ERROR("Process " + this.processName + " failed with exit value " + exitValue);
-					this.callback(false);
-				}
+				this.exited(exitValue);
+				return;
 			} 
 			break;
 	}
 	this.unregister();
   },
+  // also called for jobs run by the processor server, with the status it reports
+  exited: function(exitValue) {
+	if (exitValue == 0) { //success
+		Zotero.PaperMachines.LOG("Process " + this.processName + " finished successfully.");
+		this.callback(true);				
+	} else {
+		Zotero.PaperMachines.ERROR("Process " + this.processName + " failed with exit value " + exitValue);
+		this.callback(false);
+	}
+	this.unregister();
+  },
   register: function() {
 	var observerService = Components.classes["@mozilla.org/observer-service;1"]
 						  .getService(Components.interfaces.nsIObserverService);
@@ -9,7 +9,10 @@ import urllib
 import urllib2
 import codecs
 import traceback
+import time
 import textprocessor
+from lib.services import service_url
+from lib.atomicfile import atomic_write
 
 class DBpedia(textprocessor.TextProcessor):
 
@@ -17,6 +20,8 @@ class DBpedia(textprocessor.TextProcessor):
     annotates texts using DBpedia Spotlight
     """
 
+    cache_results = True
+
     dbpedia_url = 'http://spotlight.dbpedia.org/rest/annotate'
     dbpedia_headers = {'Accept': 'application/json',
                        'content-type': 'application/x-www-form-urlencoded'}
@@ -37,8 +42,8 @@ class DBpedia(textprocessor.TextProcessor):
         values = {'text': text[0:10000].encode('utf-8'),
                   'confidence': confidence, 'support': support}
         data = urllib.urlencode(values)
-        req = urllib2.Request(self.dbpedia_url, data,
-                              self.dbpedia_headers)
+        req = urllib2.Request(service_url('spotlight', self.dbpedia_url),
+                              data, self.dbpedia_headers)
         response = urllib2.urlopen(req)
         annotation = response.read()
         encoding = req.headers.get('content-type', 'charset=utf8'
@@ -52,28 +57,45 @@ class DBpedia(textprocessor.TextProcessor):
         logging.info('beginning annotation')
 
         annotated = {}
+        failed = 0
+        annotate_start = time.time()
         if not self.dry_run:
+            manifest = self.get_manifest()
             for filename in self.files:
                 logging.info('processing ' + filename)
                 self.update_progress()
                 try:
                     annotated_filename = filename.replace('.txt',
                             '_dbpedia.json')
-                    if os.path.exists(annotated_filename):
+                    if self.derived_current(filename, 'dbpedia',
+                            annotated_filename):
                         annotated[annotated_filename] = filename
+                        self.metrics.count('annotation hits')
                     else:
+                        self.metrics.count('annotation misses')
+                        document_start = time.time()
                         with codecs.open(filename, 'r', encoding='utf-8'
                                 ) as f:
                             annotation = self._get_annotated(f.read())
                             if len(annotation) > 0:
                                 annotated[annotated_filename] = filename
-                                with codecs.open(annotated_filename, 'w'
-                                        , encoding='utf-8') as out:
+                                with atomic_write(annotated_filename) as \
+                                    out:
                                     out.write(annotation)
+                                manifest.record(filename, 'dbpedia')
+                            else:
+                                failed += 1
+                        self.metrics.document('annotate', filename,
+                                time.time() - document_start,
+                                os.path.getsize(filename),
+                                len(annotation.encode('utf-8')))
                 except (KeyboardInterrupt, SystemExit):
                     raise
                 except:
+                    failed += 1
                     logging.error(traceback.format_exc())
+            manifest.save()
+            self.metrics.log_documents('annotate')
         else:
             for filename in self.files:
                 annotated_filename = filename.replace('.txt',
@@ -81,6 +103,8 @@ class DBpedia(textprocessor.TextProcessor):
                 if os.path.exists(annotated_filename):
                     annotated[annotated_filename] = filename
 
+        self.metrics.add_time('annotate', time.time() - annotate_start)
+
         uris_to_docs = {}
         for (json_annotation, filename) in annotated.iteritems():
             itemID = self.metadata[filename]['itemID']
@@ -108,12 +132,20 @@ class DBpedia(textprocessor.TextProcessor):
         params = {'URIS_TO_DOCS': filtered_uris}
         self.write_html(params)
 
+        # a page missing some documents' annotations must not be served
+        # from the result cache once Spotlight answers again
+
+        if failed > 0:
+            logging.info(str(failed)
+                         + ' documents could not be annotated -- not caching the result')
+            self.written_files = None
+
         logging.info('finished')
 
 
 if __name__ == '__main__':
     try:
         processor = DBpedia(track_progress=True)
-        processor.process()
+        processor.run()
     except:
         logging.error(traceback.format_exc())
@@ -8,7 +8,11 @@ import traceback
 import codecs
 import subprocess
 import sys
+import time
 from lib.classpath import classPathHacker
+from lib.manifest import Manifest, manifest_filename
+from lib.tokenstore import file_signature
+from lib.atomicfile import atomic_write
 from HTMLParser import HTMLParser
 import textprocessor
 
@@ -77,6 +81,12 @@ class Extract(textprocessor.TextProcessor):
                 itemIDs[itemid] = []
             itemIDs[itemid].append(filename)
 
+        # the manifest covers the extracted texts, not the attachments, so
+        # it is opened here without hashing self.files; each text records
+        # the mtime/size of the attachments it was extracted from
+
+        self.manifest = Manifest(manifest_filename(self.out_dir,
+                                 self.collection))
         saved = []
         for (itemID, filenames) in itemIDs.iteritems():
             try:
@@ -84,8 +94,12 @@ class Extract(textprocessor.TextProcessor):
                 out_dir = os.path.dirname(out_file)
                 if not os.path.exists(out_dir):
                     os.makedirs(out_dir)
+                sources = [[x] + file_signature(x) for x in filenames
+                           if os.path.exists(x)]
                 text = u''
-                if not os.path.exists(out_file) or self.force_update:
+                if self.force_update or not self.derived_current(out_file,
+                        'sources', out_file, sources):
+                    extract_start = time.time()
                     for filename in filenames:
                         fname = filename.lower()
                         if fname.endswith('.txt'):
@@ -121,9 +135,19 @@ class Extract(textprocessor.TextProcessor):
                                 import_proc.communicate()[0].decode('utf-8'
                                     )
                     logging.info('processed ' + out_file)
-                    with codecs.open(out_file, 'w', encoding='utf-8'
-                            ) as f:
+                    with atomic_write(out_file) as f:
                         f.write(text)
+                    self.manifest.record(out_file, 'sources', sources)
+                    self.metrics.add_time('extract', time.time()
+                            - extract_start)
+                    self.metrics.document('extract', u', '.join(filenames),
+                            time.time() - extract_start, sum(x[2] for x in
+                            sources), os.path.getsize(out_file))
+                    self.metrics.count('texts extracted')
+                    self.metrics.count('bytes read', sum(x[2] for x in
+                                       sources))
+                else:
+                    self.metrics.count('extraction hits')
                 saved.append(
                     {'itemID': itemID,
                      'collection': self.metadata[filename]['collection'], 
@@ -131,13 +155,29 @@ class Extract(textprocessor.TextProcessor):
                     }
                 )
                 self.update_progress()
+            except (KeyboardInterrupt, SystemExit):
+                raise
             except:
                 logging.error(traceback.format_exc())
         if self.progress_initialized:
             self.progress_file.write('<1000>\n')
+        self.metrics.log_documents('extract')
+
+        # tokenize the new texts once, for every processor that follows
+
+        try:
+            self.files = [x['filename'] for x in saved]
+            self.manifest.refresh(self.files, imap=self.imap)
+            self.manifest.save()
+            self.get_token_store()
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except:
+            logging.error(traceback.format_exc())
+
         json_out = os.path.join(self.out_dir, self.name
                                 + self.collection + '.json')
-        with codecs.open(json_out, 'wb', encoding='utf-8') as f:
+        with atomic_write(json_out, 'wb') as f:
             json.dump(saved, f)
         params = {'SUCCEEDED': str(len(saved)),
                   'TOTAL': str(len(itemIDs.keys()))}
@@ -147,6 +187,6 @@ class Extract(textprocessor.TextProcessor):
 if __name__ == '__main__':
     try:
         processor = Extract(track_progress=True)
-        processor.process()
+        processor.run()
     except:
         logging.error(traceback.format_exc())
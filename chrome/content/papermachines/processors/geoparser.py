@@ -11,9 +11,60 @@ import urllib
 import urllib2
 from collections import defaultdict
 from lib.classpath import classPathHacker
+from lib.services import service_url
+from lib.atomicfile import atomic_write
+from lib.textfile import TextFile
 
 import textprocessor
 
+# gazetteer parsers by database path; building one loads the country and
+# region tables, so an interpreter that runs several jobs keeps them warm
+
+_parsers = {}
+
+
+def get_parser(database_path):
+    from lib.geodict.geodict_lib import GeodictParser
+    if database_path not in _parsers:
+        _parsers[database_path] = GeodictParser(database_path)
+    return _parsers[database_path]
+
+
+def find_places(string, find_func):
+    """(place, [start, end]) for each location geodict finds in string"""
+
+    try:
+        geodict_locations = find_func(string)
+        for location in geodict_locations:
+            found_tokens = location['found_tokens']
+            start_index = found_tokens[0]['start_index']
+            end_index = found_tokens[len(found_tokens)
+                    - 1]['end_index']
+            name = string[start_index:end_index + 1]
+            geonameid = found_tokens[0].get('geonameid', None)
+            entityURI = None
+            if geonameid is not None:
+                entityURI = 'http://sws.geonames.org/' \
+                    + str(geonameid)
+            geotype = found_tokens[0]['type'].lower()
+            lat = found_tokens[0]['lat']
+            lon = found_tokens[0]['lon']
+
+            if entityURI is None:
+                continue
+
+            place = {
+                'name': name,
+                'entityURI': entityURI,
+                'latitude': lat,
+                'longitude': lon,
+                'type': geotype,
+                }
+            reference = [start_index, end_index]
+            yield (place, reference)
+    except:
+        logging.error(traceback.format_exc())
+
 
 class Geoparser(textprocessor.TextProcessor):
 
@@ -21,6 +72,8 @@ class Geoparser(textprocessor.TextProcessor):
     Geoparsing using Pete Warden's geodict
     """
 
+    geonames_url = 'http://ws.geonames.org/searchJSON'
+
     def get_containing_paragraph(self, text, match):
         start = match[0]
         end = match[1]
@@ -44,8 +97,7 @@ class Geoparser(textprocessor.TextProcessor):
 
     def contexts_from_geoparse_obj(self, geoparse_obj, filename):
         contexts_obj = defaultdict(list)
-        with codecs.open(filename, 'rU', encoding='utf-8') as f:
-            text = f.read()
+        text = TextFile(filename)
 
         refs = geoparse_obj.get('references', {})
         for (entityURI, matchlist) in refs.iteritems():
@@ -56,42 +108,12 @@ class Geoparser(textprocessor.TextProcessor):
 
         contexts_json = filename.replace('.txt', '_contexts.json')
         contexts_obj = dict(contexts_obj)
-        with file(contexts_json, 'w') as f:
+        with atomic_write(contexts_json, encoding=None) as f:
             json.dump(contexts_obj, f)
         return contexts_obj
 
     def get_places(self, string, find_func):
-        try:
-            geodict_locations = find_func(string)
-            for location in geodict_locations:
-                found_tokens = location['found_tokens']
-                start_index = found_tokens[0]['start_index']
-                end_index = found_tokens[len(found_tokens)
-                        - 1]['end_index']
-                name = string[start_index:end_index + 1]
-                geonameid = found_tokens[0].get('geonameid', None)
-                entityURI = None
-                if geonameid is not None:
-                    entityURI = 'http://sws.geonames.org/' \
-                        + str(geonameid)
-                geotype = found_tokens[0]['type'].lower()
-                lat = found_tokens[0]['lat']
-                lon = found_tokens[0]['lon']
-
-                if entityURI is None:
-                    continue
-
-                place = {
-                    'name': name,
-                    'entityURI': entityURI,
-                    'latitude': lat,
-                    'longitude': lon,
-                    'type': geotype,
-                    }
-                reference = [start_index, end_index]
-                yield (place, reference)
-        except:
-            logging.error(traceback.format_exc())
+        return find_places(string, find_func)
 
     def run_geoparser(self):
         import __builtin__
@@ -105,8 +127,6 @@ class Geoparser(textprocessor.TextProcessor):
         self.database_path = os.path.join(self.cwd, 'lib', 'geodict',
                 'geodict.db')
 
-        from lib.geodict.geodict_lib import GeodictParser
-
         geo_parsed = {}
         places_by_entityURI = {}
 
@@ -117,12 +137,33 @@ class Geoparser(textprocessor.TextProcessor):
         else:
             self.cache = {}
 
+        manifest = self.get_manifest()
+        geoparse_start = time.time()
         for filename in self.files:
             logging.info('processing ' + filename)
             self.update_progress()
+            document_start = time.time()
 
             file_geoparsed = filename.replace('.txt', '_geoparse.json')
             contexts_json = filename.replace('.txt', '_contexts.json')
+            json_filename = filename.replace('.txt', '_geodict.json')
+
+            # results depend on the text and the item's place, so a change
+            # to either (per the manifest) means geoparsing it again
+
+            place_str = self.metadata[filename]['place']
+            stale = []
+            if not self.derived_current(filename, 'geoparse',
+                    file_geoparsed, place_str):
+                stale += [file_geoparsed, contexts_json]
+            if not self.derived_current(filename, 'geodict',
+                    json_filename, place_str):
+                stale.append(json_filename)
+            for stale_filename in stale:
+                if os.path.exists(stale_filename):
+                    os.remove(stale_filename)
+            self.metrics.count(('geoparse hits' if file_geoparsed
+                               not in stale else 'geoparse misses'))
 
             if os.path.exists(file_geoparsed):
                 try:
@@ -152,18 +193,15 @@ class Geoparser(textprocessor.TextProcessor):
                     city = None
                     places = set()
 
-                    json_filename = filename.replace('.txt',
-                            '_geodict.json')
-
                     if not os.path.exists(json_filename):
-                        parser = GeodictParser(self.database_path)
+                        parser = get_parser(self.database_path)
                         places_found = \
                             list(self.get_places(str_to_parse,
                                  parser.find_locations_in_text))
 
-                        with codecs.open(json_filename, 'w',
-                                encoding='utf8') as json_file:
+                        with atomic_write(json_filename) as json_file:
                             json.dump(places_found, json_file)
+                        manifest.record(filename, 'geodict', place_str)
                     else:
                         with codecs.open(json_filename, 'r',
                                 encoding='utf8') as json_file:
@@ -207,8 +245,8 @@ class Geoparser(textprocessor.TextProcessor):
                                     city = result['entityURI']
                             else:
                                 search_for = {'q': query_str}
-                                query_url = 'http://ws.geonames.org/' \
-                                    + 'searchJSON?%s' \
+                                query_url = service_url('geonames',
+                                        self.geonames_url) + '?%s' \
                                     % urllib.urlencode(search_for)
                                 result_obj = \
                                     json.load(urllib2.urlopen(query_url))
@@ -228,8 +266,8 @@ class Geoparser(textprocessor.TextProcessor):
                                     city = uri
                                 else:
                                     self.cache[query_str] = None
-                                with file(self.cache_filename, 'w') as \
-                                    cache_f:
+                                with atomic_write(self.cache_filename,
+                                        encoding=None) as cache_f:
                                     json.dump(self.cache, cache_f)
                         except:
                             logging.error('No city found for %s'
@@ -238,11 +276,17 @@ class Geoparser(textprocessor.TextProcessor):
 
                     geoparse_obj['places'] = list(places)
                     geoparse_obj['city'] = city
-                    with file(file_geoparsed, 'w') as f:
+                    with atomic_write(file_geoparsed, encoding=None) as f:
                         json.dump(geoparse_obj, f)
+                    manifest.record(filename, 'geoparse', place_str)
                     if not os.path.exists(contexts_json):
                         self.contexts_from_geoparse_obj(geoparse_obj,
                                 filename)
+                    self.metrics.document('geoparse', filename,
+                            time.time() - document_start,
+                            os.path.getsize(filename), sum(os.path.getsize(x)
+                            for x in (file_geoparsed, contexts_json,
+                            json_filename) if os.path.exists(x)))
                     time.sleep(0.2)
                 except (KeyboardInterrupt, SystemExit):
                     raise
@@ -254,6 +298,9 @@ class Geoparser(textprocessor.TextProcessor):
             place_dict = geoparse_obj.get('places_by_entityURI', {})
             for (entityURI, data) in place_dict.iteritems():
                 places_by_entityURI[entityURI] = data
+        manifest.save()
+        self.metrics.add_time('geoparse', time.time() - geoparse_start)
+        self.metrics.log_documents('geoparse')
 
         places = {}
         for (filename, entityURIs) in geo_parsed.iteritems():
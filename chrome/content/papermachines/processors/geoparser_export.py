@@ -8,6 +8,7 @@ import re
 import logging
 import traceback
 import codecs
+from lib.textfile import TextFile
 import geoparser
 
 
@@ -60,8 +61,7 @@ class GeoparserExport(geoparser.Geoparser):
                     title = os.path.basename(filename)
                     itemID = self.metadata[filename]['itemID']
                     year = self.metadata[filename]['year']
-                    text = codecs.open(filename, 'rU', encoding='utf-8'
-                            , errors='replace').read()
+                    text = TextFile(filename, errors='replace')
                     maximum_length = len(text)
                     refs = geoparse_obj['references']
 
@@ -100,6 +100,6 @@ class GeoparserExport(geoparser.Geoparser):
 if __name__ == '__main__':
     try:
         processor = GeoparserExport(track_progress=True)
-        processor.process()
+        processor.run()
     except:
         logging.error(traceback.format_exc())
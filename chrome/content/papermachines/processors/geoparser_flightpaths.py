@@ -161,6 +161,6 @@ class GeoparserFlightPaths(geoparser.Geoparser):
 if __name__ == '__main__':
     try:
         processor = GeoparserFlightPaths(track_progress=True)
-        processor.process()
+        processor.run()
     except:
         logging.error(traceback.format_exc())
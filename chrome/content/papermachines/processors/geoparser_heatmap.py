@@ -62,6 +62,6 @@ class GeoparserHeatmap(geoparser.Geoparser):
 if __name__ == '__main__':
     try:
         processor = GeoparserHeatmap(track_progress=True)
-        processor.process()
+        processor.run()
     except:
         logging.error(traceback.format_exc())
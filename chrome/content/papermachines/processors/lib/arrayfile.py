@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import array
+import threading
+
+try:
+    import mmap
+except ImportError:  # not available under Jython
+    mmap = None
+
+TYPECODE = 'i'
+
+
+class ArrayFile:
+
+    """
+    Flat file of fixed-size integers, read by slice without loading it all;
+    reads may come from several threads at once
+
+    Reads go through a memory map where the platform has one and fall back
+    to seek/fromfile; values appended after the file was mapped are read
+    from the file.
+    """
+
+    def __init__(self, filename, typecode=TYPECODE):
+        self.filename = filename
+        self.typecode = typecode
+        self.itemsize = array.array(typecode).itemsize
+        self._read_file = None
+        self._write_file = None
+        self._mmap = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        self.flush()
+        if not os.path.exists(self.filename):
+            return 0
+        return os.path.getsize(self.filename) // self.itemsize
+
+    def _open(self):
+        if self._read_file is None:
+            self._read_file = open(self.filename, 'rb')
+            if mmap is not None and os.path.getsize(self.filename) > 0:
+                self._mmap = mmap.mmap(self._read_file.fileno(), 0,
+                                       access=mmap.ACCESS_READ)
+
+    def read(self, start, length):
+        values = array.array(self.typecode)
+        if length <= 0:
+            return values
+        begin = start * self.itemsize
+        end = begin + length * self.itemsize
+        with self._lock:
+            self.flush()
+            self._open()
+            if self._mmap is not None and end <= len(self._mmap):
+                values.fromstring(self._mmap[begin:end])
+            else:
+                self._read_file.seek(begin)
+                values.fromfile(self._read_file, length)
+        return values
+
+    def read_all(self):
+        values = array.array(self.typecode)
+        if os.path.exists(self.filename):
+            self.flush()
+            with open(self.filename, 'rb') as f:
+                values.fromfile(f, len(self))
+        return values
+
+    def append(self, values):
+        if self._write_file is None:
+            self._write_file = open(self.filename, 'ab')
+        values.tofile(self._write_file)
+
+    def truncate(self, length):
+        """Drop values past length, e.g. left over from an interrupted run"""
+
+        if len(self) > length:
+            self.close()
+            with open(self.filename, 'r+b') as f:
+                f.truncate(length * self.itemsize)
+
+    def flush(self):
+        if self._write_file is not None:
+            self._write_file.flush()
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._read_file is not None:
+            self._read_file.close()
+            self._read_file = None
+        if self._write_file is not None:
+            self._write_file.close()
+            self._write_file = None
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import errno
+import codecs
+import logging
+import tempfile
+from contextlib import contextmanager
+
+# Artifacts are written to a temporary file beside them and renamed into
+# place once complete, so a run that is cancelled, killed or fails halfway
+# never leaves a truncated file that a later run (or the browser) would
+# take for a finished one. Temporary names are unique, so runs writing the
+# same file at once (two analyses of one collection, say) don't write
+# into each other's; files that are read, changed and written back take a
+# FileLock as well.
+
+# a lock whose holder hasn't refreshed it for this long was left by a run
+# that was killed
+
+LOCK_STALE = 300
+
+LOCK_POLL = 0.1
+
+
+def temp_filename(filename):
+    """
+    A new, empty file in filename's directory, named after it, that no
+    other writer of filename will be given
+    """
+
+    (fd, tmp_filename) = tempfile.mkstemp(dir=os.path.dirname(filename)
+            or '.', prefix=os.path.basename(filename) + '.', suffix='.tmp')
+    os.close(fd)
+    return tmp_filename
+
+
+def replace(source, target):
+    """Rename source to target, replacing it (os.rename won't on Windows)"""
+
+    if os.path.exists(target):
+        os.remove(target)
+    os.rename(source, target)
+
+
+@contextmanager
+def atomic_write(filename, mode='w', encoding='utf-8'):
+    """
+    A file to write filename through, put in place when the block
+    finishes; if it raises, filename is left as it was
+    """
+
+    tmp_filename = temp_filename(filename)
+    if encoding is None:
+        f = open(tmp_filename, mode)
+    else:
+        f = codecs.open(tmp_filename, mode, encoding=encoding)
+    try:
+        yield f
+    except:
+        f.close()
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        raise
+    f.close()
+    replace(tmp_filename, filename)
+
+
+class FileLock:
+
+    """
+    <filename>.lock, held by one run at a time. The holder calls refresh()
+    as it works, so that runs waiting for it can tell a lock in use from
+    one left behind.
+    """
+
+    def __init__(
+        self,
+        filename,
+        stale=LOCK_STALE,
+        poll=LOCK_POLL,
+        ):
+        self.filename = filename + '.lock'
+        self.stale = stale
+        self.poll = poll
+        self.refreshed = 0
+
+    def acquire(self):
+        while True:
+            try:
+                os.close(os.open(self.filename, os.O_WRONLY | os.O_CREAT
+                         | os.O_EXCL))
+                self.refreshed = time.time()
+                return
+            except OSError, e:
+                if e.errno != errno.EEXIST:
+                    raise
+            try:
+                if time.time() - os.path.getmtime(self.filename) \
+                    > self.stale:
+                    logging.warning('removing abandoned lock '
+                                    + self.filename)
+                    os.remove(self.filename)
+                    continue
+            except OSError:
+                continue
+            time.sleep(self.poll)
+
+    def refresh(self):
+        now = time.time()
+        if now - self.refreshed > self.stale / 10.0:
+            os.utime(self.filename, None)
+            self.refreshed = now
+
+    def release(self):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(
+        self,
+        exc_type,
+        exc_value,
+        traceback,
+        ):
+        self.release()
+        return False
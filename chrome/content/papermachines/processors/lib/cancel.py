@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+
+# Cooperative cancellation. To stop a run, the extension creates the
+# sentinel file <out_dir>/<name><collection>.cancel; processors look for it
+# once per document (update_progress, TextProcessor.advance) and raise
+# Cancelled, which TextProcessor.run() turns into a "cancelled" progress
+# line instead of an error. Looking is an os.path.exists call at most every
+# INTERVAL seconds, so checking from hot loops is cheap and a run still
+# stops well within a second.
+#
+# Cancelled is a KeyboardInterrupt so that the per-document
+# "except (KeyboardInterrupt, SystemExit): raise" clauses let it through.
+#
+# Java sections (MALLET's importers and samplers) run without coming back
+# to Python, so a watcher thread ends the whole process with halt()
+# instead; see TextProcessor.cancellable_java(). That would end every job
+# of a process shared by several, such as the processor server, which
+# sets shared_process: there a Java section can't be interrupted, and the
+# extension runs MALLET in a JVM of its own so that it can be.
+
+INTERVAL = 0.25
+
+shared_process = False
+
+# exit status of a run ended by halt(), as for an interrupt
+
+CANCELLED_STATUS = 130
+
+
+class Cancelled(KeyboardInterrupt):
+
+    pass
+
+
+def cancel_filename(out_dir, name, collection):
+    return os.path.join(out_dir, name + collection + '.cancel')
+
+
+class CancelSignal:
+
+    """
+    Whether the sentinel file for a run has appeared
+    """
+
+    def __init__(self, filename, interval=INTERVAL):
+        self.filename = filename
+        self.interval = interval
+        self.next_check = 0
+        self.cancelled = False
+
+    def requested(self):
+        if self.cancelled:
+            return True
+        now = time.time()
+        if now >= self.next_check:
+            self.next_check = now + self.interval
+            self.cancelled = os.path.exists(self.filename)
+        return self.cancelled
+
+    def check(self):
+        """Raise Cancelled if the run has been asked to stop"""
+
+        if self.requested():
+            raise Cancelled(self.filename)
+
+
+def halt(status=CANCELLED_STATUS):
+    """End the process at once, from any thread"""
+
+    try:
+        from java.lang import Runtime
+        Runtime.getRuntime().halt(status)
+    except ImportError:
+        os._exit(status)
@@ -13,6 +13,10 @@ class classPathHacker:
     import java.net.URLClassLoader
     import jarray
 
+    # jars already on the system classpath; shared by every instance so a
+    # long-lived interpreter only loads each jar once
+    added = set()
+
     def addFile (self, s):
         #############################################
         # Purpose: If adding a file/jar call this first
@@ -22,7 +26,10 @@ class classPathHacker:
         # make a URL out of 's'
         f = self.java.io.File (s)
         u = f.toURL ()
+        if s in classPathHacker.added:
+            return u
         a = self.addURL (u)
+        classPathHacker.added.add(s)
         return a
 
     def addURL (self, u):
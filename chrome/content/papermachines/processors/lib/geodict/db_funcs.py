@@ -4,10 +4,13 @@ import geodict_config
 class GeodictDatabase:
     def __init__(self, database_path):
         self.database_path = database_path
+        self.db = None
 
     def get_database_connection(self):
-        db=jsqlite3.connect(self.database_path)
-        cursor=db.cursor()
+        # Opening a JDBC connection per query is slow, so keep one around
+        if self.db is None:
+            self.db=jsqlite3.connect(self.database_path)
+        cursor=self.db.cursor()
         return cursor
 
     def get_cities(self, pulled_word,current_word,country_code,region_code):
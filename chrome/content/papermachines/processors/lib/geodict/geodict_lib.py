@@ -14,9 +14,10 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import string, StringIO
+import re, string, StringIO, bisect
 import geodict_config
 import db_funcs
+from lib.tokenizer import Tokenizer
 # The main entry point. This function takes an unstructured text string and returns a list of all the
 # fragments it could identify as locations, together with lat/lon positions
 
@@ -30,7 +31,15 @@ class GeodictParser:
         self.whitespace = set(string.whitespace+"'\",.-/\n\r<>")
         self.tokenized_words = {}
 
+        # Words are runs of anything else, case kept, found once per text by
+        # the shared tokenizer (lib/tokenizer.py)
+        self.tokenizer = Tokenizer(u'[^' + re.escape(''.join(sorted(self.whitespace))) + u']+', lowercase=False)
+        self.words_text = None
+
     def find_locations_in_text(self, text):
+        # The word cache is keyed by position, so it is only valid for one text
+        self.tokenized_words = {}
+        self.tokenize(text)
         current_index = len(text)-1
         result = []
 
@@ -375,34 +384,31 @@ class GeodictParser:
 
         return previous_result
 
-    # Walks backwards through the text from the end, pulling out a single unbroken sequence of non-whitespace
-    # characters, trimming any whitespace off the end
+    # Finds the words of text and where each starts, for pull_word_from_end
+    def tokenize(self, text):
+        self.words = list(self.tokenizer.spans(text))
+        self.word_starts = [start for (word, start, end) in self.words]
+        self.words_text = text
+
+    # Pulls out the single unbroken sequence of non-whitespace characters that ends at or before index,
+    # trimming any whitespace off the end; returns the word, the index just before it and how much
+    # whitespace was skipped
     def pull_word_from_end(self, text, index, use_cache=True):
 
         if use_cache and index in self.tokenized_words:
             return self.tokenized_words[index]
 
-        found_word = ''
-        current_index = index
-        end_skipped = 0
-        while current_index>=0:
-            current_char = text[current_index]
-            current_index -= 1
-
-            if current_char in self.whitespace:
-                if found_word is '':
-                    end_skipped += 1
-                    continue
-                else:
-                    current_index += 1
-                    break
-
-            found_word += current_char
+        if text is not self.words_text:
+            self.tokenize(text)
 
-        # reverse the result (since we're appending for efficiency's sake)
-        found_word = found_word[::-1]
-
-        result = (found_word, current_index, end_skipped)
+        # the last word starting at or before index, cut off at index
+        word_index = bisect.bisect_right(self.word_starts, index) - 1
+        if word_index < 0:
+            result = ('', -1, index + 1)
+        else:
+            found_word, start, end = self.words[word_index]
+            last = min(end - 1, index)
+            result = (text[start:last + 1], start - 1, index - last)
         self.tokenized_words[index] = result
 
         return result
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import codecs
+import logging
+import threading
+from itertools import imap as serial_imap, izip
+from metadata import file_hash
+from atomicfile import atomic_write
+
+# The corpus manifest records, for each extracted text of a collection, the
+# md5 of its contents and the mtime/size it had when hashed, plus the
+# derived artifacts made from it (token rows, geoparser and DBpedia
+# sidecars, ...) with whatever each processor needs to know they are still
+# good. A text is only re-hashed when its mtime or size changes; if its
+# contents really changed, its artifacts are forgotten, so every processor
+# redoes exactly the texts that are new or different.
+#
+# Collection-wide stats (documents, tokens, vocabulary, and the peak heap
+# each processor was measured at) are kept next to it in
+# <collection>.stats.json, small enough for the launcher to read when
+# sizing the heap of the next run (see lib/memory.py).
+
+FORMAT_VERSION = 1
+
+
+def manifest_filename(out_dir, collection):
+    return os.path.join(out_dir, 'manifest', collection + '.json')
+
+
+def _stats_filename(filename):
+    return os.path.splitext(filename)[0] + '.stats.json'
+
+
+class Manifest:
+
+    """
+    Content hashes and derived artifacts of every text in a collection
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.stats_filename = _stats_filename(filename)
+        self.docs = {}
+        self.stats = {}
+        self.lock = threading.RLock()
+        self.dirty = False
+        self.stats_dirty = False
+        if os.path.exists(filename):
+            self._load()
+
+    def _load(self):
+        try:
+            with codecs.open(self.filename, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('version') == FORMAT_VERSION:
+                self.docs = manifest['docs']
+        except:
+            logging.error('manifest ' + self.filename
+                          + ' could not be read -- rebuilding')
+            self.docs = {}
+        try:
+            with codecs.open(self.stats_filename, 'r', encoding='utf-8') as f:
+                self.stats = json.load(f)
+        except (IOError, OSError, ValueError):
+            self.stats = {}
+
+    def _stat(self, filename):
+        st = os.stat(filename)
+        return (int(st.st_mtime), st.st_size)
+
+    def _needs_hash(self, filename):
+        entry = self.docs.get(filename)
+        if not os.path.exists(filename):
+            return False
+        return entry is None or (entry['mtime'], entry['size']) \
+            != self._stat(filename)
+
+    def _set_hash(self, filename, digest, stat):
+        """Record a text's hash; returns True if its contents changed"""
+
+        with self.lock:
+            entry = self.docs.get(filename)
+            changed = entry is None or entry['hash'] != digest
+            if changed:
+                entry = {'hash': digest, 'artifacts': {}}
+                self.docs[filename] = entry
+            (entry['mtime'], entry['size']) = stat
+            self.dirty = True
+            return changed
+
+    def refresh(self, filenames, imap=None):
+        """
+        Re-hash the texts whose mtime or size changed (on worker threads,
+        with imap); returns the texts that are new or have new contents
+        """
+
+        if imap is None:
+            imap = serial_imap
+        candidates = [x for x in filenames if self._needs_hash(x)]
+
+        def hash_text(filename):
+            stat = self._stat(filename)
+            return (file_hash(filename), stat)
+
+        changed = []
+        for (filename, (digest, stat)) in izip(candidates,
+                imap(hash_text, candidates)):
+            if self._set_hash(filename, digest, stat):
+                changed.append(filename)
+        if len(candidates) > 0:
+            logging.info('manifest refreshed: {:} of {:} texts new or changed'.format(len(changed),
+                         len(filenames)))
+        return changed
+
+    def content_hash(self, filename):
+        """md5 of a text's current contents"""
+
+        if self._needs_hash(filename):
+            self.refresh([filename])
+        return self.docs[filename]['hash']
+
+    def signature(self, filename):
+        """What caches keyed on a text's contents compare against"""
+
+        self.content_hash(filename)
+        entry = self.docs[filename]
+        return [entry['hash'], entry['size']]
+
+    def artifact(self, filename, name):
+        """What was recorded for an artifact of filename, or None"""
+
+        if self._needs_hash(filename):
+            self.refresh([filename])
+        entry = self.docs.get(filename)
+        if entry is None:
+            return None
+        return entry['artifacts'].get(name)
+
+    def record(
+        self,
+        filename,
+        name,
+        value=True,
+        ):
+        """Note that artifact name was made from the current contents"""
+
+        self.content_hash(filename)
+        with self.lock:
+            self.docs[filename]['artifacts'][name] = value
+            self.dirty = True
+
+    def discard(self, filename, name):
+        with self.lock:
+            entry = self.docs.get(filename)
+            if entry is not None and name in entry['artifacts']:
+                del entry['artifacts'][name]
+                self.dirty = True
+
+    def update_stats(self, **stats):
+        """Set corpus stats, e.g. documents, tokens and vocabulary"""
+
+        with self.lock:
+            self.stats.update(stats)
+            self.stats_dirty = True
+
+    def record_peak(self, name, used):
+        """Note the peak heap a processor run reached on this corpus"""
+
+        with self.lock:
+            peaks = self.stats.setdefault('peak_heap', {})
+            peaks[name] = [used, self.stats.get('documents', len(self.docs))]
+            self.stats_dirty = True
+
+    def _write(self, filename, contents):
+        directory = os.path.dirname(filename)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        with atomic_write(filename) as f:
+            json.dump(contents, f)
+
+    def save(self):
+        with self.lock:
+            if self.dirty:
+                self._write(self.filename, {'version': FORMAT_VERSION,
+                            'docs': self.docs})
+                self.dirty = False
+            if self.stats_dirty:
+                self._write(self.stats_filename, self.stats)
+                self.stats_dirty = False
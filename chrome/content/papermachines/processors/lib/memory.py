@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+
+# Heap accounting. used_memory() is what a run has in use (the JVM heap
+# under Jython, the resident set otherwise) and heap_limit() what it may
+# grow to (-Xmx, or the memory still available).
+#
+# A run's peak heap is estimated in one place, by the launcher
+# (_estimateHeap in papermachines.js), from heap.json and the corpus stats
+# kept with the manifest, since it has to pick -Xmx before the JVM starts.
+# It passes the estimate, in MB, to the processor after the args file;
+# estimate_from_argv() reads it back.
+
+MB = 1024 * 1024
+
+
+def used_memory():
+    """Bytes in use: JVM heap under Jython, resident set otherwise"""
+
+    try:
+        from java.lang import Runtime
+        runtime = Runtime.getRuntime()
+        return runtime.totalMemory() - runtime.freeMemory()
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, AttributeError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return (peak if sys.platform == 'darwin' else peak * 1024)
+
+
+def _available_memory():
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError, ValueError):
+        pass
+    try:
+        return os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def heap_limit():
+    """Bytes this run may use: the JVM's -Xmx, or available memory"""
+
+    try:
+        from java.lang import Runtime
+        return Runtime.getRuntime().maxMemory()
+    except ImportError:
+        return _available_memory()
+
+
+def estimate_from_argv(argv):
+    """The launcher's heap estimate in bytes, or None if it gave none"""
+
+    try:
+        return int(argv[2]) * MB
+    except (IndexError, ValueError):
+        return None
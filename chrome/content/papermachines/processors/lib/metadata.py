@@ -0,0 +1,463 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import csv
+import copy
+import array
+import hashlib
+import logging
+import cPickle as pickle
+from datetime import datetime
+from collections import defaultdict
+from itertools import izip
+from atomicfile import atomic_write
+
+# The metadata table keeps the collection CSV by column rather than as one
+# dict per document. Each column is an array of codes into a pool of its
+# distinct values, so repeated labels, years and dates are stored once.
+# Documents have integer IDs (their row), and itemID, label and date have
+# hash indexes, built the first time they are needed. Dates are parsed once
+# and kept as ordinals.
+#
+# The parsed table is cached next to the CSV (<csv>.metadata) and reused
+# while the CSV has the same contents; the extension rewrites the CSV for
+# every run, so the cache is keyed on a hash of the file rather than its
+# mtime.
+#
+# Rows behave like the dicts processors used to get: fields can be read,
+# changed, added (e.g. 'topics') or deleted, rows added, replaced or
+# deleted by filename. A field deleted from a CSV column is recorded in
+# the row's set of deleted keys, as the column still holds a value for it.
+
+FORMAT_VERSION = 1
+
+_DATE_COLUMN = 'date'
+
+
+def parse_date(date_str):
+    """A metadata date as processors have always read it, or None"""
+
+    if date_str.strip() == '':
+        return None
+    cleaned_date = date_str[0:10]
+    if '-00' in cleaned_date:
+        cleaned_date = cleaned_date[0:4] + '-01-01'
+    try:
+        return datetime.strptime(cleaned_date, '%Y-%m-%d')
+    except ValueError:
+        return None
+
+
+def file_hash(filename):
+    digest = hashlib.md5()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda : f.read(1 << 20), ''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Column:
+
+    """
+    One metadata field: an array of codes into a pool of distinct values
+    """
+
+    def __init__(self, pool=None, codes=None):
+        self.pool = (pool if pool is not None else [])
+        self.codes = (codes if codes is not None else array.array('i'))
+        self.lookup = None
+
+    def code(self, value):
+        if self.lookup is None:
+            self.lookup = dict((v, i) for (i, v) in enumerate(self.pool))
+        i = self.lookup.get(value)
+        if i is None:
+            i = len(self.pool)
+            self.pool.append(value)
+            self.lookup[value] = i
+        return i
+
+    def append(self, value):
+        self.codes.append(self.code(value))
+
+    def __getitem__(self, doc):
+        return self.pool[self.codes[doc]]
+
+    def __setitem__(self, doc, value):
+        self.codes[doc] = self.code(value)
+
+
+class Row:
+
+    """
+    Dict-like view of one document's metadata
+    """
+
+    def __init__(self, table, doc):
+        self.table = table
+        self.doc = doc
+
+    def __getitem__(self, key):
+        extra = self.table.extra.get(self.doc)
+        if extra is not None and key in extra:
+            return extra[key]
+        column = self.table.columns.get(key)
+        if column is None or key in self.table.deleted.get(self.doc, ()):
+            raise KeyError(key)
+        return column[self.doc]
+
+    def __setitem__(self, key, value):
+        self.table.set_value(self.doc, key, value)
+
+    def __delitem__(self, key):
+        self.table.delete_value(self.doc, key)
+
+    def __contains__(self, key):
+        return key in self.table.extra.get(self.doc, ()) or (key
+                in self.table.columns and key
+                not in self.table.deleted.get(self.doc, ()))
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        deleted = self.table.deleted.get(self.doc, ())
+        extra = self.table.extra.get(self.doc, ())
+        keys = [key for key in self.table.header if key not in deleted
+                or key in extra]
+        for key in extra:
+            if key not in self.table.columns:
+                keys.append(key)
+        return keys
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __copy__(self):
+        return self.to_dict()
+
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(self.to_dict(), memo)
+
+    def __eq__(self, other):
+        if not hasattr(other, 'items'):
+            return False
+        return dict(self.items()) == dict(other.items())
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
+class MetadataTable:
+
+    """
+    Columnar metadata for a collection, keyed by filename
+    """
+
+    def __init__(self, header=()):
+        self.header = [x for x in header if x != 'filename']
+        self.columns = dict((name, Column()) for name in self.header)
+        self.filenames = []
+        self.alive = bytearray()
+        self.extra = {}
+        self.deleted = {}
+        self.doc_ids = {}
+        self.date_ordinals = array.array('i')
+        self._indexes = {}
+        self._parsed_dates = {}
+        self.signature = None
+        self.from_cache = False
+
+    @classmethod
+    def load(cls, csv_file):
+        """
+        Table for a metadata CSV, from the binary cache next to it if that
+        was made from the same contents
+        """
+
+        cache_filename = csv_file + '.metadata'
+        signature = [os.path.getsize(csv_file), file_hash(csv_file)]
+        if os.path.exists(cache_filename):
+            try:
+                with open(cache_filename, 'rb') as f:
+                    cached = pickle.load(f)
+                if cached['version'] == FORMAT_VERSION \
+                    and cached['signature'] == signature:
+                    table = cls._from_state(cached)
+                    table.signature = signature
+                    table.from_cache = True
+                    return table
+            except:
+                logging.error('metadata cache ' + cache_filename
+                              + ' could not be read -- rebuilding')
+        table = cls.from_csv(csv_file)
+        table.signature = signature
+        try:
+            with atomic_write(cache_filename, 'wb', encoding=None) as f:
+                pickle.dump(table._state(signature), f, 2)
+        except:
+            logging.error('metadata cache ' + cache_filename
+                          + ' could not be written')
+        return table
+
+    @classmethod
+    def from_csv(cls, csv_file, dialect=csv.excel):
+        with file(csv_file, 'rU') as f:
+            rows = csv.reader(f, dialect=dialect)
+            header = [unicode(cell, 'utf-8') for cell in rows.next()]
+            table = cls(header)
+            for row in rows:
+                if len(row) > 0:
+                    rowdict = dict(zip(header, [unicode(cell, 'utf-8')
+                                   for cell in row]))
+                    table[rowdict.pop('filename')] = rowdict
+        return table
+
+    @classmethod
+    def from_dict(cls, metadata):
+        """Table for a dict of dicts keyed by filename, as to_dict makes"""
+
+        # keys with string values become columns; anything else (lists,
+        # numbers) is kept per document, as __setitem__ does
+
+        header = []
+        other = set()
+        for values in metadata.itervalues():
+            for (key, value) in values.iteritems():
+                if not isinstance(value, basestring):
+                    other.add(key)
+                elif key not in header:
+                    header.append(key)
+        table = cls([key for key in header if key not in other])
+        for (filename, values) in metadata.iteritems():
+            table[filename] = values
+        return table
+
+    # strings are cached joined by NUL, which CSV fields never contain, so
+    # loading is one split per column instead of one object per value
+
+    def _state(self, signature):
+        return {
+            'version': FORMAT_VERSION,
+            'signature': signature,
+            'header': self.header,
+            'filenames': u'\x00'.join(self.filenames),
+            'columns': dict((name, (u'\x00'.join(column.pool),
+                            column.codes.tostring())) for (name,
+                            column) in self.columns.iteritems()),
+            'dates': self.date_ordinals.tostring(),
+            }
+
+    @classmethod
+    def _from_state(cls, state):
+        table = cls(state['header'])
+        if len(state['filenames']) > 0:
+            table.filenames = state['filenames'].split(u'\x00')
+        table.alive = bytearray([1]) * len(table.filenames)
+        table.doc_ids = dict(izip(table.filenames,
+                             xrange(len(table.filenames))))
+        for (name, (pool, codes)) in state['columns'].iteritems():
+            table.columns[name] = Column(pool.split(u'\x00'),
+                    array.array('i', codes))
+        table.date_ordinals = array.array('i', state['dates'])
+        return table
+
+    # documents
+
+    def doc_id(self, filename):
+        return self.doc_ids[filename]
+
+    def filename(self, doc):
+        return self.filenames[doc]
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def __contains__(self, filename):
+        return filename in self.doc_ids
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __getitem__(self, filename):
+        return Row(self, self.doc_ids[filename])
+
+    def get(self, filename, default=None):
+        doc = self.doc_ids.get(filename)
+        if doc is None:
+            return default
+        return Row(self, doc)
+
+    def __setitem__(self, filename, values):
+
+        # a filename already in the table keeps its row and doc ID
+
+        doc = self.doc_ids.get(filename)
+        if doc is None:
+            doc = len(self.filenames)
+            self.filenames.append(filename)
+            self.alive.append(1)
+            self.doc_ids[filename] = doc
+            for name in self.header:
+                self.columns[name].append(values.get(name, u''))
+            self.date_ordinals.append(0)
+        else:
+            for name in self.header:
+                self.columns[name][doc] = values.get(name, u'')
+            self.extra.pop(doc, None)
+            self.deleted.pop(doc, None)
+        extra = dict((k, v) for (k, v) in values.items() if k
+                     not in self.columns and k != 'filename')
+        if len(extra) > 0:
+            self.extra[doc] = copy.deepcopy(extra)
+        self.date_ordinals[doc] = \
+            self._date_ordinal(values.get(_DATE_COLUMN, u''))
+        self._indexes = {}
+
+    def __delitem__(self, filename):
+        doc = self.doc_ids.pop(filename)
+        self.alive[doc] = 0
+        self.extra.pop(doc, None)
+        self.deleted.pop(doc, None)
+        self._indexes = {}
+
+    def keys(self):
+        return [filename for (doc, filename) in enumerate(self.filenames)
+                if self.alive[doc]]
+
+    def docs(self):
+        return [doc for doc in xrange(len(self.filenames))
+                if self.alive[doc]]
+
+    def values(self):
+        return [Row(self, doc) for doc in self.docs()]
+
+    def items(self):
+        return [(self.filenames[doc], Row(self, doc)) for doc in
+                self.docs()]
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def set_value(
+        self,
+        doc,
+        key,
+        value,
+        ):
+        if key in self.columns and isinstance(value, basestring):
+            self.columns[key][doc] = value
+            if doc in self.extra:
+                self.extra[doc].pop(key, None)
+            if key == _DATE_COLUMN:
+                self.date_ordinals[doc] = self._date_ordinal(value)
+        else:
+            self.extra.setdefault(doc, {})[key] = value
+        if key in self.deleted.get(doc, ()):
+            self.deleted[doc].discard(key)
+        if key in ('itemID', 'label', _DATE_COLUMN):
+            self._indexes.pop(key, None)
+
+    def delete_value(self, doc, key):
+        extra = self.extra.get(doc)
+        found = extra is not None and key in extra
+        if found:
+            del extra[key]
+        if key in self.columns and key not in self.deleted.get(doc, ()):
+            self.deleted.setdefault(doc, set()).add(key)
+            if key == _DATE_COLUMN:
+                self.date_ordinals[doc] = 0
+            found = True
+        if not found:
+            raise KeyError(key)
+        if key in ('itemID', 'label', _DATE_COLUMN):
+            self._indexes.pop(key, None)
+
+    def to_dict(self):
+        """Plain dict of dicts, e.g. for json.dump"""
+
+        return dict((filename, row.to_dict()) for (filename, row) in
+                    self.items())
+
+    # dates
+
+    def _date_ordinal(self, date_str):
+        ordinal = self._parsed_dates.get(date_str)
+        if ordinal is None:
+            date = parse_date(date_str)
+            ordinal = (date.toordinal() if date is not None else 0)
+            self._parsed_dates[date_str] = ordinal
+        return ordinal
+
+    def date(self, filename):
+        """Parsed date of a document, or None if it has none"""
+
+        ordinal = self.date_ordinals[self.doc_ids[filename]]
+        if ordinal == 0:
+            return None
+        return datetime.fromordinal(ordinal)
+
+    # indexes
+
+    def _index(self, key):
+        index = self._indexes.get(key)
+        if index is None:
+            index = defaultdict(list)
+            if key == _DATE_COLUMN:
+                for doc in self.docs():
+                    index[self.date_ordinals[doc]].append(self.filenames[doc])
+            else:
+                for doc in self.docs():
+                    row = Row(self, doc)
+                    if key in row:
+                        index[row[key]].append(self.filenames[doc])
+            self._indexes[key] = index
+        return index
+
+    def with_item_id(self, itemID):
+        return list(self._index('itemID').get(itemID, []))
+
+    def with_label(self, label):
+        return list(self._index('label').get(label, []))
+
+    def on_date(self, date):
+        return list(self._index(_DATE_COLUMN).get(date.toordinal(), []))
+
+    def labels(self):
+        """Filenames by label"""
+
+        return dict((label, list(filenames)) for (label, filenames) in
+                    self._index('label').iteritems() if filenames)
+
+    def dates(self):
+        """Filenames by parsed date (documents without one are left out)"""
+
+        return dict((datetime.fromordinal(ordinal), list(filenames))
+                    for (ordinal, filenames) in
+                    self._index(_DATE_COLUMN).iteritems() if ordinal
+                    != 0 and filenames)
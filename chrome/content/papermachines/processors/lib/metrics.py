@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from collections import Counter, defaultdict
+from memory import used_memory
+from atomicfile import atomic_write
+
+# Stage timings and counters for one processor run. Spans are named stages
+# (metadata, tokenize, count, score, import, train, output, ...); a stage
+# entered more than once accumulates calls and seconds. Counters add up
+# anything countable: documents, tokens, bytes read, cache hits and
+# misses. Both may be updated from worker threads. Each finished span is
+# also kept as an event (name, start, end), so samples taken alongside a
+# run (e.g. memory use) can be matched to the stage they fell in.
+#
+# While any span is open, a thread samples heap use every MEMORY_INTERVAL
+# seconds, and each span keeps the largest value seen while it ran.
+#
+# Stages that work through documents one at a time (extraction,
+# geoparsing, annotation) also time each one, with the bytes it read and
+# wrote, so the slowest documents and the spread of throughput can be
+# reported. Documents answered from a cache are not included.
+
+MEMORY_INTERVAL = 0.5
+
+SLOWEST_DOCUMENTS = 10
+
+PERCENTILES = (0, 10, 50, 90, 100)
+
+
+class Metrics:
+
+    """
+    Named spans and counters, written out as JSON at the end of a run
+    """
+
+    def __init__(self, memory_interval=MEMORY_INTERVAL):
+        self.started = time.time()
+        self.spans = {}
+        self.order = []
+        self.counters = Counter()
+        self.events = []
+        self.lock = threading.Lock()
+        self.memory_interval = memory_interval
+        self.open_spans = {}
+        self.peak_memory = 0
+        self.sampler = None
+        self.documents = defaultdict(list)
+
+    def sample_memory(self):
+        used = used_memory()
+        with self.lock:
+            self.peak_memory = max(self.peak_memory, used)
+            for entry in self.open_spans.itervalues():
+                entry[1] = max(entry[1], used)
+
+    def _watch_memory(self):
+        while True:
+            time.sleep(self.memory_interval)
+            with self.lock:
+                if not self.open_spans:
+                    self.sampler = None
+                    return
+            self.sample_memory()
+
+    @contextmanager
+    def span(self, name):
+        """Time the enclosed block as stage name"""
+
+        entry = [name, 0]
+        with self.lock:
+            self.open_spans[id(entry)] = entry
+            if self.sampler is None and self.memory_interval:
+                self.sampler = threading.Thread(target=self._watch_memory,
+                        name='metrics-memory')
+                self.sampler.daemon = True
+                self.sampler.start()
+        self.sample_memory()
+        start = time.time()
+        try:
+            yield
+        finally:
+            seconds = time.time() - start
+            self.sample_memory()
+            with self.lock:
+                del self.open_spans[id(entry)]
+            self.add_time(name, seconds, entry[1])
+
+    def add_time(
+        self,
+        name,
+        seconds,
+        peak_memory=None,
+        ):
+        end = time.time()
+        with self.lock:
+            self.events.append((name, end - seconds, end))
+            if name not in self.spans:
+                self.spans[name] = [0, 0.0, None]
+                self.order.append(name)
+            span = self.spans[name]
+            span[0] += 1
+            span[1] += seconds
+            if peak_memory is not None:
+                span[2] = max(span[2], peak_memory)
+
+    def document(
+        self,
+        stage,
+        name,
+        seconds,
+        bytes_in=0,
+        bytes_out=0,
+        ):
+        """Record the time one document took in stage, and its sizes"""
+
+        with self.lock:
+            self.documents[stage].append((seconds, name, bytes_in,
+                    bytes_out))
+
+    def document_report(self, stage, slowest=SLOWEST_DOCUMENTS):
+        """The slowest documents of a stage and percentiles of bytes/s"""
+
+        with self.lock:
+            documents = sorted(self.documents[stage], reverse=True)
+        rates = sorted(bytes_in / seconds for (seconds, name, bytes_in,
+                       bytes_out) in documents if seconds > 0)
+        percentiles = {}
+        if rates:
+            for p in PERCENTILES:
+                percentiles['p' + str(p)] = round(rates[min(len(rates)
+                        - 1, len(rates) * p // 100)], 1)
+        return {
+            'documents': len(documents),
+            'seconds': round(sum(x[0] for x in documents), 3),
+            'slowest': [{
+                'name': name,
+                'seconds': round(seconds, 3),
+                'bytes_in': bytes_in,
+                'bytes_out': bytes_out,
+                } for (seconds, name, bytes_in, bytes_out) in
+                documents[:slowest]],
+            'bytes_per_second': percentiles,
+            }
+
+    def log_documents(self, stage, slowest=SLOWEST_DOCUMENTS):
+        report = self.document_report(stage, slowest)
+        if report['documents'] == 0:
+            return
+        rates = report['bytes_per_second']
+        spread = ', '.join(key + ' ' + str(rates[key]) for key in ['p'
+                           + str(p) for p in PERCENTILES] if key in rates)
+        logging.info('{:}: {:} documents in {:.1f} s; bytes/s by percentile: {:}'.format(stage,
+                     report['documents'], report['seconds'], spread))
+        for document in report['slowest']:
+            logging.info('{:}: {:.2f} s, {:} bytes in, {:} bytes out: {:}'.format(stage,
+                         document['seconds'], document['bytes_in'],
+                         document['bytes_out'], document['name']))
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+
+    def to_dict(self):
+        documents = dict((stage, self.document_report(stage)) for stage in
+                         self._document_stages())
+        with self.lock:
+            return {
+                'wall_seconds': round(time.time() - self.started, 3),
+                'peak_memory': self.peak_memory or None,
+                'spans': [{'name': name, 'calls': self.spans[name][0],
+                          'seconds': round(self.spans[name][1], 3),
+                          'peak_memory': self.spans[name][2]}
+                          for name in self.order],
+                'counters': dict(self.counters),
+                'documents': documents,
+                }
+
+    def _document_stages(self):
+        with self.lock:
+            return [stage for (stage, documents) in
+                    self.documents.iteritems() if documents]
+
+    def write(self, filename):
+        with atomic_write(filename) as f:
+            json.dump(self.to_dict(), f, indent=1, sort_keys=True)
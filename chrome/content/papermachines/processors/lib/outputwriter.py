@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import json
+import codecs
+import hashlib
+import logging
+from atomicfile import atomic_write, temp_filename, FileLock
+
+# Visualization data is written to <output>.js one section (top-level key)
+# at a time, serializing one element at a time, so no complete JSON string
+# of the output is ever built. A section larger than CHUNK_SIZE is split
+# into <output>-<key>-<n>.js files that the data file pulls in with
+# document.write, so the browser parses each piece separately and the
+# scripts that follow still find a complete `data` object.
+#
+# DOC_METADATA is no longer copied into every output: it is written once to
+# <collection>-metadata-<hash>.js, named by a hash of its contents, which
+# every visualization made from the same metadata loads. Each output's file
+# list (<output>-files.json) is its reference to the file: it is made to
+# name the file before the file is put in place, and resetting an output
+# deletes it. A metadata file no file list names is removed. Both happen
+# under the collection's metadata lock, so a file is never removed between
+# being written and being named.
+
+CHUNK_SIZE = 4 * 1024 * 1024
+
+_section_templates = {
+    list: (u'[]', u'[{1}]', u'data[{0}]=data[{0}].concat([{1}]);\n'),
+    dict: (u'{{}}', u'{{{1}}}',
+           u'(function(d,c){{for(var k in c)d[k]=c[k];}})(data[{0}],{{{1}}});\n'
+           ),
+    }
+
+
+def _pieces(value, sort_keys=False):
+    """JSON for each element of a list, or each key: value of a dict"""
+
+    if isinstance(value, dict):
+        keys = (sorted(value.keys()) if sort_keys else value.keys())
+        for key in keys:
+            yield json.dumps({key: value[key]}, sort_keys=sort_keys)[1:-1]
+    else:
+        for item in value:
+            yield json.dumps(item)
+
+
+def metadata_lock(out_dir, collection):
+    """Held while collection's metadata files or references change"""
+
+    return FileLock(os.path.join(out_dir, collection + '-metadata'))
+
+
+def _read_files(files_filename):
+    if not os.path.exists(files_filename):
+        return {'chunks': [], 'metadata': None}
+    with codecs.open(files_filename, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_files(files_filename, files):
+    with atomic_write(files_filename) as f:
+        json.dump(files, f)
+
+
+def write_shared_metadata(
+    out_dir,
+    collection,
+    doc_metadata,
+    files_filename,
+    ):
+    """
+    Write DOC_METADATA to the file shared by every visualization made from
+    the same metadata, if it is not there already, and name it in the file
+    list files_filename of the output that loads it; returns its path
+    """
+
+    tmp_filename = temp_filename(os.path.join(out_dir, collection
+                                 + '-metadata.js'))
+    digest = hashlib.md5()
+    with codecs.open(tmp_filename, 'w', encoding='utf-8') as f:
+        f.write(u'var DOC_METADATA={')
+        for (i, piece) in enumerate(_pieces(doc_metadata, True)):
+            if i > 0:
+                f.write(u',')
+            f.write(piece)
+            digest.update(piece)
+        f.write(u'};\n')
+    name = collection + '-metadata-' + digest.hexdigest()[:12] + '.js'
+    filename = os.path.join(out_dir, name)
+    with metadata_lock(out_dir, collection):
+        try:
+            files = _read_files(files_filename)
+        except (IOError, OSError, ValueError):
+            files = {'chunks': []}
+        files['metadata'] = name
+        _write_files(files_filename, files)
+        if os.path.exists(filename):
+            os.remove(tmp_filename)
+        else:
+            os.rename(tmp_filename, filename)
+    return filename
+
+
+def remove_unused_metadata(out_dir, collection):
+    """Delete collection's metadata files that no output loads any more"""
+
+    pattern = re.compile(re.escape(collection)
+                         + r'-metadata-[0-9a-f]{12}\.js$')
+    with metadata_lock(out_dir, collection):
+        names = os.listdir(out_dir)
+        used = set()
+        for name in names:
+            if not name.endswith('-files.json'):
+                continue
+            try:
+                used.add(_read_files(os.path.join(out_dir,
+                         name)).get('metadata'))
+            except (IOError, OSError, ValueError, AttributeError):
+
+                # a file list that can't be read might name any of them
+
+                logging.error('could not read ' + name
+                              + ' -- keeping old metadata files')
+                return
+        for name in names:
+            if not pattern.match(name) or name in used:
+                continue
+            filename = os.path.join(out_dir, name)
+            try:
+                os.remove(filename)
+            except OSError:
+                logging.error('could not remove ' + filename)
+
+
+class OutputWriter:
+
+    """
+    Streams the data sections of one visualization to disk
+    """
+
+    def __init__(self, data_filename, chunk_size=CHUNK_SIZE):
+        self.data_filename = data_filename
+        self.chunk_size = chunk_size
+        self.files_filename = os.path.splitext(data_filename)[0] \
+            + '-files.json'
+        self.chunks = []
+
+    def _remove_old_chunks(self):
+        if not os.path.exists(self.files_filename):
+            return
+        try:
+            old_files = _read_files(self.files_filename)
+            for name in old_files.get('chunks', []):
+                filename = os.path.join(os.path.dirname(self.data_filename),
+                        name)
+                if os.path.exists(filename):
+                    os.remove(filename)
+        except:
+            logging.error('could not remove old chunks of '
+                          + self.data_filename)
+
+    def _write_chunk(self, key, pieces, merge):
+        name = os.path.splitext(os.path.basename(self.data_filename))[0] \
+            + '-' + re.sub(r'\W', '_', unicode(key)) + '-' \
+            + str(len(self.chunks)) + '.js'
+        filename = os.path.join(os.path.dirname(self.data_filename), name)
+        with codecs.open(filename, 'w', encoding='utf-8') as f:
+            f.write(merge.format(json.dumps(key), u','.join(pieces)))
+        self.chunks.append(name)
+        return name
+
+    def _write_section(
+        self,
+        datafile,
+        key,
+        value,
+        ):
+        (empty, inline, merge) = _section_templates[(dict if isinstance(value,
+                dict) else list)]
+        key_json = json.dumps(key)
+        buffered = []
+        size = 0
+        chunk_names = []
+        for piece in _pieces(value):
+            buffered.append(piece)
+            size += len(piece) + 1
+            if size > self.chunk_size:
+                chunk_names.append(self._write_chunk(key, buffered, merge))
+                buffered = []
+                size = 0
+        if len(chunk_names) == 0:
+            datafile.write(u'data[' + key_json + u']='
+                           + inline.format(key_json, u','.join(buffered))
+                           + u';\n')
+            return
+        if len(buffered) > 0:
+            chunk_names.append(self._write_chunk(key, buffered, merge))
+        datafile.write(u'data[' + key_json + u']=' + empty.format() + u';\n')
+        for name in chunk_names:
+            datafile.write(u'document.write(\'<script type="text/javascript" src="'
+                            + name + u'"></script>\');\n')
+
+    def write(self, data_params, metadata_src=None):
+        self._remove_old_chunks()
+        self.chunks = []
+        with codecs.open(self.data_filename, 'w', encoding='utf-8') as \
+            datafile:
+            datafile.write(u'var data={};\n')
+            datafile.write(u'if (typeof DOC_METADATA != "undefined") data["DOC_METADATA"]=DOC_METADATA;\n'
+                           )
+            for (key, value) in data_params.iteritems():
+                if isinstance(value, (dict, list, tuple)):
+                    self._write_section(datafile, key, value)
+                else:
+                    datafile.write(u'data[' + json.dumps(key) + u']=')
+                    json.dump(value, datafile)
+                    datafile.write(u';\n')
+        _write_files(self.files_filename, {'chunks': self.chunks,
+                     'metadata': metadata_src})
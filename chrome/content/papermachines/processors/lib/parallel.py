@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import threading
+import Queue
+from collections import Counter
+
+# Jython has no global interpreter lock, so plain threads spread
+# per-document work over every core; under CPython they would only take
+# turns, and everything runs on the calling thread instead.
+
+
+def cpu_count():
+    try:
+        from java.lang import Runtime
+        return Runtime.getRuntime().availableProcessors()
+    except ImportError:
+        try:
+            import multiprocessing
+            return multiprocessing.cpu_count()
+        except (ImportError, NotImplementedError):
+            return 1
+
+
+def default_workers():
+    if sys.platform.startswith('java'):
+        return cpu_count()
+    return 1
+
+
+def _update(acc, result):
+    acc.update(result)
+
+
+def _start(target, *args):
+    thread = threading.Thread(target=target, args=args)
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+def _raise(exc_info):
+    raise exc_info[0], exc_info[1], exc_info[2]
+
+
+def _imap_worker(func, tasks, results):
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        (index, item) = task
+        try:
+            results.put((index, True, func(item)))
+        except:
+            results.put((index, False, sys.exc_info()))
+
+
+def imap(
+    func,
+    items,
+    workers=None,
+    window=None,
+    ):
+    """
+    Like itertools.imap, but func runs on worker threads; results come back
+    in the order of items, with at most window of them in flight
+    """
+
+    if workers is None:
+        workers = default_workers()
+    if workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+    if window is None:
+        window = workers * 4
+
+    tasks = Queue.Queue()
+    results = Queue.Queue()
+    threads = [_start(_imap_worker, func, tasks, results) for i in
+               range(workers)]
+    try:
+        items = iter(items)
+        finished = {}
+        sent = 0
+        next_index = 0
+        exhausted = False
+        while True:
+            while not exhausted and sent - next_index < window:
+                try:
+                    tasks.put((sent, items.next()))
+                    sent += 1
+                except StopIteration:
+                    exhausted = True
+            if next_index == sent:
+                break
+            while next_index not in finished:
+                (index, ok, value) = results.get()
+                finished[index] = (ok, value)
+            (ok, value) = finished.pop(next_index)
+            next_index += 1
+            if not ok:
+                _raise(value)
+            yield value
+    finally:
+        for thread in threads:
+            tasks.put(None)
+
+
+def map_reduce(
+    func,
+    items,
+    reduce_func=None,
+    merge_func=None,
+    initial=Counter,
+    workers=None,
+    progress=None,
+    ):
+    """
+    Map func over items on worker threads. Each worker folds its results
+    into its own accumulator, made by initial(), with reduce_func(acc,
+    result); the workers' accumulators are then combined with
+    merge_func(acc, other). Both default to acc.update(...), which merges
+    Counters. progress, if given, is called once per item, one call at a
+    time; what it raises (cancellation, say) stops the workers and is
+    raised here.
+    """
+
+    if reduce_func is None:
+        reduce_func = _update
+    if merge_func is None:
+        merge_func = reduce_func
+    if workers is None:
+        workers = default_workers()
+    items = list(items)
+    workers = min(workers, len(items))
+
+    if workers <= 1:
+        acc = initial()
+        for item in items:
+            reduce_func(acc, func(item))
+            if progress is not None:
+                progress()
+        return acc
+
+    tasks = Queue.Queue()
+    for item in items:
+        tasks.put(item)
+    lock = threading.Lock()
+    accumulators = []
+    errors = []
+
+    def work():
+        acc = initial()
+        with lock:
+            accumulators.append(acc)
+        while not errors:
+            try:
+                item = tasks.get_nowait()
+            except Queue.Empty:
+                break
+            try:
+                reduce_func(acc, func(item))
+                if progress is not None:
+                    with lock:
+                        progress()
+            except:
+                errors.append(sys.exc_info())
+                break
+
+    threads = [_start(work) for i in range(workers)]
+    for thread in threads:
+        thread.join()
+    if errors:
+        _raise(errors[0])
+
+    total = initial()
+    for acc in accumulators:
+        merge_func(total, acc)
+    return total
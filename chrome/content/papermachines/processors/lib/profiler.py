@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import codecs
+import logging
+import threading
+import traceback
+from contextlib import contextmanager
+from collections import Counter
+
+# Opt-in profiling of a processor run, switched on by the named arg
+# "profile" or the PAPERMACHINES_PROFILE environment variable:
+#
+#   sample         a thread samples the Python stacks of every thread each
+#                  interval (named arg "profile_interval", default 10 ms)
+#   deterministic  cProfile on the processing thread, plus the sampler
+#
+# Both write <prefix>-profile.txt (per-function cumulative stats) and
+# <prefix>-stacks.txt (collapsed stacks, "frame;frame;frame count", root
+# first, as flamegraph.pl and speedscope read them). Python stacks stop
+# where a call goes into Java, so java_section() additionally dumps all JVM
+# threads every few seconds while MALLET works, to <prefix>-threads.txt,
+# and folds the Java stacks of running threads into the collapsed stacks.
+
+ENVIRONMENT_VARIABLE = 'PAPERMACHINES_PROFILE'
+
+MODES = ('sample', 'deterministic')
+
+DEFAULT_INTERVAL = 0.01
+
+JAVA_INTERVAL = 2.0
+
+
+def from_settings(named_args, prefix):
+    """A Profiler if the named args or environment ask for one, else None"""
+
+    named_args = named_args or {}
+    mode = named_args.get('profile') or os.environ.get(ENVIRONMENT_VARIABLE)
+    if not mode or str(mode).lower() in ('0', 'false', 'no', 'off'):
+        return None
+    mode = str(mode).lower()
+    if mode not in MODES:
+        mode = 'sample'
+    interval = float(named_args.get('profile_interval', DEFAULT_INTERVAL))
+    return Profiler(mode, prefix, interval)
+
+
+def _python_frame(frame):
+    code = frame.f_code
+    return code.co_name + ' (' + os.path.basename(code.co_filename) + ':' \
+        + str(code.co_firstlineno) + ')'
+
+
+def _python_stack(frame):
+    stack = []
+    while frame is not None:
+        stack.append(_python_frame(frame))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def _java_threads():
+    """
+    (name, state, [class.method, innermost first], stack trace) of every
+    JVM thread
+    """
+
+    from java.lang import Thread
+    threads = []
+    for entry in Thread.getAllStackTraces().entrySet():
+        thread = entry.getKey()
+        frames = [element.getClassName() + '.' + element.getMethodName()
+                  for element in entry.getValue()]
+        threads.append((thread.getName(), str(thread.getState()), frames,
+                       entry.getValue()))
+    return threads
+
+
+class Profiler:
+
+    """
+    Samples (and optionally cProfiles) a run; files are written on stop()
+    """
+
+    def __init__(
+        self,
+        mode,
+        prefix,
+        interval=DEFAULT_INTERVAL,
+        ):
+        self.mode = mode
+        self.prefix = prefix
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.sampler = None
+        self.profile = None
+
+    def _sample_python(self):
+        current_frames = getattr(sys, '_current_frames', None)
+        if current_frames is None:
+            return
+        names = dict((getattr(t, 'ident', None), t.name) for t in
+                     threading.enumerate())
+        own = threading.currentThread().ident
+        frames = current_frames()
+        with self.lock:
+            self.samples += 1
+            for (ident, frame) in frames.items():
+                if ident == own:
+                    continue
+                stack = [names.get(ident, 'thread-' + str(ident))] \
+                    + _python_stack(frame)
+                self.stacks[';'.join(stack)] += 1
+
+    def _sample(self):
+        while not self.stopped.is_set():
+            try:
+                self._sample_python()
+            except:
+                logging.error(traceback.format_exc())
+                return
+            self.stopped.wait(self.interval)
+
+    def start(self):
+        self.started = time.time()
+        self.stopped.clear()
+        if os.path.exists(self.prefix + '-threads.txt'):
+            os.remove(self.prefix + '-threads.txt')
+        self.sampler = threading.Thread(target=self._sample,
+                name='profiler')
+        self.sampler.daemon = True
+        self.sampler.start()
+        if self.mode == 'deterministic':
+            try:
+                import cProfile as profile
+            except ImportError:
+                import profile
+            self.profile = profile.Profile()
+            if hasattr(self.profile, 'enable'):
+                self.profile.enable()
+            else:
+                sys.setprofile(self.profile.dispatcher)
+
+    def stop(self):
+        if self.profile is not None:
+            if hasattr(self.profile, 'disable'):
+                self.profile.disable()
+            else:
+                sys.setprofile(None)
+        self.stopped.set()
+        if self.sampler is not None:
+            self.sampler.join()
+        self.seconds = time.time() - self.started
+        try:
+            self.write()
+        except:
+            logging.error(traceback.format_exc())
+
+    @contextmanager
+    def java_section(self, name, interval=JAVA_INTERVAL):
+        """
+        Dump the JVM's threads every interval seconds while the enclosed
+        (Java) code runs
+        """
+
+        try:
+            import java.lang
+        except ImportError:
+            yield
+            return
+        done = threading.Event()
+        dumper = threading.Thread(target=self._dump_java, args=(name,
+                                  interval, done), name='profiler-java')
+        dumper.daemon = True
+        dumper.start()
+        try:
+            yield
+        finally:
+            done.set()
+            dumper.join()
+
+    def _dump_java(
+        self,
+        name,
+        interval,
+        done,
+        ):
+        # a dump stands for interval seconds of samples in the stacks
+
+        weight = max(1, int(round(interval / self.interval)))
+        dumps = 0
+        with codecs.open(self.prefix + '-threads.txt', 'a',
+                         encoding='utf-8') as f:
+            while not done.is_set():
+                dumps += 1
+                try:
+                    threads = _java_threads()
+                except:
+                    logging.error(traceback.format_exc())
+                    return
+                f.write(u'=== ' + name + u' dump ' + unicode(dumps)
+                        + u' at ' + time.strftime('%H:%M:%S') + u'\n')
+                with self.lock:
+                    for (thread, state, frames, elements) in threads:
+                        f.write(u'"' + thread + u'" ' + state + u'\n')
+                        for element in elements:
+                            f.write(u'\tat ' + unicode(element) + u'\n')
+                        f.write(u'\n')
+                        if state == 'RUNNABLE' and frames:
+                            stack = ['java: ' + thread] \
+                                + list(reversed(frames))
+                            self.stacks[';'.join(stack)] += weight
+                f.flush()
+                done.wait(interval)
+
+    def _sampled_stats(self):
+        cumulative = Counter()
+        own = Counter()
+        for (stack, count) in self.stacks.items():
+            frames = stack.split(';')[1:]
+            for frame in set(frames):
+                cumulative[frame] += count
+            if frames:
+                own[frames[-1]] += count
+        return (cumulative, own)
+
+    def write(self):
+        with codecs.open(self.prefix + '-stacks.txt', 'w',
+                         encoding='utf-8') as f:
+            for (stack, count) in sorted(self.stacks.items()):
+                f.write(stack + u' ' + unicode(count) + u'\n')
+
+        with codecs.open(self.prefix + '-profile.txt', 'w',
+                         encoding='utf-8') as f:
+            f.write(u'{:} profile, {:.3f} seconds, {:} samples every {:} s\n\n'.format(self.mode,
+                    self.seconds, self.samples, self.interval))
+            if self.profile is not None:
+                import pstats
+                stats = pstats.Stats(self.profile, stream=f)
+                stats.sort_stats('cumulative').print_stats()
+            else:
+                (cumulative, own) = self._sampled_stats()
+                f.write(u'{:>10} {:>10} {:>10}  function\n'.format('cumulative'
+                        , 'self', 'seconds'))
+                for (frame, count) in cumulative.most_common():
+                    f.write(u'{:>10} {:>10} {:>10.2f}  {:}\n'.format(count,
+                            own[frame], count * self.interval, frame))
+        logging.info('profile written to ' + self.prefix + '-profile.txt')
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# Structured progress. Next to the <permille> lines of progress.txt, a run
+# writes <name><collection>progress.jsonl, one JSON object per line:
+#
+#   {"stage": "tf-idf", "unit": "documents", "done": 1200, "total": 4000,
+#    "rate": 850.2, "eta": 3.3, "elapsed": 1.4, "state": "running",
+#    "time": 1381234567.8}
+#
+# A run goes through named stages (tokenize, import, tf-idf, train, ...),
+# each with its own count, rate (units per second since the stage began)
+# and ETA; total and eta are null where the amount of work is not known.
+# Each stage ends with a "finished" line, or a "cancelled" one if the run
+# was cancelled during it (see lib/cancel.py). advance() is called from hot
+# loops, once per document, so it only adds to a counter unless INTERVAL
+# seconds have passed since the last line was written.
+#
+# MALLET logs its sampling iterations ("<10> LL/token: -9.1") through
+# java.util.logging into progress.txt; watch_iterations() tails that file
+# on a thread while training runs and reports them as a stage.
+
+INTERVAL = 1.0
+
+ITERATION = re.compile(r'<(\d+)>')
+
+
+class Progress:
+
+    """
+    Stages, counts, rates and ETAs of a run, written as JSON lines
+    """
+
+    def __init__(self, filename, interval=INTERVAL):
+        self.filename = filename
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.file = None
+        self.stage = None
+        self.next_write = 0
+
+    def start(
+        self,
+        stage,
+        total=None,
+        unit='documents',
+        ):
+        """Begin stage (finishing the one before) of total units"""
+
+        with self.lock:
+            self._finish()
+            self.stage = {
+                'stage': stage,
+                'unit': unit,
+                'done': 0,
+                'total': total,
+                'started': time.time(),
+                }
+            self._write('running')
+
+    def advance(self, n=1):
+        with self.lock:
+            if self.stage is None:
+                return
+            self.stage['done'] += n
+            now = time.time()
+            if now >= self.next_write:
+                self._write('running', now)
+
+    def update(self, done, total=None):
+        """Set the units done (and the total) of the current stage"""
+
+        with self.lock:
+            if self.stage is None:
+                return
+            self.stage['done'] = done
+            if total is not None:
+                self.stage['total'] = total
+            now = time.time()
+            if now >= self.next_write:
+                self._write('running', now)
+
+    def finish(self):
+        with self.lock:
+            self._finish()
+
+    @contextmanager
+    def running(
+        self,
+        stage,
+        total=None,
+        unit='documents',
+        ):
+        """
+        The enclosed block as stage; if it raises, the stage is left for
+        cancel() or close() to end
+        """
+
+        self.start(stage, total, unit)
+        yield self
+        self.finish()
+
+    def cancel(self):
+        """End the current stage, if any, as cancelled"""
+
+        with self.lock:
+            if self.stage is None:
+                self.stage = {
+                    'stage': None,
+                    'unit': None,
+                    'done': 0,
+                    'total': None,
+                    'started': time.time(),
+                    }
+            self._write('cancelled')
+            self.stage = None
+
+    def close(self):
+        with self.lock:
+            self._finish()
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def _finish(self):
+        if self.stage is not None:
+            self._write('finished')
+            self.stage = None
+
+    def _write(self, state, now=None):
+        if now is None:
+            now = time.time()
+        stage = self.stage
+        elapsed = now - stage['started']
+        rate = (stage['done'] / elapsed if elapsed > 0 else None)
+        eta = None
+        if state == 'finished':
+            eta = 0.0
+        elif state == 'running' and rate and stage['total'] is not None:
+            eta = max(stage['total'] - stage['done'], 0) / rate
+        line = {
+            'stage': stage['stage'],
+            'unit': stage['unit'],
+            'done': stage['done'],
+            'total': stage['total'],
+            'rate': (round(rate, 2) if rate is not None else None),
+            'eta': (round(eta, 1) if eta is not None else None),
+            'elapsed': round(elapsed, 2),
+            'state': state,
+            'time': round(now, 2),
+            }
+        try:
+            if self.file is None:
+                self.file = open(self.filename, 'wb')
+            self.file.write(json.dumps(line, sort_keys=True) + '\n')
+            self.file.flush()
+        except (IOError, OSError):
+            pass
+        self.next_write = now + self.interval
+
+    @contextmanager
+    def watch_iterations(
+        self,
+        filename,
+        total,
+        stage='train',
+        ):
+        """
+        While the block runs, report the "<iteration>" lines MALLET
+        writes to filename as stage, of total iterations
+        """
+
+        self.start(stage, total, 'iterations')
+        stopped = threading.Event()
+
+        def read(f, position):
+            if os.path.exists(filename) and os.path.getsize(filename) \
+                < position:
+                position = 0
+            f.seek(position)
+            done = None
+            for line in f:
+                match = ITERATION.search(line)
+                if match is not None:
+                    done = int(match.group(1))
+            if done is not None:
+                self.update(done)
+            return f.tell()
+
+        def watch():
+            position = 0
+            while not os.path.exists(filename):
+                stopped.wait(self.interval)
+                if stopped.is_set():
+                    return
+            with open(filename, 'rb') as f:
+                while not stopped.is_set():
+                    position = read(f, position)
+                    stopped.wait(self.interval)
+                read(f, position)
+
+        thread = threading.Thread(target=watch, name='progress-'
+                                  + stage)
+        thread.daemon = True
+        thread.start()
+        try:
+            yield self
+        finally:
+            stopped.set()
+            thread.join()
+        self.finish()
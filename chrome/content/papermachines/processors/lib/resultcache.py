@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import json
+import codecs
+import shutil
+import hashlib
+import tempfile
+import logging
+
+# Finished visualizations are kept in out_dir/results/<fingerprint>/, where
+# the fingerprint covers everything a result is made from (processor, its
+# arguments, stoplist, metadata and the content hash of every text). A run
+# with the same fingerprint copies the stored files back under its own
+# output name instead of recomputing them. Entries are written to a
+# temporary directory and renamed into place, so only finished results are
+# ever found; the least recently used are evicted once the cache grows past
+# MAX_BYTES.
+#
+# Bump RESULT_VERSION whenever a change to the processors would make old
+# results wrong.
+
+RESULT_VERSION = 1
+
+MAX_BYTES = 256 * 1024 * 1024
+
+_entry_filename = 'result.json'
+
+# how a result's page and data file name its other files
+
+_reference = re.compile(r'''(\b(?:src|href)=(["']))([^"']*)(\2)''')
+
+
+def fingerprint(*parts):
+    return hashlib.md5(json.dumps([RESULT_VERSION] + list(parts),
+                       sort_keys=True)).hexdigest()
+
+
+def _stem(out_filename):
+    return os.path.splitext(os.path.basename(out_filename))[0]
+
+
+def _rename(name, old_stem, new_stem):
+    if name.startswith(old_stem):
+        return new_stem + name[len(old_stem):]
+    return name
+
+
+def _rewrite(
+    name,
+    contents,
+    old_stem,
+    new_stem,
+    ):
+    """
+    contents of name with its references to the result's other files
+    renamed -- src and href attributes, or a file list's chunks -- and
+    nothing else, so text that happens to contain the old name is kept
+    """
+
+    if name.endswith('.json'):
+        files = json.loads(contents)
+        files['chunks'] = [_rename(x, old_stem, new_stem) for x in
+                           files.get('chunks', [])]
+        return json.dumps(files)
+    return _reference.sub(lambda m: m.group(1) + _rename(m.group(3),
+                          old_stem, new_stem) + m.group(4), contents)
+
+
+class ResultCache:
+
+    """
+    Size-bounded store of finished outputs, keyed by fingerprint
+    """
+
+    def __init__(self, directory, max_bytes=MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _entry_dir(self, key):
+        return os.path.join(self.directory, key)
+
+    def restore(self, key, out_filename):
+        """
+        Copy the result stored under key to out_filename (and the files it
+        loads, next to it); returns False if there is none
+        """
+
+        entry_dir = self._entry_dir(key)
+        try:
+            with codecs.open(os.path.join(entry_dir, _entry_filename), 'r',
+                             encoding='utf-8') as f:
+                entry = json.load(f)
+        except (IOError, OSError, ValueError):
+            return False
+
+        out_dir = os.path.dirname(out_filename)
+        (old_stem, new_stem) = (entry['stem'], _stem(out_filename))
+        for name in entry['shared']:
+            target = os.path.join(out_dir, name)
+            if not os.path.exists(target):
+                shutil.copyfile(os.path.join(entry_dir, name), target)
+        for name in entry['files']:
+            source = os.path.join(entry_dir, name)
+            target = os.path.join(out_dir, _rename(name, old_stem,
+                                  new_stem))
+            if old_stem == new_stem or name not in entry['rewrite']:
+                shutil.copyfile(source, target)
+                continue
+
+            # the page, data file and file list name the other outputs
+
+            with codecs.open(source, 'r', encoding='utf-8') as f:
+                contents = f.read()
+            with codecs.open(target, 'w', encoding='utf-8') as f:
+                f.write(_rewrite(name, contents, old_stem, new_stem))
+        os.utime(entry_dir, None)
+        logging.info('restored result ' + key + ' from the result cache')
+        return True
+
+    def store(
+        self,
+        key,
+        out_filename,
+        files,
+        shared=(),
+        rewrite=(),
+        ):
+        """
+        Keep a finished result: files are named after out_filename, shared
+        files (e.g. DOC_METADATA) are used as they are, and rewrite lists
+        the files that refer to the others by name
+        """
+
+        entry_dir = self._entry_dir(key)
+        if os.path.exists(os.path.join(entry_dir, _entry_filename)):
+            return
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        tmp_dir = tempfile.mkdtemp(dir=self.directory, prefix=key + '.',
+                                   suffix='.tmp')
+        try:
+            names = []
+            for filename in list(files) + list(shared):
+                name = os.path.basename(filename)
+                shutil.copyfile(filename, os.path.join(tmp_dir, name))
+                names.append(name)
+            with codecs.open(os.path.join(tmp_dir, _entry_filename), 'w',
+                             encoding='utf-8') as f:
+                json.dump({
+                    'stem': _stem(out_filename),
+                    'files': names[:len(files)],
+                    'shared': names[len(files):],
+                    'rewrite': [os.path.basename(x) for x in rewrite],
+                    }, f)
+        except:
+            shutil.rmtree(tmp_dir, True)
+            raise
+
+        # another run may have stored the same result meanwhile
+
+        if os.path.exists(os.path.join(entry_dir, _entry_filename)):
+            shutil.rmtree(tmp_dir, True)
+            return
+        if os.path.exists(entry_dir):
+            shutil.rmtree(entry_dir)
+        os.rename(tmp_dir, entry_dir)
+        self.evict()
+
+    def _size(self, entry_dir):
+        return sum(os.path.getsize(os.path.join(entry_dir, name))
+                   for name in os.listdir(entry_dir))
+
+    def evict(self):
+        """Remove least recently used results until under max_bytes"""
+
+        entries = []
+        for name in os.listdir(self.directory):
+            entry_dir = os.path.join(self.directory, name)
+            if os.path.isdir(entry_dir) and not name.endswith('.tmp'):
+                entries.append((os.path.getmtime(entry_dir),
+                               self._size(entry_dir), entry_dir))
+        total = sum(size for (mtime, size, entry_dir) in entries)
+        for (mtime, size, entry_dir) in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            logging.info('evicting ' + os.path.basename(entry_dir)
+                         + ' from the result cache')
+            shutil.rmtree(entry_dir, True)
+            total -= size
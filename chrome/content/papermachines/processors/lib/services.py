@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+
+# Web services the processors call, each of which can be pointed somewhere
+# else with an environment variable -- a self-hosted Spotlight, a geonames
+# mirror, or the local stand-ins the network benchmarks start:
+#
+#   PAPERMACHINES_SPOTLIGHT_URL   DBpedia Spotlight's rest/annotate
+#   PAPERMACHINES_GEONAMES_URL    geonames searchJSON
+#   PAPERMACHINES_TRANSLATE_URL   a translation service taking text, from
+#                                 and to, answering with a JSON string;
+#                                 used instead of the Microsoft Translator
+#                                 client when set
+
+
+def environment_variable(name):
+    return 'PAPERMACHINES_' + name.upper() + '_URL'
+
+
+def service_url(name, default=None):
+    """The URL to use for service name: from the environment, or default"""
+
+    return os.environ.get(environment_variable(name)) or default
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import logging
+import threading
+from atomicfile import FileLock
+
+# Stems outlive runs: <out_dir>/stems/<language>.txt holds one "word<TAB>
+# stem" line for every word stemmed so far in that language, by any
+# processor, so stemming the same library again asks the snowball stemmer
+# almost nothing. The file is read the first time a word is looked up, and
+# new stems are appended to it by save() at the end of a run, under a file
+# lock, as runs in other processes (under Jython or CPython) may append to
+# it too. A line cut short by a crash has no newline; it is skipped, and
+# cut off before the next save appends anything.
+#
+# At most LIMIT words are kept, in memory and on disk. Words are added in
+# the order they are first met, so the frequent ones are nearly always
+# among them; past the limit, words are stemmed every time as before.
+
+FORMAT_VERSION = 1
+
+HEADER = '#stems ' + str(FORMAT_VERSION) + '\n'
+
+LIMIT = 500000
+
+
+def cache_filename(out_dir, lang):
+    return os.path.join(out_dir, 'stems', lang + '.txt')
+
+
+class StemCache:
+
+    """
+    Word -> stem for one language, kept on disk between runs
+    """
+
+    def __init__(self, filename, limit=LIMIT):
+        self.filename = filename
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.stems = None
+        self.new = []
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self):
+        stems = {}
+        try:
+            if os.path.exists(self.filename):
+                with open(self.filename, 'rb') as f:
+                    if f.readline() != HEADER:
+                        logging.info('stem cache ' + self.filename
+                                     + ' is from another version -- starting over')
+                        f.close()
+                        os.remove(self.filename)
+                    else:
+                        for line in f:
+                            if len(stems) >= self.limit \
+                                or not line.endswith('\n'):
+                                break
+                            (word, tab, stem) = \
+                                line[:-1].decode('utf-8').partition(u'\t')
+                            if tab:
+                                stems[word] = stem
+        except (IOError, OSError, UnicodeDecodeError):
+            logging.error('stem cache ' + self.filename
+                          + ' could not be read -- starting over')
+            stems = {}
+        self.stems = stems
+
+    def get(self, word):
+        """The cached stem of word, or None"""
+
+        if self.stems is None:
+            with self.lock:
+                if self.stems is None:
+                    self._load()
+        stem = self.stems.get(word)
+        if stem is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return stem
+
+    def put(self, word, stem):
+        with self.lock:
+            if len(self.stems) >= self.limit or word in self.stems:
+                return
+            self.stems[word] = stem
+            self.new.append(word)
+
+    def save(self):
+        """Append the stems added since the last save"""
+
+        with self.lock:
+            if not self.new:
+                return
+            directory = os.path.dirname(self.filename)
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            with FileLock(self.filename):
+                if os.path.exists(self.filename):
+                    _drop_partial_line(self.filename)
+                if not os.path.exists(self.filename) \
+                    or os.path.getsize(self.filename) == 0:
+                    with open(self.filename, 'wb') as f:
+                        f.write(HEADER)
+                with open(self.filename, 'ab') as f:
+                    f.write(u''.join(word + u'\t' + self.stems[word]
+                            + u'\n' for word in self.new).encode('utf-8'))
+            self.new = []
+
+
+def _drop_partial_line(filename):
+    """Cut off a last line left unfinished by a run that died writing it"""
+
+    with open(filename, 'r+b') as f:
+        f.seek(0, 2)
+        size = f.tell()
+        f.seek(max(size - 4096, 0))
+        tail = f.read()
+        if tail.endswith('\n'):
+            return
+        f.truncate(size - len(tail) + tail.rfind('\n') + 1)
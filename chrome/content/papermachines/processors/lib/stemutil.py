@@ -1,15 +1,24 @@
 #!/usr/bin/env python
 import os
-from java.lang import Class
-from classpath import classPathHacker
+import threading
+from itertools import izip
+from stemcache import StemCache, cache_filename
+import parallel
 
 
-# This function wraps the snowball stemmer library
-# http://snowball.tartarus.org/dist/libstemmer_java.tgz
+# Stemming uses the snowball stemmers (http://snowball.tartarus.org/),
+# from whichever backend this interpreter has:
 #
+#   SnowballJar    snowball.jar, the Java stemmers, under Jython; built from
+#                  http://snowball.tartarus.org/dist/libstemmer_java.tgz with
+#                  javac org/tartarus/snowball/*.java org/tartarus/snowball/ext/*.java
+#                  jar -cvf snowball.jar org
+#   PyStemmer      the C stemmers' Python binding (pip install PyStemmer),
+#                  under CPython
+#   NltkSnowball   NLTK's Python port of the same algorithms, under CPython
 #
-# javac org/tartarus/snowball/*.java org/tartarus/snowball/ext/*.java
-# jar -cvf snowball.jar org
+# The first in BACKENDS that loads and knows the language is used. They
+# implement the same algorithms, so they share the stem cache.
 
 iso639_1 = {
     'ru': 'russian',
@@ -30,25 +39,183 @@ iso639_1 = {
 
 stem_languages = set(iso639_1.values())
 
-stemmers = {lang : None for lang in stem_languages}
+# snowball stemmers keep the word being stemmed as state, so each thread
+# gets its own
+
+_local = threading.local()
+
+# stems already found, by output directory and language, kept between runs;
+# see stemcache.py
+
+_caches = {}
+_caches_lock = threading.Lock()
 
-def stem(caller, word):
-    global stemmers
 
+def _language(caller):
     lang_code = getattr(caller, "lang", "en")
     if lang_code in iso639_1:
-        lang = iso639_1[lang_code]
+        return iso639_1[lang_code]
     elif lang_code in stem_languages:
-        lang = lang_code
+        return lang_code
+
+
+def stem_cache(caller):
+    """The stem cache for caller's output directory and language"""
+
+    key = (getattr(caller, "out_dir", None), _language(caller))
+    if None in key:
+        return None
+    cache = _caches.get(key)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(key)
+            if cache is None:
+                cache = _caches[key] = StemCache(cache_filename(*key))
+    return cache
+
+
+def save_stems():
+    """Write out the stems found since the last call"""
+
+    for cache in _caches.values():
+        cache.save()
+
+
+class SnowballJar:
+
+    """
+    The Java snowball stemmers in lib/snowball.jar; Jython only
+    """
+
+    def __init__(self, caller, lang):
+        from java.lang import Class
+        from classpath import classPathHacker
 
-    if stemmers.get(lang) is None:
         jarLoad = classPathHacker()
         snowballPath = os.path.join(caller.cwd, "lib", "snowball.jar")
         jarLoad.addFile(snowballPath)
 
         stemClass = Class.forName("org.tartarus.snowball.ext." + lang + "Stemmer")
-        stemmer = stemClass.newInstance()
-        stemmers[lang] = stemmer
-    stemmers[lang].setCurrent(word)
-    stemmers[lang].stem()
-    return stemmers[lang].getCurrent()
+        self.stemmer = stemClass.newInstance()
+
+    def stem_words(self, words):
+
+        # Stemming a word is three calls into Java, each paying Jython's
+        # overhead for finding the method and converting its arguments;
+        # the methods are looked up once for the whole batch
+
+        stemmer = self.stemmer
+        (set_current, run, get_current) = (stemmer.setCurrent,
+                stemmer.stem, stemmer.getCurrent)
+        stems = []
+        for word in words:
+            set_current(word)
+            run()
+            stems.append(get_current())
+        return stems
+
+
+class PyStemmer:
+
+    """
+    The C snowball stemmers, through PyStemmer
+    """
+
+    def __init__(self, caller, lang):
+        import Stemmer
+        self.stemmer = Stemmer.Stemmer(lang)
+
+    def stem_words(self, words):
+        return self.stemmer.stemWords(words)
+
+
+class NltkSnowball:
+
+    """
+    NLTK's snowball stemmers
+    """
+
+    def __init__(self, caller, lang):
+        from nltk.stem.snowball import SnowballStemmer
+        self.stemmer = SnowballStemmer(lang)
+
+    def stem_words(self, words):
+        stem_word = self.stemmer.stem
+        return [stem_word(word) for word in words]
+
+
+BACKENDS = [SnowballJar, PyStemmer, NltkSnowball]
+
+
+def _load_stemmer(caller, lang):
+    for backend in BACKENDS:
+
+        # a backend this interpreter lacks fails to import; PyStemmer and
+        # NLTK refuse languages they don't have with KeyError and ValueError
+
+        try:
+            return backend(caller, lang)
+        except (ImportError, KeyError, ValueError):
+            continue
+    raise ValueError('no snowball stemmer for ' + str(lang)
+                     + ' -- install PyStemmer or NLTK, or run under Jython')
+
+
+def _stemmer(caller):
+    stemmers = getattr(_local, 'stemmers', None)
+    if stemmers is None:
+        stemmers = _local.stemmers = {}
+
+    lang = _language(caller)
+
+    if stemmers.get(lang) is None:
+        stemmers[lang] = _load_stemmer(caller, lang)
+    return stemmers[lang]
+
+
+def stem(caller, word):
+    cache = stem_cache(caller)
+    if cache is not None:
+        stemmed = cache.get(word)
+        if stemmed is not None:
+            return stemmed
+
+    stemmed = _stemmer(caller).stem_words([word])[0]
+    if cache is not None:
+        cache.put(word, stemmed)
+    return stemmed
+
+
+# stem_words() takes a whole vocabulary at once: the stem cache answers
+# what it can, and the rest is stemmed in batches of BATCH words, each a
+# single call to the backend, the batches spread over worker threads (each
+# with its own stemmers).
+
+BATCH = 2000
+
+
+def _stem_batch(caller, words):
+    return _stemmer(caller).stem_words(words)
+
+
+def stem_words(caller, words, workers=1):
+    """
+    Stems of words (distinct ones, in caller's language), in the same
+    order, stemming those not already cached in batches on workers threads
+    """
+
+    cache = stem_cache(caller)
+    if cache is None:
+        stems = [None] * len(words)
+    else:
+        stems = [cache.get(word) for word in words]
+    missing = [i for (i, stemmed) in enumerate(stems) if stemmed is None]
+    batches = [missing[k:k + BATCH] for k in range(0, len(missing), BATCH)]
+    results = parallel.imap(lambda batch: _stem_batch(caller, [words[i]
+                            for i in batch]), batches, workers)
+    for (batch, batch_stems) in izip(batches, results):
+        for (i, stemmed) in izip(batch, batch_stems):
+            stems[i] = stemmed
+            if cache is not None:
+                cache.put(words[i], stemmed)
+    return stems
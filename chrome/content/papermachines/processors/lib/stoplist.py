@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import codecs
+import hashlib
+
+# stoplists already read by this interpreter, keyed by path; a long-lived
+# processor server reuses them until the file changes on disk
+
+_cache = {}
+
+
+class Stoplist(frozenset):
+
+    """
+    Compiled stoplist: a hashed set of words, with a fingerprint of its
+    contents that caches record to know which stoplist filtered them
+    """
+
+    def __new__(cls, words=()):
+        self = frozenset.__new__(cls, words)
+        digest = hashlib.md5()
+        for word in sorted(self):
+            digest.update(word.encode('utf-8') + '\n')
+        self.fingerprint = digest.hexdigest()
+        return self
+
+    def keep_term(self, term):
+        """True if no word of an n-gram is a stopword or non-alphabetic"""
+
+        for word in term.split():
+            if word in self or not word.isalpha():
+                return False
+        return True
+
+    def mask(self, vocab, mask=None):
+        """
+        One flag per term ID of vocab (1 = keep), so rows of term IDs can be
+        filtered without looking words up; an existing mask is extended to
+        cover terms added since it was made
+        """
+
+        if mask is None:
+            mask = bytearray()
+        keep_term = self.keep_term
+        mask.extend((1 if keep_term(term) else 0) for term in
+                    vocab[len(mask):])
+        return mask
+
+
+def load_stoplist(filename):
+    """
+    Read a stoplist file (the language list followed by the user's own
+    words), compiling it once per interpreter until the file changes
+    """
+
+    mtime = os.path.getmtime(filename)
+    cached = _cache.get(filename)
+    if cached is None or cached[0] != mtime:
+        with codecs.open(filename, 'r', encoding='utf-8') as f:
+            words = [x.strip() for x in f if x.strip() != '']
+        cached = (mtime, Stoplist(words))
+        _cache[filename] = cached
+    return cached[1]
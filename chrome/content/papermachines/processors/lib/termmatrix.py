@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import codecs
+import array
+import logging
+from contextlib import contextmanager
+from itertools import imap as serial_imap, izip
+from arrayfile import ArrayFile, TYPECODE
+from tokenstore import file_signature
+from atomicfile import atomic_write, FileLock
+
+# A term matrix holds the n-gram counts of every document in a collection
+# in compressed sparse row form: row r covers indices[indptr[r]:indptr[r+1]]
+# (term IDs, lines of vocab.txt) and the matching slice of data (counts).
+# docs.json maps each text to its row and the signature (mtime/size or
+# content hash) it was counted from. Changed texts get a new row appended; the old one is left behind
+# until enough rows are dead to make rewriting the matrix worthwhile.
+# Counts leave out n-grams containing stopwords, so docs.json also records
+# a fingerprint of what the counts were made from (the stoplist); if it
+# changes, every row is recounted (from the token store, so nothing is
+# re-tokenized). Rows need not be files: daily totals use one row per day,
+# with a fingerprint of the document rows they were summed from.
+#
+# Rows are added only inside writing(), which runs take turns at; reading
+# a matrix takes no lock, and ignores whatever lies past what docs.json
+# accounts for.
+
+FORMAT_VERSION = 1
+
+
+def matrix_dir(
+    out_dir,
+    collection,
+    n=1,
+    stemming=False,
+    ):
+    name = collection + '-' + ('stemmed' if stemming else '') + str(n) \
+        + 'grams'
+    return os.path.join(out_dir, 'termmatrix', name)
+
+
+class TermMatrix:
+
+    """
+    Sparse document-term count matrix for one collection, n and stemming
+    """
+
+    def __init__(
+        self,
+        directory,
+        source=None,
+        signature=file_signature,
+        ):
+        self.directory = directory
+        self.source = source
+        self.signature = signature
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.vocab_filename = os.path.join(directory, 'vocab.txt')
+        self.docs_filename = os.path.join(directory, 'docs.json')
+        self.indptr_file = ArrayFile(os.path.join(directory, 'indptr.bin'))
+        self.indices = ArrayFile(os.path.join(directory, 'indices.bin'))
+        self.data = ArrayFile(os.path.join(directory, 'data.bin'))
+        self.vocab = []
+        self.term_ids = {}
+        self.docs = {}
+        self.indptr = array.array(TYPECODE, [0])
+        self._load()
+
+    def _load(self):
+        self.close()
+        self._reset()
+        if not os.path.exists(self.docs_filename):
+            return
+        try:
+            with codecs.open(self.docs_filename, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get('version') != FORMAT_VERSION:
+                return
+            if index.get('source') != self.source:
+                logging.info('counts out of date -- rebuilding term matrix in '
+                              + self.directory)
+                return
+            with codecs.open(self.vocab_filename, 'r', encoding='utf-8') as f:
+                vocab = [line.rstrip(u'\n') for line in f]
+            if len(vocab) < index['vocab']:
+                raise ValueError('term matrix vocabulary is missing terms')
+            indptr = self.indptr_file.read(0, index['rows'] + 1)
+            self.vocab = vocab[:index['vocab']]
+            self.indptr = indptr
+            self.term_ids = dict((term, i) for (i, term) in
+                                 enumerate(self.vocab))
+            self.saved_vocab = len(self.vocab)
+            self.docs = index['docs']
+        except:
+            logging.error('term matrix in ' + self.directory
+                          + ' could not be read -- rebuilding')
+            self._reset()
+
+    def _reset(self):
+        self.vocab = []
+        self.term_ids = {}
+        self.docs = {}
+        self.saved_vocab = 0
+        self.indptr = array.array(TYPECODE, [0])
+
+    def _discard_unsaved(self):
+        """
+        Drop anything past what docs.json accounts for, written by a run
+        that never finished saving (or all of it, if docs.json couldn't
+        be used)
+        """
+
+        self.close()
+        self.indptr_file.truncate(self.rows + 1)
+        if len(self.indptr_file) == 0:
+            self.indptr_file.append(array.array(TYPECODE, [0]))
+        self.indices.truncate(self.indptr[-1])
+        self.data.truncate(self.indptr[-1])
+        lines = 0
+        if os.path.exists(self.vocab_filename):
+            with codecs.open(self.vocab_filename, 'r', encoding='utf-8') as f:
+                lines = sum(1 for line in f)
+        if lines != len(self.vocab) or lines == 0:
+            with atomic_write(self.vocab_filename) as f:
+                for term in self.vocab:
+                    f.write(term + u'\n')
+
+    @contextmanager
+    def writing(self):
+        """
+        Add rows in the block, saved when it ends: the matrix is locked
+        and reloaded first, as runs that held the lock meanwhile left it
+        """
+
+        with FileLock(self.docs_filename):
+            self._load()
+            self._discard_unsaved()
+            yield self
+            self.save()
+
+    @property
+    def rows(self):
+        return len(self.indptr) - 1
+
+    def is_current(self, filename):
+        entry = self.docs.get(filename)
+        if entry is None or not os.path.exists(filename):
+            return False
+        return entry[1:3] == self.signature(filename)
+
+    def stale(self, filenames):
+        return [x for x in filenames if os.path.exists(x)
+                and not self.is_current(x)]
+
+    def row(self, filename):
+        """Term IDs and counts of one document, as parallel arrays"""
+
+        r = self.docs[filename][0]
+        start = self.indptr[r]
+        length = self.indptr[r + 1] - start
+        return (self.indices.read(start, length), self.data.read(start,
+                length))
+
+    def row_dict(self, filename, keep=None):
+        (indices, counts) = self.row(filename)
+        vocab = self.vocab
+        if keep is None:
+            return dict((vocab[i], c) for (i, c) in izip(indices,
+                        counts))
+        return dict((vocab[i], c) for (i, c) in izip(indices, counts)
+                    if keep[i])
+
+    def append(
+        self,
+        filename,
+        freqs,
+        signature=None,
+        ):
+        """Add (or replace) the row for filename from a term: count dict"""
+
+        if signature is None:
+            signature = self.signature(filename)
+        indices = array.array(TYPECODE)
+        counts = array.array(TYPECODE)
+        term_ids = self.term_ids
+        for (term, count) in freqs.iteritems():
+            i = term_ids.get(term)
+            if i is None:
+                i = len(self.vocab)
+                term_ids[term] = i
+                self.vocab.append(term)
+            indices.append(i)
+            counts.append(count)
+        self.indices.append(indices)
+        self.data.append(counts)
+        end = self.indptr[-1] + len(indices)
+        self.indptr.append(end)
+        self.indptr_file.append(array.array(TYPECODE, [end]))
+        self.docs[filename] = [self.rows - 1] + signature
+
+    def update(
+        self,
+        filenames,
+        count_func,
+        progress=None,
+        imap=None,
+        ):
+        """
+        Count any new or changed texts with count_func and save; counting
+        may run on worker threads (imap), rows are appended in order
+        """
+
+        if imap is None:
+            imap = serial_imap
+        if len(self.stale(filenames)) == 0:
+            return 0
+        with self.writing():
+            stale = self.stale(filenames)
+            for (filename, freqs) in izip(stale, imap(count_func,
+                    stale)):
+                self.append(filename, freqs)
+                if progress is not None:
+                    progress()
+            if self.rows > 2 * len(self.docs) + 100:
+                self.compact()
+        if len(stale) > 0:
+            logging.info('term matrix updated: {:} of {:} texts counted'.format(len(stale),
+                         len(filenames)))
+        return len(stale)
+
+    def compact(self):
+        """Rewrite the matrix without the rows of replaced documents"""
+
+        logging.info('compacting term matrix in ' + self.directory)
+        rows = [(filename, self.row(filename)) for filename in
+                self.docs.keys()]
+        signatures = dict((filename, entry[1:3]) for (filename, entry) in
+                          self.docs.iteritems())
+        self.close()
+        os.remove(self.docs_filename)
+        for f in (self.indptr_file, self.indices, self.data):
+            os.remove(f.filename)
+        self.indptr = array.array(TYPECODE, [0])
+        self.indptr_file.append(self.indptr)
+        self.docs = {}
+        for (filename, (indices, counts)) in rows:
+            self.indices.append(indices)
+            self.data.append(counts)
+            end = self.indptr[-1] + len(indices)
+            self.indptr.append(end)
+            self.indptr_file.append(array.array(TYPECODE, [end]))
+            self.docs[filename] = [self.rows - 1] + signatures[filename]
+
+    def save(self):
+        for f in (self.indptr_file, self.indices, self.data):
+            f.flush()
+        with codecs.open(self.vocab_filename, 'a', encoding='utf-8') as f:
+            for term in self.vocab[self.saved_vocab:]:
+                f.write(term + u'\n')
+        self.saved_vocab = len(self.vocab)
+        with atomic_write(self.docs_filename) as f:
+            json.dump({
+                'version': FORMAT_VERSION,
+                'source': self.source,
+                'rows': self.rows,
+                'vocab': len(self.vocab),
+                'docs': self.docs,
+                }, f)
+
+    def close(self):
+        for f in (self.indptr_file, self.indices, self.data):
+            f.close()
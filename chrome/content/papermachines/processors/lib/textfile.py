@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import codecs
+import bisect
+
+# Extracted texts can be whole books (scanned PDFs of tens of megabytes),
+# too big to read into a string on a 1 GB heap more than once or twice.
+# A TextFile reads one a piece at a time: streamed for tokenizing (see
+# lib/tokenizer.py) or splitting, or sliced by character offset for context
+# windows around places the geoparser found.
+#
+# Slicing needs the byte position of a character, which UTF-8 doesn't give
+# without decoding everything before it, so the first slice walks the file
+# once, cutting it at character boundaries into pieces of about READ_SIZE
+# bytes, and keeps the character and byte offset where each piece starts.
+# A slice then seeks to the piece it starts in and decodes only the pieces
+# it covers; the last few decoded pieces are kept, since contexts are
+# usually asked for close together. (Jython has no mmap module, so seek and
+# read stand in for memory mapping.)
+
+READ_SIZE = 65536
+
+CACHED_PIECES = 4
+
+
+def _is_continuation(byte):
+    return 0x80 <= ord(byte) < 0xC0
+
+
+class TextFile:
+
+    """
+    A UTF-8 text on disk, streamed or sliced by character offset without
+    being read whole
+    """
+
+    def __init__(self, filename, errors='strict'):
+        self.filename = filename
+        self.errors = errors
+        self.starts = None
+        self.pieces = None
+        self.length = None
+        self.cache = {}
+
+    def open(self):
+        """The text as a stream of unicode, for Tokenizer.spans and such"""
+
+        return codecs.open(self.filename, 'r', encoding='utf-8',
+                           errors=self.errors)
+
+    def chunks(self, size=READ_SIZE):
+        with self.open() as f:
+            while True:
+                chunk = f.read(size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def spans(self, tokenizer):
+        """(token, start, end) for each token of the text"""
+
+        with self.open() as f:
+            for span in tokenizer.spans(f):
+                yield span
+
+    def split(self, separator):
+        """Like text.split(separator), a part at a time"""
+
+        overlap = len(separator) - 1
+        pending = []
+        for chunk in self.chunks():
+
+            # a separator may straddle two chunks
+
+            if pending and overlap:
+                chunk = pending[-1][-overlap:] + chunk
+                pending[-1] = pending[-1][:-overlap]
+            parts = chunk.split(separator)
+            if len(parts) == 1:
+                pending.append(parts[0])
+                continue
+            yield u''.join(pending) + parts[0]
+            for part in parts[1:-1]:
+                yield part
+            pending = [parts[-1]]
+        yield u''.join(pending)
+
+    def _index(self):
+        if self.starts is not None:
+            return
+        starts = []
+        pieces = []
+        offset = 0
+        length = 0
+        size = os.path.getsize(self.filename)
+        with open(self.filename, 'rb') as f:
+            rest = ''
+            while offset < size:
+                data = rest + f.read(READ_SIZE)
+                cut = len(data)
+                if offset + cut < size:
+
+                    # end the piece before its last character, which may
+                    # be incomplete
+
+                    cut -= 1
+                    while cut > 0 and _is_continuation(data[cut]):
+                        cut -= 1
+                    if cut == 0:
+                        rest = data
+                        continue
+                (piece, rest) = (data[:cut], data[cut:])
+                starts.append(length)
+                pieces.append((offset, len(piece)))
+                length += len(piece.decode('utf-8', self.errors))
+                offset += len(piece)
+        self.starts = starts
+        self.pieces = pieces
+        self.length = length
+
+    def _piece(self, i):
+        text = self.cache.get(i)
+        if text is None:
+            (offset, size) = self.pieces[i]
+            with open(self.filename, 'rb') as f:
+                f.seek(offset)
+                text = f.read(size).decode('utf-8', self.errors)
+            if len(self.cache) >= CACHED_PIECES:
+                self.cache.clear()
+            self.cache[i] = text
+        return text
+
+    def __len__(self):
+        self._index()
+        return self.length
+
+    def __getitem__(self, key):
+        """text[i] or text[start:end]"""
+
+        self._index()
+        if isinstance(key, slice):
+            (start, end, step) = key.indices(self.length)
+            if step != 1:
+                raise ValueError('slices of a TextFile take no step')
+        else:
+            if key < 0:
+                key += self.length
+            if not 0 <= key < self.length:
+                raise IndexError('TextFile index out of range')
+            (start, end) = (key, key + 1)
+        if end <= start:
+            return u''
+        i = bisect.bisect_right(self.starts, start) - 1
+        parts = []
+        while i < len(self.starts) and self.starts[i] < end:
+            piece_start = self.starts[i]
+            text = self._piece(i)
+            parts.append(text[max(start - piece_start, 0):end
+                         - piece_start])
+            i += 1
+        return u''.join(parts)
+
+    def __getslice__(self, start, end):
+
+        # Python 2 passes simple slices here, negative indices already
+        # counted back from len(self)
+
+        return self.__getitem__(slice(max(start, 0), max(end, 0)))
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import re
+
+# The one tokenizer. A rule is a regular expression matching a run of
+# characters of one class, so a token is a maximal run; strip, if given,
+# removes characters from inside each token afterwards. Tokens come with
+# their character offsets in the text.
+#
+# A stream is read CHUNK_SIZE characters at a time and only ever matched
+# a chunk at a time: a token running into the end of a chunk is held back
+# in pieces and joined with its continuation at the start of the next, so
+# a document is never read whole, lowercased whole or copied whole, and a
+# very long token costs no more than a short one. Lowercasing is done per
+# token, before strip.
+#
+# The rules share the machinery, not the splitting: each gives the tokens
+# its processors have always had.
+#
+#   NGRAMS   n-gram counting and the token store: words are separated by
+#            spaces only, and everything else but word characters --
+#            punctuation, but also line breaks and tabs -- is dropped from
+#            them ("don't" -> "dont", "brown\nfox" -> "brownfox"), as
+#            re.sub(r"[^\w ]+", u"", text).split() did
+#   WORDS    MALLET import: any character but a word character separates
+#            words ("don", "t"; "brown", "fox"), as
+#            re.sub(r"[^\w ]+", u" ", text).split() did
+#
+# The geodict parser keeps case and uses its own separators; see
+# lib/geodict/geodict_lib.py.
+
+CHUNK_SIZE = 65536
+
+
+class Tokenizer:
+
+    """
+    Tokens, with their character offsets, of a text or a stream
+    """
+
+    def __init__(
+        self,
+        pattern,
+        strip=None,
+        lowercase=True,
+        chunk_size=CHUNK_SIZE,
+        ):
+        self.pattern = re.compile(pattern, re.UNICODE)
+        self.strip = (re.compile(strip, re.UNICODE) if strip is not None
+                      else None)
+        self.lowercase = lowercase
+        self.chunk_size = chunk_size
+
+    def _token(self, token):
+        if self.lowercase:
+            token = token.lower()
+        if self.strip is not None:
+            token = self.strip.sub(u'', token)
+        return token
+
+    def spans(self, source):
+        """
+        (token, start, end) for each token of source, a unicode string or
+        a file-like object read(size) returns unicode from
+        """
+
+        if isinstance(source, basestring):
+            for match in self.pattern.finditer(source):
+                token = self._token(match.group())
+                if token:
+                    yield (token, match.start(), match.end())
+            return
+
+        pending = []
+        pending_start = 0
+        offset = 0
+        while True:
+            chunk = source.read(self.chunk_size)
+            if not chunk:
+                break
+            size = len(chunk)
+            found = []
+            carried = False
+            for match in self.pattern.finditer(chunk):
+                (start, end) = match.span()
+                if pending and start > 0:
+                    found.append((u''.join(pending), pending_start,
+                                 offset))
+                    pending = []
+                if pending or end == size:
+                    if not pending:
+                        pending_start = offset + start
+                    pending.append(match.group())
+                    if end == size:
+                        carried = True
+                        break
+                    found.append((u''.join(pending), pending_start,
+                                 offset + end))
+                    pending = []
+                    continue
+                found.append((match.group(), offset + start, offset
+                             + end))
+            if pending and not carried:
+                found.append((u''.join(pending), pending_start, offset))
+                pending = []
+            offset += size
+            for (token, start, end) in found:
+                token = self._token(token)
+                if token:
+                    yield (token, start, end)
+        if pending:
+            token = self._token(u''.join(pending))
+            if token:
+                yield (token, pending_start, offset)
+
+    def words(self, source):
+        """The tokens of source, as a list"""
+
+        return [token for (token, start, end) in self.spans(source)]
+
+
+NGRAMS = Tokenizer(r'[^ ]+', strip=r'\W+')
+
+WORDS = Tokenizer(r'\w+')
@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import codecs
+import array
+import logging
+from itertools import imap as serial_imap, izip
+from arrayfile import ArrayFile, TYPECODE
+from tokenizer import NGRAMS
+from atomicfile import atomic_write, temp_filename, replace, FileLock
+
+# A token store holds every extracted text of a collection once, already
+# tokenized: vocab.txt maps line numbers (token IDs) to words, tokens.bin is
+# a flat array of token IDs for all documents, and docs.json records where
+# each document's tokens start, how many there are, and the signature of
+# the text they were read from (its mtime/size, or a content hash from the
+# corpus manifest). A changed text's tokens are appended; its old ones are
+# left behind until they make up half the file, when it is rewritten.
+# docs.json also records how many tokens and words it accounts for, and
+# anything past that -- left by a run that never finished saving -- is
+# ignored, and dropped by the next update. Runs updating the same store
+# take turns; as tokens are only ever added past what docs.json refers
+# to, a run reading the store meanwhile is never disturbed (compaction
+# aside, which replaces the file).
+
+FORMAT_VERSION = 2
+
+
+def tokenize(source):
+    """
+    Words of source, a text or an open file, the way n-gram counting
+    always has; see lib/tokenizer.py
+    """
+
+    return NGRAMS.words(source)
+
+
+def store_dir(out_dir, collection):
+    return os.path.join(out_dir, 'tokens', collection)
+
+
+def file_signature(filename):
+    st = os.stat(filename)
+    return [int(st.st_mtime), st.st_size]
+
+
+class TokenStore:
+
+    """
+    Integer-encoded tokens for every document in a collection
+    """
+
+    def __init__(self, directory, signature=file_signature):
+        self.directory = directory
+        self.signature = signature
+        self.vocab_filename = os.path.join(directory, 'vocab.txt')
+        self.tokens_filename = os.path.join(directory, 'tokens.bin')
+        self.docs_filename = os.path.join(directory, 'docs.json')
+        self.tokens = ArrayFile(self.tokens_filename)
+        self.tokens_added = 0
+        self.bytes_read = 0
+        self._load()
+
+    def _load(self):
+        self.close()
+        self.vocab = []
+        self.word_ids = {}
+        self.docs = {}
+        self.size = 0
+        if not os.path.exists(self.docs_filename):
+            return
+        try:
+            with codecs.open(self.docs_filename, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get('version') != FORMAT_VERSION:
+                return
+            with codecs.open(self.vocab_filename, 'r', encoding='utf-8') as f:
+                vocab = [line.rstrip(u'\n') for line in f]
+            if len(vocab) < index['vocab'] or len(self.tokens) \
+                < index['tokens']:
+                raise ValueError('token store is missing data')
+            self.vocab = vocab[:index['vocab']]
+            self.word_ids = dict((word, i) for (i, word) in
+                                 enumerate(self.vocab))
+            self.docs = index['docs']
+            self.size = index['tokens']
+        except:
+            logging.error('token store in ' + self.directory
+                          + ' could not be read -- rebuilding')
+            self.vocab = []
+            self.word_ids = {}
+            self.docs = {}
+
+    def is_current(self, filename):
+        entry = self.docs.get(filename)
+        if entry is None or not os.path.exists(filename):
+            return False
+        return entry[2:4] == self.signature(filename)
+
+    def stale(self, filenames):
+        return [x for x in filenames if os.path.exists(x)
+                and not self.is_current(x)]
+
+    def close(self):
+        self.tokens.close()
+
+    def doc_ids(self, filename):
+        """Token IDs of one document, read straight from the token file"""
+
+        (start, length) = self.docs[filename][0:2]
+        return self.tokens.read(start, length)
+
+    def doc_words(self, filename):
+        vocab = self.vocab
+        return [vocab[i] for i in self.doc_ids(filename)]
+
+    def doc_length(self, filename):
+        return self.docs[filename][1]
+
+    def encode(self, words):
+        ids = array.array(TYPECODE)
+        word_ids = self.word_ids
+        for word in words:
+            i = word_ids.get(word)
+            if i is None:
+                i = len(self.vocab)
+                word_ids[word] = i
+                self.vocab.append(word)
+            ids.append(i)
+        return ids
+
+    def update(
+        self,
+        filenames,
+        progress=None,
+        imap=None,
+        ):
+        """
+        Bring the store up to date for filenames, tokenizing only texts
+        that are new or changed and appending their tokens
+        """
+
+        if len(self.stale(filenames)) == 0:
+            return 0
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        with FileLock(self.docs_filename) as lock:
+
+            # another run may have brought the store up to date while
+            # this one waited for it
+
+            self._load()
+
+            # drop what a run that never finished saving appended (or, if
+            # the store couldn't be read, everything)
+
+            self.tokens.truncate(self.size)
+            stale = []
+            seen = set()
+            for filename in self.stale(filenames):
+                if filename not in seen:
+                    seen.add(filename)
+                    stale.append(filename)
+            if len(stale) == 0:
+                return 0
+            wanted = set(filenames)
+            for filename in self.docs.keys():
+                if filename not in wanted and not self.is_current(filename):
+                    del self.docs[filename]
+
+            # reading and tokenizing may run on worker threads (imap);
+            # words are encoded here, in document order, so IDs stay
+            # stable
+
+            def read_words(filename):
+                if not os.path.exists(filename):
+                    return None
+                with codecs.open(filename, 'r', encoding='utf-8',
+                                 errors='ignore') as f:
+                    return tokenize(f)
+
+            if imap is None:
+                imap = serial_imap
+            tokenized = 0
+            for (filename, words) in izip(stale, imap(read_words, stale)):
+                if words is not None:
+                    signature = self.signature(filename)
+                    ids = self.encode(words)
+                    self.tokens.append(ids)
+                    self.docs[filename] = [self.size, len(ids)] + signature
+                    self.size += len(ids)
+                    self.tokens_added += len(ids)
+                    self.bytes_read += os.path.getsize(filename)
+                    tokenized += 1
+                lock.refresh()
+                if progress is not None:
+                    progress()
+            if self.size > 2 * sum(entry[1] for entry in
+                                   self.docs.itervalues()):
+                self.compact()
+            self.save()
+        logging.info('token store updated: {:} of {:} texts tokenized, {:} words in vocabulary'.format(
+            tokenized, len(self.docs), len(self.vocab)))
+        return tokenized
+
+    def compact(self):
+        """Rewrite tokens.bin without the tokens of replaced documents"""
+
+        logging.info('compacting token store in ' + self.directory)
+        tmp_filename = temp_filename(self.tokens_filename)
+        docs = {}
+        offset = 0
+        try:
+            with open(tmp_filename, 'wb') as out:
+                for filename in sorted(self.docs, key=lambda x: \
+                        self.docs[x][0]):
+                    ids = self.doc_ids(filename)
+                    ids.tofile(out)
+                    docs[filename] = [offset, len(ids)] \
+                        + self.docs[filename][2:4]
+                    offset += len(ids)
+        except:
+            os.remove(tmp_filename)
+            raise
+        self.close()
+        replace(tmp_filename, self.tokens_filename)
+        self.docs = docs
+        self.size = offset
+
+    def save(self):
+        self.tokens.flush()
+        with atomic_write(self.vocab_filename) as f:
+            for word in self.vocab:
+                f.write(word + u'\n')
+        with atomic_write(self.docs_filename) as f:
+            json.dump({
+                'version': FORMAT_VERSION,
+                'tokens': self.size,
+                'vocab': len(self.vocab),
+                'docs': self.docs,
+                }, f)
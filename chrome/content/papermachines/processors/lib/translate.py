@@ -1,12 +1,32 @@
 #!/usr/bin/python
 
-import sys, os, inspect, logging, re, json, codecs, traceback
+import sys, os, inspect, logging, re, json, codecs, traceback, urllib, urllib2
 
 from classpath import classPathHacker
-from bing_api import *
+from services import service_url
+try:
+    from bing_api import client_id, client_secret
+except ImportError:
+    client_id = client_secret = None
+
+class ServiceTranslate:
+    """
+    Translation through the service at PAPERMACHINES_TRANSLATE_URL
+    """
+    def __init__(self, url):
+        self.url = url
+
+    def execute(self, text, from_lang, lang_to):
+        query = urllib.urlencode({'text': text.encode('utf-8'), 'from': from_lang, 'to': lang_to})
+        return json.load(urllib2.urlopen(self.url + '?' + query))
 
 class Translator:
     def __init__(self, cwd, clientid = client_id, clientsecret=client_secret):
+        url = service_url('translate')
+        if url is not None:
+            self.translator = ServiceTranslate(url)
+            self.language = None
+            return
         jarLoad = classPathHacker()
         mtjPath = os.path.join(cwd, "lib", "mtjapi-0.6.1-deps.jar")
         if os.path.exists(mtjPath):
@@ -21,8 +41,12 @@ class Translator:
     def setLanguages(self, out_dir, from_lang="Hebrew", lang_to="English"):
         from_lang = from_lang.upper()
         lang_to = lang_to.upper()
-        self.from_lang = getattr(self.language, from_lang, "HEBREW")
-        self.lang_to = getattr(self.language, lang_to, "ENGLISH")
+        if self.language is None:
+            self.from_lang = from_lang
+            self.lang_to = lang_to
+        else:
+            self.from_lang = getattr(self.language, from_lang, "HEBREW")
+            self.lang_to = getattr(self.language, lang_to, "ENGLISH")
         joint_lang = re.sub(r"\W+", '', from_lang + lang_to, flags=re.UNICODE)
         self.translate_file = os.path.join(out_dir, "translator" + joint_lang + ".cache")
         if os.path.exists(self.translate_file):
@@ -35,7 +59,7 @@ class Translator:
         try:
             if text not in self.translations:
                 self.translations[text] = self.translator.execute(text, self.from_lang, self.lang_to)
-                logging.info("translating {:} as {:}".format(word, self.translations[word]).encode('utf-8'))
+                logging.info(u"translating {:} as {:}".format(text, self.translations[text]).encode('utf-8'))
             return self.translations[text]
         except:
             logging.error(traceback.format_exc())
@@ -3,7 +3,6 @@
 
 import sys
 import os
-import shutil
 import logging
 import tempfile
 import time
@@ -14,11 +13,15 @@ import urllib
 import json
 import codecs
 import csv
+import hashlib
 import traceback
 import platform
 import xml.etree.ElementTree as et
-from lib.stemutil import stem
+from lib.atomicfile import atomic_write
+from lib.tokenizer import WORDS
+from lib.textfile import TextFile
 from collections import defaultdict
+from itertools import izip
 import copy
 import textprocessor
 
@@ -53,7 +56,8 @@ class Mallet(textprocessor.TextProcessor):
         wordcounts_dir = os.path.join(dfr_dir, 'wordcounts')
         for doi in citations.keys():
             try:
-                this_text = ''
+                words = []
+                counts = []
                 for rowdict in \
                     self.parse_csv(os.path.join(wordcounts_dir,
                                    'wordcounts_' + doi.replace('/', '_'
@@ -61,14 +65,12 @@ class Mallet(textprocessor.TextProcessor):
                     word = rowdict['WORDCOUNTS']
                     if word in self.stopwords:
                         continue
-                    if self.stemming:
-                        prestem = word
-                        if word not in self.stemmed:
-                            self.stemmed[prestem] = stem(self, prestem)
-                        word = self.stemmed[prestem]
-                    count = int(rowdict['WEIGHT'])
-
-                    this_text += (word + u' ') * count
+                    words.append(word)
+                    counts.append(int(rowdict['WEIGHT']))
+                if self.stemming:
+                    words = self.stems_of(words)
+                this_text = u''.join((word + u' ') * count for (word,
+                                     count) in izip(words, counts))
                 if len(this_text) < 20:
                     continue
                 yield (doi, this_text)
@@ -76,6 +78,29 @@ class Mallet(textprocessor.TextProcessor):
                 logging.error(doi)
                 logging.error(traceback.format_exc())
 
+    def _split_words(self, text):
+        """
+        Lowercased words of text, or of an open file, split at every
+        character but word characters, as MALLET import always has
+
+        The token store is not used: it keeps n-gram tokens, which join
+        words across line breaks and hyphens.
+        """
+
+        return WORDS.words(text)
+
+    def _prepare_words(self, words):
+        """
+        Stem and filter one document's words; safe to run on worker threads
+        """
+
+        if not self.stemming:
+            return words
+        stopwords = self.stopwords
+        return [stemmed for (word, stemmed) in izip(words,
+                self.stems_of(words)) if len(stemmed) >= 4 and word
+                not in stopwords]
+
     def _output_text(
         self,
         text,
@@ -83,59 +108,137 @@ class Mallet(textprocessor.TextProcessor):
         filename,
         ):
 
-        text = re.sub(r"[^\w ]+", u' ', text.lower(), flags=re.UNICODE)
-        if self.stemming:
-            newtext = u''
-            for word in text.split():
-                if word not in self.stemmed:
-                    self.stemmed[word] = stem(self, word)
-                if len(self.stemmed[word]) < 4 or word \
-                    in self.stopwords:
-                    continue
+        self._output_words(self._prepare_words(self._split_words(text)),
+                           f, filename)
 
-                itemid = self.metadata[filename]['itemID'].split('.')[0]
-                self.index[self.stemmed[word]].add(itemid)
+    def _output_words(
+        self,
+        words,
+        f,
+        filename,
+        ):
 
-                newtext += self.stemmed[word] + u' '
-            text = newtext
+        if self.stemming:
+            itemid = self.metadata[filename]['itemID'].split('.')[0]
+            for word in words:
+                self.index[word].add(itemid)
+            text = u''.join(word + u' ' for word in words)
         else:
             itemid = self.metadata[filename]['itemID']
-            for word in set(text.split()):
+            for word in set(words):
                 self.index[word].add(itemid)
+            text = u' '.join(words)
         f.write(u'\t'.join([filename, self.metadata[filename]['label'],
                 text]) + u'\n')
         self.docs.append(filename)
 
+    def _read_document(self, filename):
+        """
+        Words of one text (or of each of its segments), stemmed and
+        filtered, as a list of (segment number or None, words)
+        """
+
+        text = TextFile(filename)
+        if not self.segmentation:
+            with text.open() as input_file:
+                return [(None,
+                        self._prepare_words(self._split_words(input_file)))]
+        segments = (x for x in text.split(u'\n\n') if x.count(' ') > 5)
+        return [(i, self._prepare_words(self._split_words(text_seg)))
+                for (i, text_seg) in enumerate(segments)]
+
+    def _import_cache_filename(self):
+
+        # 'words' names the tokenizer rule the cached words were made with
+
+        settings = json.dumps([self.stemming, self.segmentation,
+                              getattr(self, 'lang', 'en'),
+                              self.stopwords.fingerprint, 'words'])
+        return os.path.join(self.out_dir, 'mallet_import', self.collection
+                            + '-' + hashlib.md5(settings).hexdigest()[:12]
+                            + '.txt')
+
+    def _load_import_cache(self, cache_filename):
+        """
+        Prepared words of each text from the last import with the same
+        settings, as {filename: (content hash, [(segment, words)])}
+        """
+
+        cached = {}
+        if not os.path.exists(cache_filename):
+            return cached
+        try:
+            with codecs.open(cache_filename, 'r', encoding='utf-8') as f:
+                for line in f:
+                    (filename, digest, i, words) = line.rstrip(u'\n'
+                            ).split(u'\t')
+                    entry = cached.setdefault(filename, (digest, []))
+                    entry[1].append(((int(i) if i != u'' else None),
+                                    words.split()))
+        except:
+            logging.error('import cache ' + cache_filename
+                          + ' could not be read -- re-importing')
+            cached = {}
+        return cached
+
     def _import_files(self):
-        if self.stemming:
-            self.stemmed = {}
         self.index = defaultdict(set)
         self.docs = []
         self.segmentation = getattr(self, 'segmentation', False)
 
-        with codecs.open(self.texts_file, 'w', encoding='utf-8') as f:
-            for filename in self.files:
-                with codecs.open(filename, 'r', encoding='utf-8') as \
-                    input_file:
-                    text = input_file.read()
-
-                    if self.segmentation:
-                        segments = filter(lambda x: x.count(' ') > 5,
-                                text.split('\n\n'))
-                        for (i, text_seg) in enumerate(segments):
-                            seg_filename = filename + '#' + str(i)
-                            self.metadata[seg_filename] = \
-                                copy.deepcopy(self.metadata[filename])
-                            self.metadata[seg_filename]['itemID'] += \
-                                '.' + str(i)
-                            self._output_text(text_seg, f, seg_filename)
-                    else:
-                        self._output_text(text, f, filename)
+        # words of texts whose contents (per the manifest) are unchanged
+        # since the last import come from the import cache; the rest are
+        # read, tokenized and stemmed on worker threads, and everything is
+        # written out in order here
+
+        manifest = self.get_manifest()
+        cache_filename = self._import_cache_filename()
+        cached = self._load_import_cache(cache_filename)
+        reused = 0
+
+        def read_document(filename):
+            digest = manifest.content_hash(filename)
+            entry = cached.get(filename)
+            if entry is not None and entry[0] == digest:
+                return (digest, entry[1], True)
+            return (digest, self._read_document(filename), False)
+
+        cache_dir = os.path.dirname(cache_filename)
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        with atomic_write(self.texts_file) as f, \
+            atomic_write(cache_filename) as cache_out:
+            documents = self.imap(read_document, self.files)
+            self.progress.start('import', len(self.files))
+            for (filename, (digest, segments, from_cache)) in \
+                izip(self.files, documents):
+                self.advance()
+                reused += from_cache
+                for (i, words) in segments:
+                    cache_out.write(u'\t'.join([filename, digest, (u''
+                                    if i is None else unicode(i)),
+                                    u' '.join(words)]) + u'\n')
+                    if i is None:
+                        self._output_words(words, f, filename)
+                        continue
+                    seg_filename = filename + '#' + str(i)
+                    self.metadata[seg_filename] = \
+                        copy.deepcopy(self.metadata[filename])
+                    self.metadata[seg_filename]['itemID'] += '.' \
+                        + str(i)
+                    self._output_words(words, f, seg_filename)
+            self.progress.finish()
             if self.dfr:
-                for (doi, text) in self._import_dfr(self.dfr_dir):
-                    f.write(u'\t'.join([doi, self.metadata[doi]['label'
-                            ], text]) + u'\n')
-                    self.docs.append(doi)
+                with self.metrics.span('dfr'), \
+                    self.progress.running('dfr', None):
+                    for (doi, text) in self._import_dfr(self.dfr_dir):
+                        f.write(u'\t'.join([doi, self.metadata[doi]['label'
+                                ], text]) + u'\n')
+                        self.docs.append(doi)
+        logging.info('imported {:} texts, {:} unchanged since the last import'.format(len(self.files),
+                     reused))
+        self.metrics.count('import cache hits', reused)
+        self.metrics.count('import cache misses', len(self.files) - reused)
         with codecs.open(os.path.join(self.mallet_out_dir, 'dmap'), 'w'
                          , encoding='utf-8') as dmap:
             dmap.writelines([x + u'\n' for x in self.docs])
@@ -152,8 +255,10 @@ class Mallet(textprocessor.TextProcessor):
         self.index = defaultdict(set)
 
         i = 0
+        self.progress.start('tf-idf', self.doc_count)
         with codecs.open(self.texts_file, 'r', encoding='utf-8') as f:
             for line in f:
+                self.advance()
                 j = 0
                 filename = ''
                 for part in line.split(u'\t'):
@@ -202,7 +307,7 @@ class Mallet(textprocessor.TextProcessor):
         inverse_vocab = dict((v, k) for (k, v) in vocab.iteritems())
         new_vocab = {}
 
-        with codecs.open(self.texts_file, 'w', encoding='utf-8') as f:
+        with atomic_write(self.texts_file) as f:
             for (filename, freqs) in tf_all_docs.iteritems():
                 text = u''
                 flen = 0
@@ -230,6 +335,7 @@ class Mallet(textprocessor.TextProcessor):
         with codecs.open(os.path.join(self.mallet_out_dir, 'dmap'), 'w'
                          , encoding='utf-8') as dmap:
             dmap.writelines([x + u'\n' for x in self.docs])
+        self.progress.finish()
         logging.info('tf-idf complete; retained {:} of {:} words; minimum tf-idf score: {:}'.format(len(new_vocab.keys()),
                      len(vocab.keys()), min_score))
 
@@ -248,10 +354,20 @@ class Mallet(textprocessor.TextProcessor):
         self.mallet_out_dir = os.path.join(self.out_dir, self.name
                 + self.collection + '-' + self.args_basename)
 
+        # the directory is kept between runs: texts are re-imported (mostly
+        # from the import cache), so only files made from the previous
+        # import are removed, and the model's output is overwritten
+
         if not self.dry_run:
-            if os.path.exists(self.mallet_out_dir):
-                shutil.rmtree(self.mallet_out_dir)
-            os.makedirs(self.mallet_out_dir)
+            if not os.path.exists(self.mallet_out_dir):
+                os.makedirs(self.mallet_out_dir)
+            texts_name = self.collection + '.txt'
+            for name in (texts_name, texts_name + '-pre_tf-idf',
+                         texts_name + '-pre_dmr', self.collection
+                         + '.mallet', 'dmap'):
+                filename = os.path.join(self.mallet_out_dir, name)
+                if os.path.exists(filename):
+                    os.remove(filename)
 
         self.progress_filename = os.path.join(self.out_dir, self.name
                 + self.collection + 'progress.txt')
@@ -264,7 +380,8 @@ class Mallet(textprocessor.TextProcessor):
 
         if not os.path.exists(self.texts_file):
             if not self.dry_run:
-                self._import_files()
+                with self.metrics.span('import'):
+                    self._import_files()
         else:
             if len(self.extra_args) > 0 and self.dfr:
                 self._import_dfr_metadata(self.dfr_dir)
@@ -300,11 +417,12 @@ class Mallet(textprocessor.TextProcessor):
         logging.info('beginning text import')
 
         if tfidf and not self.dry_run and not self.use_bulkloader:
-            self._tfidf_filter()
+            with self.metrics.span('tf-idf'):
+                self._tfidf_filter()
 
         with codecs.open(os.path.join(self.mallet_out_dir, 'metadata.json'),
                          'w', encoding='utf-8') as meta_file:
-            json.dump(self.metadata, meta_file)
+            json.dump(self.metadata.to_dict(), meta_file)
 
         import_args = [
             '--input',
@@ -331,7 +449,10 @@ class Mallet(textprocessor.TextProcessor):
             if not self.dry_run and not os.path.exists(self.instance_file):
                 from cc.mallet.classify.tui.Csv2Vectors import main as \
                     Csv2Vectors
-                Csv2Vectors(import_args)
+                with self.metrics.span('instances'), \
+                    self.progress.running('instances'), \
+                    self.cancellable_java([self.instance_file]):
+                    Csv2Vectors(import_args)
         else:
             from cc.mallet.util.BulkLoader import main as BulkLoader
             import_args += [
@@ -343,7 +464,10 @@ class Mallet(textprocessor.TextProcessor):
                 '--prune-count',
                 '3'
             ]
-            BulkLoader(import_args)
+            with self.metrics.span('instances'), \
+                self.progress.running('instances'), \
+                self.cancellable_java([self.instance_file]):
+                BulkLoader(import_args)
 
     def process(self):
         """
@@ -356,6 +480,6 @@ class Mallet(textprocessor.TextProcessor):
 if __name__ == '__main__':
     try:
         processor = Mallet(track_progress=False)
-        processor.process()
+        processor.run()
     except:
         logging.error(traceback.format_exc())
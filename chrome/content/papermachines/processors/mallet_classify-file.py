@@ -55,6 +55,7 @@ class MalletClassifierTest(mallet.Mallet):
 
         classifier_return = subprocess.call(process_args,
                 stdout=self.progress_file, stderr=self.progress_file)
+        self.metrics.add_time('classify', time.time() - start_time)
 
         finished = 'Classifier finished in ' + str(time.time()
                 - start_time) + ' seconds'
@@ -86,6 +87,6 @@ class MalletClassifierTest(mallet.Mallet):
 if __name__ == '__main__':
     try:
         processor = MalletClassifierTest(track_progress=False)
-        processor.process()
+        processor.run()
     except:
         logging.error(traceback.format_exc())
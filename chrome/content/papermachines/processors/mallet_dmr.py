@@ -17,6 +17,7 @@ import xml.etree.ElementTree as et
 from itertools import izip
 import gzip
 from lib.stemutil import stem
+from lib.atomicfile import atomic_write
 import mallet_lda
 
 
@@ -71,7 +72,8 @@ class MalletDMR(mallet_lda.MalletLDA):
         logging.info('beginning text import')
 
         if tfidf and not self.dry_run:
-            self._tfidf_filter()
+            with self.metrics.span('tf-idf'):
+                self._tfidf_filter()
 
         self.split_into_intervals()
 
@@ -79,8 +81,7 @@ class MalletDMR(mallet_lda.MalletLDA):
 
         with codecs.open(self.texts_file + '-pre_dmr', 'r',
                          encoding='utf-8') as texts_file_old:
-            with codecs.open(self.texts_file, 'w', encoding='utf-8') as \
-                texts_file:
+            with atomic_write(self.texts_file) as texts_file:
                 for line in texts_file_old:
                     parts = line.split(u'\t')
                     if parts[0] in self.metadata:
@@ -91,7 +92,7 @@ class MalletDMR(mallet_lda.MalletLDA):
         with codecs.open(os.path.join(self.mallet_out_dir,
                          'metadata.json'), 'w', encoding='utf-8') as \
             meta_file:
-            json.dump(self.metadata, meta_file)
+            json.dump(self.metadata.to_dict(), meta_file)
 
         self.features_file = os.path.join(self.mallet_out_dir,
                 'features.txt')
@@ -108,7 +109,10 @@ class MalletDMR(mallet_lda.MalletLDA):
         from cc.mallet.topics.tui.DMRLoader import main as DMRLoader
         import_args = [self.texts_file, self.features_file, self.instance_file]
 
-        DMRLoader(import_args)
+        with self.metrics.span('instances'), \
+            self.progress.running('instances'), \
+            self.cancellable_java([self.instance_file]):
+            DMRLoader(import_args)
 
     def process(self):
         """
@@ -159,7 +163,12 @@ class MalletDMR(mallet_lda.MalletLDA):
             lda.setOptimizeInterval(100)
             lda.setTopicDisplay(100, 10)
             lda.addInstances(training)
-            lda.estimate()
+            with self.metrics.span('train'), self.profiled_java('train'), \
+                self.progress.watch_iterations(self.progress_filename,
+                    getattr(lda, 'numIterations', 1000)), \
+                self.cancellable_java([self.parameter_file,
+                                      self.state_file]):
+                lda.estimate()
             lda.writeParameters(File(self.parameter_file))
             lda.printState(File(self.state_file))
 
@@ -323,6 +332,6 @@ class MalletDMR(mallet_lda.MalletLDA):
 if __name__ == '__main__':
     try:
         processor = MalletDMR(track_progress=False)
-        processor.process()
+        processor.run()
     except:
         logging.error(traceback.format_exc())
@@ -49,6 +49,6 @@ class MalletDMRJSTOR(mallet_dmr.MalletDMR):
 if __name__ == '__main__':
     try:
         processor = MalletDMRJSTOR(track_progress=False)
-        processor.process()
+        processor.run()
     except:
         logging.error(traceback.format_exc())
@@ -79,7 +79,11 @@ class MalletLDA(mallet.Mallet):
 
         start_time = time.time()
         if not self.dry_run:
-            TopicTrainer(process_args)
+            with self.metrics.span('train'), self.profiled_java('train'), \
+                self.progress.watch_iterations(self.progress_filename,
+                    self.iterations), \
+                self.cancellable_java(self.mallet_files.values()):
+                TopicTrainer(process_args)
 
         logging.info("LDA complete in " + str(time.time() - start_time) +
                      " seconds")
@@ -188,6 +192,6 @@ class MalletLDA(mallet.Mallet):
 if __name__ == "__main__":
     try:
         processor = MalletLDA(track_progress = False)
-        processor.process()
+        processor.run()
     except:
         logging.error(traceback.format_exc())
@@ -9,6 +9,7 @@ import traceback
 import json
 import math
 import mallet_lda
+from lib.metadata import MetadataTable
 
 
 class MalletLDAMutualInformation(mallet_lda.MalletLDA):
@@ -78,9 +79,9 @@ class MalletLDAMutualInformation(mallet_lda.MalletLDA):
         return mi
 
     def process(self):
-        self.metadata = \
-            json.load(codecs.open(os.path.join(self.mallet_out_dir,
-                      'metadata.json'), 'r', encoding='utf-8'))
+        with codecs.open(os.path.join(self.mallet_out_dir,
+                         'metadata.json'), 'r', encoding='utf-8') as f:
+            self.metadata = MetadataTable.from_dict(json.load(f))
         self.files = self.metadata.keys()
 
         self.classify_file = os.path.join(self.out_dir,
@@ -187,6 +188,6 @@ class MalletLDAMutualInformation(mallet_lda.MalletLDA):
 if __name__ == '__main__':
     try:
         processor = MalletLDAMutualInformation(track_progress=False)
-        processor.process()
+        processor.run()
     except:
         logging.error(traceback.format_exc())
@@ -27,6 +27,6 @@ class MalletSubcollections(mallet_lda.MalletLDA):
 if __name__ == '__main__':
     try:
         processor = MalletSubcollections(track_progress=False)
-        processor.process()
+        processor.run()
     except:
         logging.error(traceback.format_exc())
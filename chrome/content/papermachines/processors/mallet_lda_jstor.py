@@ -45,6 +45,6 @@ class MalletJSTOR(mallet_lda.MalletLDA):
 if __name__ == '__main__':
     try:
         processor = MalletJSTOR(track_progress=False)
-        processor.process()
+        processor.run()
     except:
         logging.error(traceback.format_exc())
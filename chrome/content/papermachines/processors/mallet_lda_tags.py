@@ -28,20 +28,23 @@ class MalletTagTopics(mallet_lda.MalletLDA):
         if self.named_args is not None:
             if 'tags' in self.named_args:
                 self.tags = self.named_args['tags']
+                first_tag = {}
+                for (tag, itemIDs) in self.tags.iteritems():
+                    for itemID in itemIDs:
+                        first_tag.setdefault(itemID, tag)
                 for filename in self.metadata.keys():
-                    my_tags = [x for (x, y) in self.tags.iteritems()
-                               if int(self.metadata[filename]['itemID'
-                               ]) in y]
-                    if len(my_tags) > 0:
-                        self.metadata[filename]['label'] = my_tags[0]
+                    tag = first_tag.get(int(self.metadata[filename]['itemID'
+                                        ]))
+                    if tag is not None:
+                        self.metadata[filename]['label'] = tag
                     else:
                         del self.metadata[filename]
-                        self.files.remove(filename)
+                self.files = self.metadata.keys()
 
 
 if __name__ == '__main__':
     try:
         processor = MalletTagTopics(track_progress=False)
-        processor.process()
+        processor.run()
     except:
         logging.error(traceback.format_exc())
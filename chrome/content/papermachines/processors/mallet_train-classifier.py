@@ -45,6 +45,7 @@ class MalletClassifier(mallet.Mallet):
             classifier_return = subprocess.call(process_args,
                     stdout=self.progress_file,
                     stderr=self.progress_file)
+        self.metrics.add_time('train', time.time() - start_time)
 
         finished = 'Classifier trained in ' + str(time.time()
                 - start_time) + ' seconds'
@@ -58,6 +59,6 @@ class MalletClassifier(mallet.Mallet):
 if __name__ == '__main__':
     try:
         processor = MalletClassifier(track_progress=False)
-        processor.process()
+        processor.run()
     except:
         logging.error(traceback.format_exc())
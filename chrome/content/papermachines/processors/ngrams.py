@@ -9,9 +9,9 @@ import traceback
 import codecs
 import re
 import math
-import pickle
 import copy
 import itertools
+import time
 from collections import Counter, defaultdict
 import textprocessor
 
@@ -22,6 +22,8 @@ class NGrams(textprocessor.TextProcessor):
     Generate N-grams for a corpus
     """
 
+    cache_results = True
+
     def _basic_params(self):
         self.name = 'ngrams'
         self.interval = int(self.named_args.get('interval', 1))
@@ -49,20 +51,43 @@ class NGrams(textprocessor.TextProcessor):
                 logging.error('End date {:} not valid! Must be formatted like 2013-01-05'
                               )
 
-    def _findNgramFreqs(self, filenames):
-        freqs = Counter()
-        total_for_interval = 0.0
-        for filename in filenames:
-            doc_freqs = self.getNgrams(filename, n=self.n)
-            for (ngram, value) in doc_freqs.iteritems():
-                self.doc_freqs[ngram].append(self.metadata[filename]['itemID'
-                        ])
-                freqs[ngram] += value
-                total_for_interval += float(value)
-            self.update_progress()
-        for key in freqs.keys():
-            freqs[key] /= total_for_interval
-        return freqs
+    def _findDocFreqs(self, filenames):
+        """Item IDs of the documents each n-gram occurs in"""
+
+        matrix = self.get_term_matrix(n=self.n)
+        keep = self.term_mask(matrix)
+        vocab = matrix.vocab
+
+        def doc_terms(filename):
+            if filename not in matrix.docs:
+                return (None, ())
+            (indices, counts) = matrix.row(filename)
+            return (self.metadata[filename]['itemID'], [i for i in
+                    indices if keep[i]])
+
+        def add_doc(doc_freqs, result):
+            (itemID, terms) = result
+            for i in terms:
+                doc_freqs[i].append(itemID)
+
+        def merge(doc_freqs, other):
+            for (i, itemIDs) in other.iteritems():
+                doc_freqs[i].extend(itemIDs)
+
+        doc_freqs = self.map_reduce(doc_terms, filenames, add_doc, merge,
+                                    lambda : defaultdict(list))
+        for (i, itemIDs) in doc_freqs.iteritems():
+            self.doc_freqs[vocab[i]].extend(itemIDs)
+
+    def _findNgramFreqs(self, totals, daily, keep):
+        """Relative frequencies in one interval, from its summed counts"""
+
+        total_for_interval = float(sum(value for (i, value) in
+                                   totals.iteritems() if keep[i]))
+        if total_for_interval == 0:
+            return Counter()
+        return Counter(dict((daily.vocab[i], value / total_for_interval)
+                       for (i, value) in totals.iteritems() if keep[i]))
 
     def _filter_by_df(self):
         all_ngrams = len(self.doc_freqs.keys())
@@ -110,12 +135,24 @@ class NGrams(textprocessor.TextProcessor):
 
         self.occupied_intervals = sorted(self.labels.keys())
 
+        self._findDocFreqs([filename for interval in
+                           self.occupied_intervals for filename in
+                           self.labels[interval]])
+
+        # interval counts are re-summed from per-day totals, which are
+        # kept between runs with different interval lengths
+
+        daily = self.get_daily_counts(n=self.n)
+        keep = self.term_mask(daily)
+        totals = self.interval_counts(daily)
         for interval in self.occupied_intervals:
-            current_docs = self.labels[interval]
-            self.freqs[interval] = self._findNgramFreqs(current_docs)
+            self.freqs[interval] = \
+                self._findNgramFreqs(totals.get(interval, Counter()),
+                    daily, keep)
 
         logging.info('ngram counts complete')
 
+        score_start = time.time()
         self._filter_by_df()
 
         self.ngrams_intervals = {}
@@ -133,6 +170,7 @@ class NGrams(textprocessor.TextProcessor):
 
         self.max_freq = max([max(l) for l in
                             self.ngrams_intervals.values()])
+        self.metrics.add_time('score', time.time() - score_start)
 
         # self.ngrams_intervals = dict((self.num_to_ngram[ngram], values) for ngram, values in self.ngrams_intervals.iteritems())
 
@@ -149,6 +187,6 @@ class NGrams(textprocessor.TextProcessor):
 if __name__ == '__main__':
     try:
         processor = NGrams(track_progress=True)
-        processor.process()
+        processor.run()
     except:
         logging.error(traceback.format_exc())
@@ -23,41 +23,23 @@ class PhraseNet(textprocessor.TextProcessor):
     cf. http://www-958.ibm.com/software/data/cognos/manyeyes/page/Phrase_Net.html
     """
 
+    cache_results = True
+
     def _basic_params(self):
         self.name = 'phrasenet'
 
 
     def getfiledate(self, filename):
-        date_str = self.metadata[filename]['date']
-        if date_str.strip() == '':
-            logging.error(("File {:} has invalid date" +
-                          "-- removing...").format(filename))
-            del self.metadata[filename]
-            return None
-        cleaned_date = date_str[0:10]
-        if '-00' in cleaned_date:
-            cleaned_date = cleaned_date[0:4] + '-01-01'
-        try:
-            date_for_doc = datetime.strptime(cleaned_date,
-                    '%Y-%m-%d')
-            #datestr_to_datetime[date_str] = date_for_doc
-            # if (self.start_date is not None and 
-            #         date_for_doc < self.start_date):
-            #     logging.error(("File {:} is before date range" +
-            #                    "-- removing...").format(filename))
-            #     del self.metadata[filename]
-            #     return None
-            # if (self.end_date is not None and 
-            #         date_for_doc > self.end_date):
-            #     logging.error(("File {:} is after date range" +
-            #                    "-- removing...").format(filename))
-            #     del self.metadata[filename]
-            #     return None
-            return date_for_doc
-        except:
-            logging.error(traceback.format_exc())
-            logging.error('Date {:} not recognized'.format(cleaned_date))
-            return None
+        date_for_doc = self.metadata.date(filename)
+        if date_for_doc is None:
+            date_str = self.metadata[filename]['date']
+            if date_str.strip() == '':
+                logging.error(("File {:} has invalid date" +
+                              "-- removing...").format(filename))
+                del self.metadata[filename]
+            else:
+                logging.error('Date {:} not recognized'.format(date_str[0:10]))
+        return date_for_doc
 
     #add phrases w/ key by date that file was written
     def _findPhrases(self, pattern):
@@ -76,7 +58,7 @@ class PhraseNet(textprocessor.TextProcessor):
                     self.wordcounts[date]+=len(line.split(' '))
                     for re_match in pattern.finditer(line):
                         match = [w.lower() for w in re_match.groups()]
-                        if any([word in self.stopwords_set for word in
+                        if any([word in self.stopwords for word in
                                match]):
                             continue
                         #for word in match:
@@ -155,8 +137,6 @@ class PhraseNet(textprocessor.TextProcessor):
         #pdb.set_trace()
         logging.info('starting to process')
  
-        self.stopwords_set = set(self.stopwords)
-
         self.edgesep = ','
 
         wordregex = "(\w+)"
@@ -175,7 +155,8 @@ class PhraseNet(textprocessor.TextProcessor):
         logging.info('extracting phrases according to pattern '
                      + repr(pattern))
 
-        self._findPhrases(re.compile(pattern, flags=re.UNICODE))
+        with self.metrics.span('count'):
+            self._findPhrases(re.compile(pattern, flags=re.UNICODE))
         #self._findTfIdfScores()
         logging.info('generating JSON')
 
@@ -229,6 +210,6 @@ class PhraseNet(textprocessor.TextProcessor):
 if __name__ == '__main__':
     try:
         processor = PhraseNet(track_progress=True)
-        processor.process()
+        processor.run()
     except:
         logging.error(traceback.format_exc())
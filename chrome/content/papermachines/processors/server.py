@@ -0,0 +1,297 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import sys
+import os
+import json
+import logging
+import traceback
+import time
+import binascii
+import threading
+import SocketServer
+
+# modules whose import dominates start-up time; loading them before the
+# first job arrives keeps every job on a warm interpreter
+
+PRELOAD = ['textprocessor', 'lib.stemutil', 'lib.classpath']
+
+# Anything that can reach the loopback port could otherwise run code as
+# this user, so every request carries the token written, with the port,
+# to a port file only this user can read, and only scripts directly in
+# the processors directory are run.
+
+PROCESSORS_DIR = os.path.dirname(os.path.realpath(os.path.abspath(__file__)))
+
+_compiled = {}
+log = logging.getLogger('papermachines.server')
+
+
+def _load_processor(processor_path):
+    """Compile a processor script once, recompiling only if it changed"""
+
+    mtime = os.path.getmtime(processor_path)
+    cached = _compiled.get(processor_path)
+    if cached is None or cached[0] != mtime:
+        with open(processor_path, 'rU') as f:
+            source = f.read()
+        cached = (mtime, compile(source, processor_path, 'exec'))
+        _compiled[processor_path] = cached
+    return cached[1]
+
+
+def _java_streams():
+    try:
+        from java.lang import System
+    except ImportError:
+        return None
+    return (System.out, System.err)
+
+
+def _restore_java_streams(streams):
+    if streams is not None:
+        from java.lang import System
+        System.setOut(streams[0])
+        System.setErr(streams[1])
+
+
+def _same(a, b):
+    """Compare two strings in time independent of where they differ"""
+
+    if not isinstance(a, basestring) or len(a) != len(b):
+        return False
+    difference = 0
+    for (x, y) in zip(a, b):
+        difference |= ord(x) ^ ord(y)
+    return difference == 0
+
+
+def _is_processor(processor_path):
+    if not isinstance(processor_path, basestring):
+        return False
+    path = os.path.realpath(os.path.abspath(processor_path))
+    return os.path.dirname(path) == PROCESSORS_DIR and path.endswith('.py')
+
+
+def _reset_logging():
+    """Close the handlers a processor attached to the root logger"""
+
+    root = logging.getLogger('')
+    for handler in root.handlers[:]:
+        try:
+            handler.close()
+        except:
+            pass
+        root.removeHandler(handler)
+
+
+def run_job(processor_path, args_filename, heap_estimate_mb=None):
+    """
+    Run a processor script exactly as
+    `jython <processor>.py args.json [heap estimate]` would, but inside
+    this interpreter; returns the exit status
+    """
+
+    saved_argv = sys.argv
+    saved_cwd = os.getcwd()
+    saved_streams = _java_streams()
+    sys.argv = [processor_path, args_filename]
+    if heap_estimate_mb is not None:
+        sys.argv.append(str(heap_estimate_mb))
+    status = 0
+    try:
+        code = _load_processor(processor_path)
+        job_globals = {'__name__': '__main__',
+                       '__file__': processor_path}
+        exec code in job_globals
+    except SystemExit, e:
+        if e.code is None:
+            status = 0
+        elif isinstance(e.code, int):
+            status = e.code
+        else:
+            status = 1
+    except:
+        log.error(traceback.format_exc())
+        status = 1
+    finally:
+        sys.argv = saved_argv
+        os.chdir(saved_cwd)
+        _restore_java_streams(saved_streams)
+        _reset_logging()
+    return status
+
+
+class JobHandler(SocketServer.StreamRequestHandler):
+
+    """
+    Reads one JSON job per connection. A job is answered with a line when
+    it has to wait for others ("queued"), one when it starts ("running")
+    and one when it has finished
+    """
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            job = json.loads(line)
+        except ValueError:
+            self._reply({'status': 'failed', 'error': 'bad request'})
+            return
+        if not isinstance(job, dict) or not _same(job.get('token'),
+                self.server.token):
+            log.error('rejected a request without the server token')
+            self._reply({'status': 'failed', 'error': 'bad token'})
+            return
+
+        command = job.get('command', 'run')
+        if command == 'ping':
+            self._reply({'status': 'ok'})
+        elif command == 'shutdown':
+            self._reply({'status': 'ok'})
+            self.server.running = False
+        elif command == 'run' and not _is_processor(job.get('processor')):
+            log.error('rejected processor outside ' + PROCESSORS_DIR + ': '
+                      + repr(job.get('processor')))
+            self._reply({'status': 'failed',
+                         'error': 'not a processor'})
+        elif command == 'run':
+            self._run(job)
+        else:
+            self._reply({'status': 'failed',
+                         'error': 'unknown command ' + command})
+        self.server.last_job = time.time()
+
+    def _run(self, job):
+
+        # jobs share sys.argv, the working directory, logging and Java's
+        # output streams, so they run one at a time, in turn
+
+        server = self.server
+        with server.state_lock:
+            ahead = server.jobs
+            server.jobs += 1
+        try:
+            if ahead > 0:
+                self._reply({'status': 'queued', 'ahead': ahead})
+            with server.job_lock:
+                self._reply({'status': 'running'})
+                start_time = time.time()
+                log.info('starting ' + job['processor'] + ' '
+                         + job['args'])
+                status = run_job(job['processor'], job['args'],
+                                 job.get('heap_estimate_mb'))
+                log.info('finished {:} with status {:} in {:.1f} seconds'.format(
+                    os.path.basename(job['processor']), status,
+                    time.time() - start_time))
+            self._reply({'status': ('done' if status == 0 else 'failed'),
+                         'exit': status})
+        finally:
+            with server.state_lock:
+                server.jobs -= 1
+                server.last_job = time.time()
+
+    def _reply(self, obj):
+        self.wfile.write(json.dumps(obj) + '\n')
+        self.wfile.flush()
+
+
+class ProcessorServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+
+    """
+    Long-lived interpreter that runs processor jobs sent over a local socket,
+    so the JVM, the imported modules, loaded jars, stemmers, stoplists and
+    gazetteer caches survive from one analysis to the next
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, port_filename, idle_limit=3600):
+        SocketServer.TCPServer.__init__(self, ('127.0.0.1', 0),
+                JobHandler)
+        self.port_filename = port_filename
+        self.idle_limit = idle_limit
+        self.timeout = 30
+        self.running = True
+        self.last_job = time.time()
+        self.token = binascii.hexlify(os.urandom(16))
+        self.job_lock = threading.Lock()
+        self.state_lock = threading.Lock()
+        self.jobs = 0
+        self.connections = 0
+
+    def process_request(self, request, client_address):
+
+        # counted here, before the handler's thread starts, so the idle
+        # check never sees a job that has just arrived as no job at all
+
+        with self.state_lock:
+            self.connections += 1
+        SocketServer.ThreadingMixIn.process_request(self, request,
+                client_address)
+
+    def shutdown_request(self, request):
+        SocketServer.TCPServer.shutdown_request(self, request)
+        with self.state_lock:
+            self.connections -= 1
+            self.last_job = time.time()
+
+    def preload(self):
+        for module in PRELOAD:
+            try:
+                __import__(module)
+            except:
+                log.error(traceback.format_exc())
+
+    def serve(self):
+        port_tmp = self.port_filename + '.tmp'
+        if os.path.exists(port_tmp):
+            os.remove(port_tmp)
+        fd = os.open(port_tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0600)
+        try:
+            os.chmod(port_tmp, 0600)
+            os.write(fd, json.dumps({'port': self.server_address[1],
+                     'token': self.token}))
+        finally:
+            os.close(fd)
+        if os.path.exists(self.port_filename):
+            os.remove(self.port_filename)
+        os.rename(port_tmp, self.port_filename)
+        log.info('listening on port ' + str(self.server_address[1]))
+        try:
+            while self.running or self.connections > 0:
+                self.handle_request()
+                if self.connections > 0:
+                    continue
+                if time.time() - self.last_job > self.idle_limit:
+                    log.info('idle for {:} seconds -- exiting'.format(
+                        self.idle_limit))
+                    break
+        finally:
+            if os.path.exists(self.port_filename):
+                os.remove(self.port_filename)
+            self.server_close()
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from lib import cancel
+    cancel.shared_process = True
+    port_filename = sys.argv[1]
+    log_dir = (sys.argv[2] if len(sys.argv) > 2
+               else os.path.dirname(port_filename))
+    handler = logging.FileHandler(os.path.join(log_dir, 'server.log'))
+    handler.setFormatter(logging.Formatter(
+        '%(asctime)s: %(levelname)-8s %(message)s'))
+    log.addHandler(handler)
+    log.setLevel(logging.INFO)
+    log.propagate = False
+    try:
+        server = ProcessorServer(port_filename)
+        server.preload()
+        server.serve()
+    except:
+        log.error(traceback.format_exc())
+        sys.exit(1)
@@ -12,12 +12,32 @@ import codecs
 import json
 import operator
 import platform
-import pickle
+import threading
+import bisect
+import hashlib
 from datetime import datetime, timedelta
 import re
 from itertools import izip
+from contextlib import contextmanager
 from collections import Counter, defaultdict
-from lib.stemutil import stem
+from lib.stemutil import stem_words, stem_cache, save_stems
+from lib.tokenstore import TokenStore, tokenize, store_dir
+from lib.termmatrix import TermMatrix, matrix_dir
+from lib.stoplist import Stoplist, load_stoplist
+from lib import parallel
+from lib.outputwriter import OutputWriter, write_shared_metadata, \
+    remove_unused_metadata, metadata_lock
+from lib.metadata import MetadataTable
+from lib.manifest import Manifest, manifest_filename
+from lib.resultcache import ResultCache, fingerprint
+from lib.metrics import Metrics
+from lib.progress import Progress
+from lib import cancel
+from lib.cancel import CancelSignal, Cancelled, cancel_filename, halt, \
+    CANCELLED_STATUS
+from lib.atomicfile import atomic_write
+from lib import profiler
+from lib import memory
 reload(sys)
 sys.setdefaultencoding('utf-8')
 
@@ -27,8 +47,14 @@ class TextProcessor:
     Base class for text processing in Paper Machines
     """
 
+    # processors whose whole output is what write_html writes can have
+    # run() reuse a finished result with the same fingerprint
+
+    cache_results = False
+
     def __init__(self, track_progress=True):
         self.sys = platform.system()
+        self.metrics = Metrics()
 
         # take in command line options
 
@@ -57,18 +83,28 @@ class TextProcessor:
 
         self.collection = os.path.basename(csv_file).replace('.csv', '')
 
+        # worker threads for per-document work; 'threads' overrides the
+        # default of one per core (under Jython)
+
+        self.workers = int((self.named_args or {}).get('threads', 0)) \
+            or parallel.default_workers()
+        self.lock = threading.RLock()
+
         self.require_stopwords = True  # load stopwords by default
 
         # call a function to set processor name, etc.
 
         self._basic_params()
 
+        # the extension writes stopwords.txt next to the processors; a
+        # 'stoplist' argument names another file instead
+
         if self.require_stopwords:
-            self.stoplist = os.path.join(self.cwd, 'stopwords.txt')
-            self.stopwords = [x.strip() for x in
-                              codecs.open(self.stoplist, 'r',
-                              encoding='utf-8').readlines()
-                              if x.strip() != '']
+            self.stoplist = (self.named_args or {}).get('stoplist') \
+                or os.path.join(self.cwd, 'stopwords.txt')
+            self.stopwords = load_stoplist(self.stoplist)
+        else:
+            self.stopwords = Stoplist()
 
         self.out_filename = os.path.join(self.out_dir, self.name
                 + self.collection + '-' + self.args_basename + '.html')
@@ -88,16 +124,51 @@ class TextProcessor:
         logging.info('command: ' + ' '.join([x.replace(' ', '''\ ''')
                      for x in sys.argv]))
 
-        self.metadata = {}
+        # a run expected to need more heap than it has works on one thread,
+        # so only one document's counts are held at a time. That is all
+        # low-memory mode does: nothing is spilled to disk beyond the token
+        # store and term matrices, which always live there, so a run that
+        # still doesn't fit runs out of memory as before. See lib/memory.py
+
+        self.heap_estimate = memory.estimate_from_argv(sys.argv)
+        heap_limit = memory.heap_limit()
+        self.low_memory = self.heap_estimate is not None and heap_limit \
+            is not None and self.heap_estimate > heap_limit
+        if self.low_memory:
+            logging.warning('estimated {:.0f} MB of heap needed, {:.0f} MB available -- running in low-memory mode'.format(self.heap_estimate
+                            / 1048576.0, heap_limit / 1048576.0))
+            self.workers = 1
+
+        # opt-in profiling of process(); see lib/profiler.py
 
-        for rowdict in self.parse_csv(csv_file):
-            filename = rowdict.pop('filename')
-            self.metadata[filename] = rowdict
+        self.profiler = profiler.from_settings(self.named_args,
+                os.path.join(self.out_dir, 'logs', self.name
+                + self.collection))
+
+        with self.metrics.span('metadata'):
+            self.metadata = MetadataTable.load(csv_file)
+        self.metrics.count(('metadata cache hits' if self.metadata.from_cache
+                            else 'metadata cache misses'))
 
         self.files = self.metadata.keys()
-        if track_progress:
-            self.track_progress = True
-            self.progress_initialized = False
+        self.metrics.count('documents', len(self.files))
+        self.track_progress = track_progress
+        self.progress_initialized = False
+
+        # stages, rates and ETAs as JSON lines; see lib/progress.py
+
+        self.progress = Progress(os.path.join(self.out_dir, self.name
+                                 + self.collection + 'progress.jsonl'))
+
+        # stop when <name><collection>.cancel appears; see lib/cancel.py
+
+        self.cancel = CancelSignal(cancel_filename(self.out_dir,
+                                   self.name, self.collection))
+        self.cancelled = False
+
+        # stems found this run; see stems_of
+
+        self.stem_memo = {}
         self.post_setup()
 
     def post_setup(self):
@@ -132,18 +203,78 @@ class TextProcessor:
             yield [unicode(cell, 'utf-8') for cell in row]
 
     def update_progress(self):
-        if self.track_progress:
-            if not self.progress_initialized:
+        """One more of self.files done; stops here if cancelled"""
+
+        self.cancel.check()
+        if not self.progress_initialized:
+            if self.track_progress:
                 self.progress_filename = os.path.join(self.out_dir,
                         self.name + self.collection + 'progress.txt')
                 self.progress_file = file(self.progress_filename, 'w')
-                self.count = 0
-                self.total = len(self.files)
-                self.progress_initialized = True
-            self.count += 1
-            self.progress_file.write('<' + str(int(self.count * 1000.0
-                    / float(self.total))) + '>\n')
-            self.progress_file.flush()
+            self.count = 0
+            self.total = len(self.files)
+            self.permille = None
+            self.progress.start(self.name, self.total)
+            self.progress_initialized = True
+        self.count += 1
+        self.progress.advance()
+        if self.track_progress:
+            permille = int(self.count * 1000.0 / float(self.total))
+            if permille != self.permille:
+                self.permille = permille
+                self.progress_file.write('<' + str(permille) + '>\n')
+                self.progress_file.flush()
+
+    def advance(self, n=1):
+        """
+        n more units of the current progress stage done; stops here if
+        cancelled
+        """
+
+        self.cancel.check()
+        self.progress.advance(n)
+
+    def stems_of(self, words, workers=1):
+        """
+        Stems of words, looking each distinct word up once in a memo kept
+        for the run and stemming the new ones together; see lib/stemutil.py
+        """
+
+        memo = self.stem_memo
+        missing = [word for word in set(words) if word not in memo]
+        if missing:
+            memo.update(izip(missing, stem_words(self, missing, workers)))
+        return [memo[word] for word in words]
+
+    def map_reduce(
+        self,
+        func,
+        items,
+        reduce_func=None,
+        merge_func=None,
+        initial=Counter,
+        progress=True,
+        ):
+        """
+        Run func over items on self.workers threads, folding the results of
+        each worker into its own accumulator (Counters by default) and
+        merging those; update_progress is called once per item
+        """
+
+        return parallel.map_reduce(
+            func,
+            items,
+            reduce_func,
+            merge_func,
+            initial,
+            self.workers,
+            (self.update_progress if progress else None),
+            )
+
+    def imap(self, func, items):
+        """Ordered map of func over items on self.workers threads"""
+
+        return parallel.imap(func, items, self.workers)
 
     def xpartition(self, seq, n=2):
         return izip(*(iter(seq), ) * n)
@@ -174,89 +305,218 @@ class TextProcessor:
     def older(self, old_file, new_file):
         return self.get_mtime(old_file) > self.get_mtime(new_file)
 
+    def get_manifest(self):
+        """
+        Corpus manifest of the collection, re-hashing any texts that were
+        added or rewritten since it was last saved
+        """
+
+        if getattr(self, 'manifest', None) is None:
+            with self.metrics.span('manifest'):
+                self.manifest = Manifest(manifest_filename(self.out_dir,
+                        self.collection))
+                changed = self.manifest.refresh(self.files,
+                        imap=self.imap)
+                self.manifest.save()
+            self.metrics.count('texts new or changed', len(changed))
+        return self.manifest
+
+    def derived_current(
+        self,
+        filename,
+        artifact,
+        path,
+        value=True,
+        ):
+        """
+        True if path, made from filename, is still good: the manifest has
+        artifact recorded (as value) for the text's current contents. Files
+        made before there was a manifest are taken on trust if they are
+        newer than the text.
+        """
+
+        if not os.path.exists(path):
+            return False
+        manifest = self.get_manifest()
+        recorded = manifest.artifact(filename, artifact)
+        if recorded is None and os.path.exists(filename) \
+            and os.path.getmtime(path) >= os.path.getmtime(filename):
+            manifest.record(filename, artifact, value)
+            return True
+        return recorded == value
+
+    def get_token_store(self):
+        """
+        Collection-wide token store, updated for any new or changed texts
+        """
+
+        if getattr(self, 'token_store', None) is None:
+            signature = self.get_manifest().signature
+            with self.metrics.span('tokenize'), \
+                self.progress.running('tokenize', len(self.files)):
+                store = TokenStore(store_dir(self.out_dir,
+                                   self.collection), signature)
+                tokenized = store.update(self.files,
+                        progress=self.advance, imap=self.imap)
+            self.metrics.count('texts tokenized', tokenized)
+            self.metrics.count('token store hits', len(self.files)
+                               - tokenized)
+            self.metrics.count('tokens', store.tokens_added)
+            self.metrics.count('bytes read', store.bytes_read)
+            manifest = self.get_manifest()
+            manifest.update_stats(documents=len(store.docs),
+                                  tokens=sum(entry[1] for entry in
+                                  store.docs.itervalues()),
+                                  vocabulary=len(store.vocab))
+            manifest.save()
+            self.token_store = store
+        return self.token_store
+
     def _ngrams(
         self,
         text,
         n=1,
         stemming=False,
         ):
-        text = re.sub(r"[^\w ]+", u'', text.lower(), flags=re.UNICODE)
+        return self._ngrams_from_words(tokenize(text), n, stemming)
+
+    def _ngrams_from_words(
+        self,
+        words,
+        n=1,
+        stemming=False,
+        ):
         if stemming:
-            words = [stem(self, word) for word in text.split()]
-        else:
-            words = [word for word in text.split()]
+            words = self.stems_of(words)
         total_n = len(words)
         i = 0
         while i < total_n - (n - 1):
-            ngram = words[i:i + n]
-            if not any([word in self.stopwords or not word.isalpha()
-                       for word in ngram]):
-                yield u' '.join(ngram)
+            ngram = u' '.join(words[i:i + n])
+            if self.stopwords.keep_term(ngram):
+                yield ngram
             i += 1
 
-    def getNgrams(
+    def _count_ngrams(
         self,
         filename,
         n=1,
         stemming=False,
         ):
-        ext = '_'
-        ext += ('stemmed' if stemming else '')
-        ext += str(n) + 'grams.pickle'
-        ngram_serialized = filename.replace('.txt', ext)
-        if os.path.exists(ngram_serialized) and not self.older(ngram_serialized,
-                                                               filename):
-            with open(ngram_serialized, 'rb') as ngram_serialized_file:
-                freqs = pickle.load(ngram_serialized_file)
-            for key in freqs.keys():
-                if any([word in self.stopwords or not word.isalpha()
-                       for word in key.split()]):
-                    del freqs[key]
-        else:
-            freqs = Counter()
+        store = self.get_token_store()
+        if not store.is_current(filename):
             with codecs.open(filename, 'r', encoding='utf8') as f:
                 logging.info('processing ' + filename)
-                freqs.update(self._ngrams(f.read(), n, stemming))
-            freqs = dict(freqs)
-            with open(ngram_serialized, 'wb') as ngram_serialized_file:
-                pickle.dump(freqs, ngram_serialized_file,
-                            protocol=pickle.HIGHEST_PROTOCOL)
-        return freqs
+                return Counter(self._ngrams(f, n, stemming))
+
+        if not stemming:
+
+            # count n-grams of token IDs first, so each distinct n-gram is
+            # checked against the stoplist mask only once
+
+            vocab = store.vocab
+            with self.lock:
+                self.store_mask = self.stopwords.mask(vocab,
+                        getattr(self, 'store_mask', None))
+                keep = self.store_mask
+            ids = store.doc_ids(filename)
+            if n == 1:
+                return Counter(dict((vocab[i], count) for (i, count) in
+                               Counter(ids).iteritems() if keep[i]))
+            grams = Counter(izip(*[ids[k:] for k in range(n)]))
+            freqs = Counter()
+            for (gram, count) in grams.iteritems():
+                if all(keep[i] for i in gram):
+                    freqs[u' '.join(vocab[i] for i in gram)] = count
+            return freqs
+        return Counter(self._ngrams_from_words(store.doc_words(filename),
+                       n, stemming))
+
+    def get_term_matrix(self, n=1, stemming=False):
+        """
+        Collection-wide n-gram count matrix, updated for any new or
+        changed texts
+        """
+
+        if getattr(self, 'term_matrices', None) is None:
+            self.term_matrices = {}
+            self.term_masks = {}
+        key = (n, stemming)
+        if key not in self.term_matrices:
+            store = self.get_token_store()
+            if stemming:
+
+                # the whole vocabulary in one go, rather than word by word
+                # as each text is counted
+
+                with self.metrics.span('stem'):
+                    self.stems_of(store.vocab, self.workers)
+            with self.metrics.span('count'):
+                matrix = TermMatrix(matrix_dir(self.out_dir,
+                                    self.collection, n, stemming),
+                                    self.stopwords.fingerprint,
+                                    self.get_manifest().signature)
+                counted = matrix.update(self.files, lambda filename: \
+                        self._count_ngrams(filename, n, stemming),
+                        imap=self.imap)
+            self.metrics.count('texts counted', counted)
+            self.metrics.count('term matrix hits', len(self.files)
+                               - counted)
+            self.term_matrices[key] = matrix
+        return self.term_matrices[key]
+
+    def term_mask(self, matrix):
+        """Flags for the terms of matrix that pass the current stoplist"""
+
+        mask = self.term_masks.get(matrix.directory)
+        mask = self.stopwords.mask(matrix.vocab, mask)
+        self.term_masks[matrix.directory] = mask
+        return mask
+
+    def getNgrams(
+        self,
+        filename,
+        n=1,
+        stemming=False,
+        ):
+        matrix = self.get_term_matrix(n, stemming)
+        if not matrix.is_current(filename):
+            matrix.update([filename], lambda filename: \
+                          self._count_ngrams(filename, n, stemming))
+        if filename not in matrix.docs:
+            logging.error('File {:} could not be read'.format(filename))
+            return {}
+        return matrix.row_dict(filename, self.term_mask(matrix))
 
     def split_into_intervals(self, start_and_end_dates=False):
         self.start_date = getattr(self, "start_date", None)
         self.end_date = getattr(self, "end_date", None)
-        datestr_to_datetime = {}
+        dates = {}
         for filename in self.metadata.keys():
-            date_str = self.metadata[filename]['date']
-            if date_str.strip() == '':
-                logging.error(("File {:} has invalid date" +
-                              "-- removing...").format(filename))
+            date_for_doc = self.metadata.date(filename)
+            if date_for_doc is None:
+                if self.metadata[filename]['date'].strip() == '':
+                    logging.error(("File {:} has invalid date" +
+                                  "-- removing...").format(filename))
+                else:
+                    logging.error(('Date {:} not recognized' +
+                                   '-- removing...').format(
+                                   self.metadata[filename]['date']))
                 del self.metadata[filename]
                 continue
-            cleaned_date = date_str[0:10]
-            if '-00' in cleaned_date:
-                cleaned_date = cleaned_date[0:4] + '-01-01'
-            try:
-                date_for_doc = datetime.strptime(cleaned_date,
-                        '%Y-%m-%d')
-                datestr_to_datetime[date_str] = date_for_doc
-                if (self.start_date is not None and 
-                        date_for_doc < self.start_date):
-                    logging.error(("File {:} is before date range" +
-                                   "-- removing...").format(filename))
-                    del self.metadata[filename]
-                    continue
-                if (self.end_date is not None and 
-                        date_for_doc > self.end_date):
-                    logging.error(("File {:} is after date range" +
-                                   "-- removing...").format(filename))
-                    del self.metadata[filename]
-                    continue
-            except:
-                logging.error(traceback.format_exc())
-                logging.error('Date {:} not recognized'.format(cleaned_date))
-        datetimes = sorted(datestr_to_datetime.values())
+            if (self.start_date is not None and 
+                    date_for_doc < self.start_date):
+                logging.error(("File {:} is before date range" +
+                               "-- removing...").format(filename))
+                del self.metadata[filename]
+                continue
+            if (self.end_date is not None and 
+                    date_for_doc > self.end_date):
+                logging.error(("File {:} is after date range" +
+                               "-- removing...").format(filename))
+                del self.metadata[filename]
+                continue
+            dates[filename] = date_for_doc
+        datetimes = sorted(dates.values())
         start_date = (datetimes[0] if self.start_date
                       is None else self.start_date)
         end_date = (datetimes[-1] if self.end_date
@@ -280,45 +540,295 @@ class TextProcessor:
                 self.interval_names.append(start.isoformat())
             start = end
 
+        # intervals are contiguous, so each distinct date is placed by
+        # bisecting their start dates
+
+        self.interval_starts = [start for (start, end) in self.intervals]
         self.labels = getattr(self, "labels", defaultdict(set))
-        for (filename, metadata) in self.metadata.iteritems():
-            label = ''
-            for i in range(len(self.intervals)):
-                interval = self.intervals[i]
-                dt = datestr_to_datetime[metadata['date']]
-                if (interval[0] <= dt and 
-                        dt < interval[1]):
-                    label = self.interval_names[i]
-                    break
-            self.labels[label].add(filename)
+        by_date = defaultdict(list)
+        for (filename, dt) in dates.iteritems():
+            by_date[dt].append(filename)
+        for (dt, filenames) in by_date.iteritems():
+            i = self.interval_index(dt)
+            label = (self.interval_names[i] if i is not None else '')
+            self.labels[label].update(filenames)
+
+    def interval_index(self, dt):
+        """Index of the interval containing dt, or None"""
+
+        i = bisect.bisect_right(self.interval_starts, dt) - 1
+        if i >= 0 and dt < self.intervals[i][1]:
+            return i
+        return None
+
+    def get_daily_counts(self, n=1, stemming=False):
+        """
+        Term counts summed per day over the documents in self.labels, kept
+        next to the term matrix; a run with another interval length
+        re-sums these days instead of every document
+        """
+
+        matrix = self.get_term_matrix(n, stemming)
+        docs = sorted(filename for filenames in self.labels.itervalues()
+                      for filename in filenames if filename in matrix.docs)
+        by_day = defaultdict(list)
+        source = hashlib.md5(str(matrix.source))
+        for filename in docs:
+            ordinal = self.metadata.date(filename).toordinal()
+            by_day[ordinal].append(filename)
+            source.update(u'{:}\t{:}\t{:}\n'.format(filename,
+                          matrix.docs[filename][0], ordinal).encode('utf-8'))
+        daily = TermMatrix(os.path.join(matrix.directory, 'daily'),
+                           source.hexdigest())
+        if daily.rows > 0 or len(docs) == 0:
+            self.metrics.count('daily totals hits')
+            return daily
+        self.metrics.count('daily totals misses')
+
+        logging.info('summing term counts for {:} days'.format(len(by_day)))
+        days = sorted(by_day.keys())
+
+        def day_counts(ordinal):
+            totals = Counter()
+            for filename in by_day[ordinal]:
+                (indices, counts) = matrix.row(filename)
+                totals.update(dict(izip(indices, counts)))
+            return dict((matrix.vocab[i], count) for (i, count) in
+                        totals.iteritems())
+
+        with self.metrics.span('count daily'), daily.writing():
+
+            # unless another run summed them while this one waited
+
+            if daily.rows == 0:
+                for (ordinal, freqs) in izip(days, self.imap(day_counts,
+                        days)):
+                    daily.append(str(ordinal), freqs, [])
+        return daily
+
+    def interval_counts(self, daily):
+        """
+        Counters of term IDs (of daily) for each interval name, summed from
+        the daily totals
+        """
+
+        ordinals = sorted(int(x) for x in daily.docs)
+
+        def interval_total(interval):
+            (start, end) = interval
+            totals = Counter()
+            for ordinal in ordinals[bisect.bisect_left(ordinals,
+                    start.toordinal()):bisect.bisect_left(ordinals,
+                    end.toordinal())]:
+                (indices, counts) = daily.row(str(ordinal))
+                totals.update(dict(izip(indices, counts)))
+            return totals
+
+        return dict(izip(self.interval_names, self.imap(interval_total,
+                    self.intervals)))
 
     def write_html(self, data_params):
+        with self.metrics.span('output'):
+            self._write_html(data_params)
+
+    def _write_html(self, data_params):
         logging.info('writing HTML')
         self.data_filename = self.out_filename.replace('.html', '.js')
         html_params = {'COLLECTION_NAME': self.collection_name,
                        'DATA_PATH': os.path.basename(self.data_filename)}
-        data_params.update({'DOC_METADATA': dict((v['itemID'], v)
-                           for (k, v) in self.metadata.iteritems())})
         try:
+            writer = OutputWriter(self.data_filename)
+            metadata_filename = write_shared_metadata(self.out_dir,
+                    self.collection, dict((v['itemID'], dict(v.items()))
+                    for v in self.metadata.values()),
+                    writer.files_filename)
+            html_params['METADATA_SRC'] = \
+                os.path.basename(metadata_filename)
+
             template_filename = getattr(self, 'template_filename',
                     os.path.join(self.cwd, 'templates', self.name
                     + '.html'))
 
-            with codecs.open(self.out_filename, 'w', encoding='utf-8'
-                             ) as outfile:
+            # the page goes in place last, once everything it loads is
+            # there
+
+            writer.write(data_params, html_params['METADATA_SRC'])
+            with atomic_write(self.out_filename) as outfile:
                 with codecs.open(template_filename, 'r',
                                  encoding='utf-8') as template:
                     template_str = template.read()
                     for (k, v) in html_params.iteritems():
                         template_str = template_str.replace(k, v)
                     outfile.write(template_str)
-            with codecs.open(self.data_filename, 'w', encoding='utf-8'
-                             ) as datafile:
-                datafile.write('var data=')
-                json.dump(data_params, datafile)
-                datafile.write(';')
+            remove_unused_metadata(self.out_dir, self.collection)
+            chunks = [os.path.join(self.out_dir, name) for name in
+                      writer.chunks]
+            self.metrics.count('output chunks', len(chunks))
+            self.written_files = {
+                'files': [self.out_filename, self.data_filename,
+                          writer.files_filename] + chunks,
+                'shared': [metadata_filename],
+                'rewrite': [self.out_filename, self.data_filename,
+                            writer.files_filename],
+                }
+        except:
+            logging.error(traceback.format_exc())
+
+    def result_fingerprint(self):
+        """
+        Hash of everything the output depends on: processor, arguments,
+        stoplist, metadata and the contents of every text
+        """
+
+        manifest = self.get_manifest()
+        return fingerprint(
+            self.name,
+            self.collection_name,
+            self.extra_args,
+            self.named_args,
+            self.stopwords.fingerprint,
+            self.metadata.signature,
+            sorted((filename, manifest.content_hash(filename))
+                   for filename in self.files if os.path.exists(filename)),
+            )
+
+    def run(self):
+        """
+        process(), unless the result cache has the output of a run with the
+        same fingerprint, which is copied into place instead; stage
+        timings and counters go to <name><collection>-metrics.json, and
+        the run's peak heap to the manifest's stats. A cancelled run stops
+        at its next check and returns with self.cancelled set
+        """
+
+        try:
+            with self.metrics.span('run'):
+                self._run()
+        except Cancelled:
+            self._cancelled()
+        finally:
+            try:
+                self.progress.close()
+                self._save_stems()
+                self.metrics.write(os.path.join(self.out_dir, self.name
+                                   + self.collection + '-metrics.json'))
+                if getattr(self, 'manifest', None) is not None \
+                    and self.metrics.peak_memory:
+                    self.manifest.record_peak(self.name,
+                            self.metrics.peak_memory)
+                    self.manifest.save()
+            except:
+                logging.error(traceback.format_exc())
+
+    def _save_stems(self):
+        """Keep the stems found for the next run; see lib/stemcache.py"""
+
+        cache = stem_cache(self)
+        if cache is not None and cache.hits + cache.misses > 0:
+            self.metrics.count('stem cache hits', cache.hits)
+            self.metrics.count('stem cache misses', cache.misses)
+            cache.hits = cache.misses = 0
+        save_stems()
+
+    def _cancelled(self, partial_files=()):
+        """
+        Record the cancellation, removing partial_files; what was finished
+        stays in the manifest, so running again picks up from there
+        """
+
+        logging.warning('cancelled')
+        self.cancelled = True
+        for filename in partial_files:
+            try:
+                if os.path.exists(filename):
+                    os.remove(filename)
+            except OSError:
+                logging.error(traceback.format_exc())
+        self.progress.cancel()
+        if getattr(self, 'manifest', None) is not None:
+            self.manifest.save()
+
+    def _process(self):
+        if self.profiler is None:
+            self.process()
+            return
+        self.profiler.start()
+        try:
+            self.process()
+        finally:
+            self.profiler.stop()
+
+    @contextmanager
+    def profiled_java(self, name):
+        """With profiling on, dump JVM threads while the block runs"""
+
+        if self.profiler is None:
+            yield
+        else:
+            with self.profiler.java_section(name):
+                yield
+
+    @contextmanager
+    def cancellable_java(self, partial_files=()):
+        """
+        Cancellation for a Java section (MALLET's importers and samplers),
+        which can't check for itself: a thread watches for the sentinel
+        and, when it appears, removes partial_files and ends the process.
+        A process other jobs share is never ended: there the section runs
+        to its end and the run stops just after it
+        """
+
+        if cancel.shared_process:
+            yield
+            self.cancel.check()
+            return
+
+        stopped = threading.Event()
+
+        def watch():
+            while not stopped.is_set():
+                if self.cancel.requested():
+                    self._cancelled(partial_files)
+                    self.progress.close()
+                    halt(CANCELLED_STATUS)
+                stopped.wait(self.cancel.interval)
+
+        thread = threading.Thread(target=watch, name='cancel')
+        thread.daemon = True
+        thread.start()
+        try:
+            yield
+        finally:
+            stopped.set()
+            thread.join()
+
+    def _run(self):
+        if not self.cache_results:
+            self._process()
+            return
+        results = ResultCache(os.path.join(self.out_dir, 'results'))
+        key = None
+        try:
+            key = self.result_fingerprint()
+
+            # the restored file list names the shared metadata file it
+            # brings back; see lib/outputwriter.py
+
+            with metadata_lock(self.out_dir, self.collection):
+                restored = results.restore(key, self.out_filename)
+            if restored:
+                self.metrics.count('result cache hits')
+                return
         except:
             logging.error(traceback.format_exc())
+        self.metrics.count('result cache misses')
+        self._process()
+        written = getattr(self, 'written_files', None)
+        if key is not None and written is not None:
+            try:
+                results.store(key, self.out_filename, **written)
+            except:
+                logging.error(traceback.format_exc())
 
     def process(self):
         """
@@ -336,6 +846,6 @@ class TextProcessor:
 if __name__ == '__main__':
     try:
         processor = TextProcessor(track_progress=True)
-        processor.process()
+        processor.run()
     except:
         logging.error(traceback.format_exc())
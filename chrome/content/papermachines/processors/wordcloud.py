@@ -12,6 +12,7 @@ import codecs
 import math
 import textprocessor
 from collections import Counter
+from itertools import izip
 from lib.stemutil import stem
 
 
@@ -21,6 +22,9 @@ class WordCloud(textprocessor.TextProcessor):
     Generate word cloud
     """
 
+    keep_doc_tf = False  # subclasses comparing documents need tf_by_doc
+    cache_results = True
+
     def _basic_params(self):
         self.name = 'wordcloud'
         self.width = 300
@@ -31,33 +35,57 @@ class WordCloud(textprocessor.TextProcessor):
         self.tfidf_scoring = False
 
     def _findTfIdfScores(self, scale=True):
-        self.freqs = Counter()
-        self.tf_by_doc = {}
-        self.max_tf = {}
-        self.df = Counter()
         ngram = (1 if not hasattr(self, 'ngram') else self.ngram)
         self.stemming = getattr(self, 'stemming', False)
-        for filename in self.files:
-            flen = 0
-            self.tf_by_doc[filename] = self.getNgrams(filename,
-                    n=ngram, stemming=self.stemming)
-            flen = sum(self.tf_by_doc[filename].values())
-            self.df.update(self.tf_by_doc[filename].keys())
-
-            self.freqs.update(self.tf_by_doc[filename])
-
-            for stem in self.tf_by_doc[filename].keys():
+        matrix = self.get_term_matrix(n=ngram, stemming=self.stemming)
+        keep = self.term_mask(matrix)
+        vocab = matrix.vocab
+        keep_doc_tf = self.keep_doc_tf
+
+        # documents are read on worker threads; each keeps totals by term
+        # ID (freqs, df, max_tf) plus per-document tf, merged at the end
+
+        def doc_row(filename):
+            if filename not in matrix.docs:
+                return (filename, [], 0.0)
+            (indices, counts) = matrix.row(filename)
+            row = [(i, c) for (i, c) in izip(indices, counts) if keep[i]]
+            return (filename, row, float(sum(c for (i, c) in row)))
+
+        def add_doc(acc, result):
+            (freqs, df, max_tf, tf_by_doc) = acc
+            (filename, row, flen) = result
+            for (i, c) in row:
+                freqs[i] += c
+                df[i] += 1
+                this_tf = c / flen
+                if max_tf.get(i, 0.0) < this_tf:
+                    max_tf[i] = this_tf
+            if keep_doc_tf:
                 if scale:
-                    self.tf_by_doc[filename][stem] /= float(flen)  # max_tf_d
-                    this_tf = self.tf_by_doc[filename][stem]
+                    tf_by_doc[filename] = dict((vocab[i], c / flen)
+                            for (i, c) in row)  # max_tf_d
                 else:
-                    this_tf = self.tf_by_doc[filename][stem] \
-                        / float(flen)
-
-                if stem not in self.max_tf or self.max_tf[stem] \
-                    < this_tf:
-                    self.max_tf[stem] = this_tf
-            self.update_progress()
+                    tf_by_doc[filename] = dict((vocab[i], c) for (i,
+                            c) in row)
+
+        def merge(acc, other):
+            acc[0].update(other[0])
+            acc[1].update(other[1])
+            for (i, this_tf) in other[2].iteritems():
+                if acc[2].get(i, 0.0) < this_tf:
+                    acc[2][i] = this_tf
+            acc[3].update(other[3])
+
+        (freqs, df, max_tf, self.tf_by_doc) = self.map_reduce(doc_row,
+                self.files, add_doc, merge, lambda : (Counter(),
+                Counter(), {}, {}))
+        self.freqs = Counter(dict((vocab[i], c) for (i, c) in
+                             freqs.iteritems()))
+        self.df = Counter(dict((vocab[i], c) for (i, c) in
+                          df.iteritems()))
+        self.max_tf = dict((vocab[i], tf) for (i, tf) in
+                           max_tf.iteritems())
         n = float(len(self.files))
         self.idf = dict((term, math.log10(n / df)) for (term, df) in
                         self.df.iteritems())
@@ -101,11 +129,18 @@ class WordCloud(textprocessor.TextProcessor):
 
     def _findWordFreqs(self, filenames):
         self.stemming = getattr(self, 'stemming', False)
-        freqs = Counter()
-        for filename in filenames:
-            freqs.update(self.getNgrams(filename,
-                         stemming=self.stemming))
-            self.update_progress()
+        matrix = self.get_term_matrix(stemming=self.stemming)
+        keep = self.term_mask(matrix)
+
+        def row_counts(filename):
+            if filename not in matrix.docs:
+                return {}
+            (indices, counts) = matrix.row(filename)
+            return dict(izip(indices, counts))
+
+        totals = self.map_reduce(row_counts, filenames)
+        freqs = dict((matrix.vocab[i], c) for (i, c) in
+                     totals.iteritems() if keep[i])
         return self._topN(freqs)
 
     def process(self):
@@ -116,11 +151,12 @@ class WordCloud(textprocessor.TextProcessor):
 
         logging.info('finding word frequencies')
 
-        if self.tfidf_scoring:
-            self._findTfIdfScores()
-            freqs = self._topN(self.filtered_freqs)
-        else:
-            freqs = self._findWordFreqs(self.files)
+        with self.metrics.span('score'):
+            if self.tfidf_scoring:
+                self._findTfIdfScores()
+                freqs = self._topN(self.filtered_freqs)
+            else:
+                freqs = self._findWordFreqs(self.files)
 
         params = {
             'DATA': freqs,
@@ -138,6 +174,6 @@ class WordCloud(textprocessor.TextProcessor):
 if __name__ == '__main__':
     try:
         processor = WordCloud(track_progress=True)
-        processor.process()
+        processor.run()
     except:
         logging.error(traceback.format_exc())
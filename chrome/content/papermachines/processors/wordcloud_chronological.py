@@ -68,10 +68,26 @@ class WordCloudChronological(wordcloud_multiple.MultipleWordClouds):
     def _split_into_labels(self):
         self.split_into_intervals(start_and_end_dates=True)
 
+    def _findLabelFreqs(self, label, filenames):
+
+        # plain clouds are summed from per-day totals, so changing the
+        # interval length does not re-read every document
+
+        if getattr(self, 'interval_totals', None) is None:
+            self.stemming = getattr(self, 'stemming', False)
+            self.daily = self.get_daily_counts(stemming=self.stemming)
+            self.interval_totals = self.interval_counts(self.daily)
+        keep = self.term_mask(self.daily)
+        totals = self.interval_totals.get(label, {})
+        for filename in filenames:
+            self.update_progress()
+        return self._topN(dict((self.daily.vocab[i], c) for (i, c) in
+                          totals.iteritems() if keep[i]))
+
 
 if __name__ == '__main__':
     try:
         processor = WordCloudChronological(track_progress=True)
-        processor.process()
+        processor.run()
     except:
         logging.error(traceback.format_exc())
@@ -27,6 +27,6 @@ class LargeWordCloud(wordcloud.WordCloud):
 if __name__ == '__main__':
     try:
         processor = LargeWordCloud(track_progress=True)
-        processor.process()
+        processor.run()
     except:
         logging.error(traceback.format_exc())
@@ -10,6 +10,7 @@ import logging
 import traceback
 import codecs
 import math
+import time
 from collections import defaultdict
 import wordcloud
 
@@ -20,6 +21,8 @@ class MultipleWordClouds(wordcloud.WordCloud):
     Generate word clouds based on labels
     """
 
+    keep_doc_tf = True
+
     def _basic_params(self):
         self.name = 'wordcloud_multiple'
         self.width = 300
@@ -163,8 +166,11 @@ class MultipleWordClouds(wordcloud.WordCloud):
             return self._mannWhitney(ranks_by_set[0], ranks_by_set[1])
 
     def _split_into_labels(self):
-        for (filename, data) in self.metadata.iteritems():
-            self.labels[data['label']].add(filename)
+        for (label, filenames) in self.metadata.labels().iteritems():
+            self.labels[label].update(filenames)
+
+    def _findLabelFreqs(self, label, filenames):
+        return self._findWordFreqs(filenames)
 
     def process(self):
         logging.info('splitting into labeled sets')
@@ -172,6 +178,7 @@ class MultipleWordClouds(wordcloud.WordCloud):
         self._split_into_labels()
 
         clouds = {}
+        score_start = time.time()
 
         all_files = set(self.files)
         if self.tfidf_scoring:
@@ -229,7 +236,8 @@ class MultipleWordClouds(wordcloud.WordCloud):
                         in tfidf_for_labelset)
                 clouds[label] = self._topN(filtered_freqs_for_labelset)
             else:
-                clouds[label] = self._findWordFreqs(filenames)
+                clouds[label] = self._findLabelFreqs(label, filenames)
+        self.metrics.add_time('score', time.time() - score_start)
 
         params = {
             'CLOUDS': clouds,
@@ -246,6 +254,6 @@ class MultipleWordClouds(wordcloud.WordCloud):
 if __name__ == '__main__':
     try:
         processor = MultipleWordClouds(track_progress=True)
-        processor.process()
+        processor.run()
     except:
         logging.error(traceback.format_exc())
@@ -49,6 +49,6 @@ class WordCloudTranslate(wordcloud_large.LargeWordCloud):
 if __name__ == "__main__":
     try:
         processor = WordCloudTranslate(track_progress=True)
-        processor.process()
+        processor.run()
     except:
         logging.error(traceback.format_exc())
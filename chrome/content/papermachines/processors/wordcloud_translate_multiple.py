@@ -106,6 +106,6 @@ class WordCloudTranslateMultiple(wordcloud_multiple.MultipleWordClouds):
 if __name__ == "__main__":
     try:
         processor = WordCloudTranslateMultiple(track_progress=True)
-        processor.process()
+        processor.run()
     except:
         logging.error(traceback.format_exc())
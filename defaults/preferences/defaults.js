@@ -13,6 +13,7 @@ pref("extensions.papermachines.general.download_snapshots", false);
 
 pref("extensions.papermachines.general.experimental", false);
 pref("extensions.papermachines.general.increasemem", false);
+pref("extensions.papermachines.general.processor_server", true);
 
 pref("extensions.papermachines.general.python_exe", "");
 
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Words MALLET import reads from a text, whole or in segments.
+
+    python -m unittest discover tests/processors
+"""
+
+import os
+import sys
+import types
+import shutil
+import codecs
+import tempfile
+import unittest
+
+PROCESSORS_DIR = os.path.join(os.path.dirname(os.path.dirname(
+                              os.path.dirname(os.path.abspath(__file__)))),
+                              'chrome', 'content', 'papermachines',
+                              'processors')
+if PROCESSORS_DIR not in sys.path:
+    sys.path.insert(0, PROCESSORS_DIR)
+
+import mallet
+
+TEXT = u'The quick brown\nfox jumped.\nOver the lazy-dog\tagain and again\n\n' \
+    + u'A second paragraph, with state-of-the-art words in it.\n'
+
+
+def importer(segmentation):
+    processor = types.InstanceType(mallet.Mallet)
+    processor.stemming = False
+    processor.segmentation = segmentation
+    return processor
+
+
+class MalletImportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'text.txt')
+        with codecs.open(self.filename, 'w', encoding='utf-8') as f:
+            f.write(TEXT)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_newlines_and_hyphens_separate_words(self):
+        self.assertEqual(importer(False)._split_words(
+                         u'The quick brown\nfox jumped.\nOver the lazy-dog\tagain'
+                         ), [
+            u'the',
+            u'quick',
+            u'brown',
+            u'fox',
+            u'jumped',
+            u'over',
+            u'the',
+            u'lazy',
+            u'dog',
+            u'again',
+            ])
+
+    def test_segmentation_keeps_the_vocabulary(self):
+        [(whole, words)] = importer(False)._read_document(self.filename)
+        segments = importer(True)._read_document(self.filename)
+        self.assertEqual([i for (i, segment) in segments], [0, 1])
+        self.assertEqual(words, [word for (i, segment) in segments
+                         for word in segment])
+        self.assertTrue(u'state' in words and u'art' in words)
+        self.assertFalse(u'brownfox' in words)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Metadata rows behave like the dicts they replaced: CSV fields can be
+deleted, and a filename set again keeps its row.
+
+    python -m unittest discover tests/processors
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+PROCESSORS_DIR = os.path.join(os.path.dirname(os.path.dirname(
+                              os.path.dirname(os.path.abspath(__file__)))),
+                              'chrome', 'content', 'papermachines',
+                              'processors')
+if PROCESSORS_DIR not in sys.path:
+    sys.path.insert(0, PROCESSORS_DIR)
+
+from lib.metadata import MetadataTable
+
+CSV = 'filename,itemID,label,date\n' \
+    + 'a.txt,1,one,2001-02-03\n' \
+    + 'b.txt,2,two,2004-05-06\n'
+
+
+class MetadataTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.csv_file = os.path.join(self.directory, 'c1.csv')
+        with open(self.csv_file, 'w') as f:
+            f.write(CSV)
+        self.table = MetadataTable.load(self.csv_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_delete_column_field(self):
+        row = self.table['a.txt']
+        row['topics'] = [1, 2]
+        del row['label']
+        del row['date']
+        del row['topics']
+        self.assertFalse('label' in row)
+        self.assertRaises(KeyError, lambda : row['label'])
+        self.assertRaises(KeyError, row.__delitem__, 'label')
+        self.assertEqual(row.to_dict(), {u'itemID': u'1'})
+        self.assertEqual(self.table.date('a.txt'), None)
+        self.assertEqual(self.table.with_label(u'one'), [])
+        self.assertEqual(self.table['b.txt']['label'], u'two')
+
+        row['label'] = u'again'
+        self.assertEqual(row['label'], u'again')
+        self.assertEqual(self.table.with_label(u'again'), ['a.txt'])
+
+    def test_set_existing_filename_in_place(self):
+        doc = self.table.doc_id('a.txt')
+        self.table['a.txt'] = {u'label': u'new', u'date': u'1999-01-01',
+                               u'topics': [3]}
+        self.assertEqual(self.table.doc_id('a.txt'), doc)
+        self.assertEqual(self.table.keys(), ['a.txt', 'b.txt'])
+        self.assertEqual(len(self.table.filenames), 2)
+        self.assertEqual(self.table['a.txt'].to_dict(), {
+            u'itemID': u'',
+            u'label': u'new',
+            u'date': u'1999-01-01',
+            u'topics': [3],
+            })
+        self.assertEqual(self.table.date('a.txt'), datetime(1999, 1, 1))
+        self.assertEqual(self.table.with_label(u'one'), [])
+        self.assertEqual(self.table.with_label(u'new'), ['a.txt'])
+
+    def test_cache_leaves_no_temporary_files(self):
+        self.assertTrue(MetadataTable.load(self.csv_file).from_cache)
+        self.assertEqual(sorted(os.listdir(self.directory)), ['c1.csv',
+                         'c1.csv.metadata'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Shared metadata files are kept exactly as long as an output's file list
+names them.
+
+    python -m unittest discover tests/processors
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+PROCESSORS_DIR = os.path.join(os.path.dirname(os.path.dirname(
+                              os.path.dirname(os.path.abspath(__file__)))),
+                              'chrome', 'content', 'papermachines',
+                              'processors')
+if PROCESSORS_DIR not in sys.path:
+    sys.path.insert(0, PROCESSORS_DIR)
+
+from lib.outputwriter import OutputWriter, write_shared_metadata, \
+    remove_unused_metadata
+
+
+class SharedMetadataTest(unittest.TestCase):
+
+    def setUp(self):
+        self.out_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+
+    def output(self, name, metadata):
+        writer = OutputWriter(os.path.join(self.out_dir, name + '.js'))
+        filename = write_shared_metadata(self.out_dir, 'c1', metadata,
+                writer.files_filename)
+        return (writer, os.path.basename(filename))
+
+    def metadata_files(self):
+        return sorted(name for name in os.listdir(self.out_dir)
+                      if name.startswith('c1-metadata-'))
+
+    def test_named_before_written(self):
+        (writer, name) = self.output('wordcloudc1', {'1': {'title': 'A'}})
+
+        # no data written yet, but the file list already names it
+
+        remove_unused_metadata(self.out_dir, 'c1')
+        self.assertEqual(self.metadata_files(), [name])
+        writer.write({'words': [1, 2]}, name)
+        remove_unused_metadata(self.out_dir, 'c1')
+        self.assertEqual(self.metadata_files(), [name])
+
+    def test_removed_once_unnamed(self):
+        (first, old) = self.output('wordcloudc1', {'1': {'title': 'A'}})
+        first.write({}, old)
+        (second, shared) = self.output('ngramsc1', {'1': {'title': 'A'}})
+        self.assertEqual(shared, old)
+        (first, new) = self.output('wordcloudc1', {'1': {'title': 'B'}})
+        first.write({}, new)
+        remove_unused_metadata(self.out_dir, 'c1')
+        self.assertEqual(self.metadata_files(), sorted([old, new]))
+
+        # resetting an output deletes its file list
+
+        os.remove(second.files_filename)
+        remove_unused_metadata(self.out_dir, 'c1')
+        self.assertEqual(self.metadata_files(), [new])
+        self.assertFalse([name for name in os.listdir(self.out_dir)
+                         if name.endswith('.tmp') or name.endswith('.lock')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+A result restored under another output name refers to its own files by
+the new name, and its data is left as it was.
+
+    python -m unittest discover tests/processors
+"""
+
+import os
+import sys
+import json
+import codecs
+import shutil
+import tempfile
+import unittest
+
+PROCESSORS_DIR = os.path.join(os.path.dirname(os.path.dirname(
+                              os.path.dirname(os.path.abspath(__file__)))),
+                              'chrome', 'content', 'papermachines',
+                              'processors')
+if PROCESSORS_DIR not in sys.path:
+    sys.path.insert(0, PROCESSORS_DIR)
+
+from lib.resultcache import ResultCache
+
+PAGE = u'<script type="text/javascript" src="c1-metadata-0123456789ab.js"></script>\n' \
+    + u'<script type="text/javascript" src="wordcloudc1-old.js"></script>\n'
+
+DATA = u'var data={};\ndata["title"]="wordcloudc1-old, as typed";\n' \
+    + u'document.write(\'<script type="text/javascript" src="wordcloudc1-old-words-0.js"></script>\');\n'
+
+CHUNK = u'data["words"]=data["words"].concat([["wordcloudc1-old", 1]]);\n'
+
+
+class ResultCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.out_dir = tempfile.mkdtemp()
+        self.cache = ResultCache(os.path.join(self.out_dir, 'results'))
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+
+    def path(self, name):
+        return os.path.join(self.out_dir, name)
+
+    def write(self, name, contents):
+        with codecs.open(self.path(name), 'w', encoding='utf-8') as f:
+            f.write(contents)
+
+    def read(self, name):
+        with codecs.open(self.path(name), 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def test_restore_renames_references_only(self):
+        self.write('wordcloudc1-old.html', PAGE)
+        self.write('wordcloudc1-old.js', DATA)
+        self.write('wordcloudc1-old-words-0.js', CHUNK)
+        self.write('wordcloudc1-old-files.json',
+                   json.dumps({'chunks': ['wordcloudc1-old-words-0.js'],
+                   'metadata': 'c1-metadata-0123456789ab.js'}))
+        self.write('c1-metadata-0123456789ab.js', u'var DOC_METADATA={};\n')
+        own = ['wordcloudc1-old.html', 'wordcloudc1-old.js',
+               'wordcloudc1-old-files.json']
+        self.cache.store('key', self.path('wordcloudc1-old.html'),
+                         [self.path(x) for x in own
+                         + ['wordcloudc1-old-words-0.js']],
+                         shared=[self.path('c1-metadata-0123456789ab.js')],
+                         rewrite=[self.path(x) for x in own])
+
+        self.assertTrue(self.cache.restore('key',
+                        self.path('wordcloudc1-new.html')))
+        self.assertEqual(self.read('wordcloudc1-new.html'),
+                         PAGE.replace('src="wordcloudc1-old.js"',
+                         'src="wordcloudc1-new.js"'))
+        self.assertEqual(self.read('wordcloudc1-new.js'),
+                         DATA.replace('src="wordcloudc1-old-words-0.js"',
+                         'src="wordcloudc1-new-words-0.js"'))
+        self.assertEqual(self.read('wordcloudc1-new-words-0.js'), CHUNK)
+        self.assertEqual(json.loads(self.read('wordcloudc1-new-files.json')),
+                         {'chunks': ['wordcloudc1-new-words-0.js'],
+                         'metadata': 'c1-metadata-0123456789ab.js'})
+
+
+if __name__ == '__main__':
+    unittest.main()
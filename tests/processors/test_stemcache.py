@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Stem cache saves from runs in other processes take turns with this one's.
+
+    python -m unittest discover tests/processors
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+PROCESSORS_DIR = os.path.join(os.path.dirname(os.path.dirname(
+                              os.path.dirname(os.path.abspath(__file__)))),
+                              'chrome', 'content', 'papermachines',
+                              'processors')
+if PROCESSORS_DIR not in sys.path:
+    sys.path.insert(0, PROCESSORS_DIR)
+
+from lib.atomicfile import FileLock
+from lib.stemcache import StemCache, HEADER, cache_filename
+
+
+class StemCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = cache_filename(self.directory, 'english')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def cache(self, words):
+        cache = StemCache(self.filename)
+        for word in words:
+            if cache.get(word) is None:
+                cache.put(word, word[:4])
+        return cache
+
+    def test_save_waits_for_lock(self):
+        first = self.cache([u'running'])
+        first.save()
+
+        # another process appending: holds the lock, with its line
+        # half written
+
+        with open(self.filename, 'ab') as f:
+            f.write('jump')
+        saving = threading.Thread(target=self.cache([u'walking']).save)
+        with FileLock(self.filename):
+            saving.start()
+            time.sleep(0.3)
+            self.assertTrue(saving.is_alive())
+            with open(self.filename, 'ab') as f:
+                f.write('ing\tjump\n')
+        saving.join()
+
+        with open(self.filename, 'rb') as f:
+            self.assertEqual(f.read(), HEADER
+                             + 'running\trunn\njumping\tjump\nwalking\twalk\n')
+        self.assertFalse(os.path.exists(self.filename + '.lock'))
+
+
+if __name__ == '__main__':
+    unittest.main()
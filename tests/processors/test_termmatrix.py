@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Term matrix updates: runs updating one matrix at once take turns, and
+rows an unfinished run left behind are ignored.
+
+    python -m unittest discover tests/processors
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+
+PROCESSORS_DIR = os.path.join(os.path.dirname(os.path.dirname(
+                              os.path.dirname(os.path.abspath(__file__)))),
+                              'chrome', 'content', 'papermachines',
+                              'processors')
+if PROCESSORS_DIR not in sys.path:
+    sys.path.insert(0, PROCESSORS_DIR)
+
+from lib.termmatrix import TermMatrix
+
+
+def count(filename):
+    with open(filename) as f:
+        words = f.read().decode('utf-8').split()
+    return dict((word, words.count(word)) for word in words)
+
+
+class TermMatrixTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.matrix_dir = os.path.join(self.directory, 'matrix')
+        self.files = []
+        for i in range(5):
+            filename = os.path.join(self.directory, 'doc%d.txt' % i)
+            self.files.append(filename)
+            with open(filename, 'w') as f:
+                f.write('text %d text\n' % i)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def matrix(self, source='stoplist'):
+        return TermMatrix(self.matrix_dir, source)
+
+    def test_concurrent_updates_take_turns(self):
+        counts = []
+
+        def update():
+            counts.append(self.matrix().update(self.files, count))
+
+        threads = [threading.Thread(target=update) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(counts), [0, 0, 0, 5])
+        matrix = self.matrix()
+        self.assertEqual(matrix.rows, 5)
+        for (i, filename) in enumerate(self.files):
+            self.assertEqual(matrix.row_dict(filename), {u'text': 2,
+                             unicode(i): 1})
+        self.assertFalse([name for name in os.listdir(self.matrix_dir)
+                         if name.endswith('.tmp') or name.endswith('.lock')])
+
+    def test_unsaved_rows_are_dropped(self):
+        self.matrix().update(self.files, count)
+        unfinished = self.matrix()
+        unfinished.append('left over', {u'left': 1, u'over': 1}, [])
+        unfinished.close()
+        matrix = self.matrix()
+        self.assertEqual(matrix.rows, 5)
+        self.assertFalse(u'left' in matrix.term_ids)
+        with matrix.writing():
+            matrix.append('day', {u'text': 3}, [])
+        matrix = self.matrix()
+        self.assertEqual(matrix.rows, 6)
+        self.assertEqual(matrix.row_dict('day'), {u'text': 3})
+        self.assertFalse(u'left' in matrix.term_ids)
+
+    def test_new_source_recounts(self):
+        self.matrix().update(self.files, count)
+        matrix = self.matrix('another stoplist')
+        self.assertEqual(matrix.rows, 0)
+        self.assertEqual(matrix.update(self.files[::-1], lambda filename: \
+                         {u'other': 1}), 5)
+        matrix = self.matrix('another stoplist')
+        self.assertEqual(matrix.rows, 5)
+        self.assertEqual(matrix.vocab, [u'other'])
+        self.assertEqual(matrix.row_dict(self.files[0]), {u'other': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+The shared tokenizer against the tokenization each processor had before
+it: n-gram counting and MALLET import split text differently, and must
+go on doing so.
+
+    python -m unittest discover tests/processors
+"""
+
+import os
+import re
+import sys
+import random
+import unittest
+from StringIO import StringIO
+
+PROCESSORS_DIR = os.path.join(os.path.dirname(os.path.dirname(
+                              os.path.dirname(os.path.abspath(__file__)))),
+                              'chrome', 'content', 'papermachines',
+                              'processors')
+if PROCESSORS_DIR not in sys.path:
+    sys.path.insert(0, PROCESSORS_DIR)
+
+from lib.tokenizer import Tokenizer, NGRAMS, WORDS
+
+MULTILINE = u'The quick brown\nfox jumped.\nOver the lazy-dog\tagain'
+
+
+def baseline_ngrams(text):
+    """TextProcessor._ngrams before the shared tokenizer"""
+
+    return re.sub(r"[^\w ]+", u'', text.lower(), flags=re.UNICODE).split()
+
+
+def baseline_mallet(text):
+    """Mallet._import_files before the shared tokenizer"""
+
+    return re.sub(r"[^\w ]+", u' ', text.lower(), flags=re.UNICODE).split()
+
+
+def random_text(rng, length):
+    alphabet = u'abcdeAB\xe9\xdf1_ \n\t-.\'’,\xa0'
+    return u''.join(rng.choice(alphabet) for i in range(length))
+
+
+def streamed(tokenizer, text, chunk_size):
+    rule = Tokenizer(tokenizer.pattern.pattern, strip=(tokenizer.strip.pattern
+                     if tokenizer.strip is not None else None),
+                     lowercase=tokenizer.lowercase, chunk_size=chunk_size)
+    return rule.words(StringIO(text))
+
+
+class TokenizerTest(unittest.TestCase):
+
+    def test_ngrams_multiline(self):
+        self.assertEqual(NGRAMS.words(MULTILINE), [
+            u'the',
+            u'quick',
+            u'brownfox',
+            u'jumpedover',
+            u'the',
+            u'lazydogagain',
+            ])
+        self.assertEqual(NGRAMS.words(MULTILINE),
+                         baseline_ngrams(MULTILINE))
+
+    def test_words_multiline(self):
+        self.assertEqual(WORDS.words(MULTILINE), [
+            u'the',
+            u'quick',
+            u'brown',
+            u'fox',
+            u'jumped',
+            u'over',
+            u'the',
+            u'lazy',
+            u'dog',
+            u'again',
+            ])
+        self.assertEqual(WORDS.words(MULTILINE),
+                         baseline_mallet(MULTILINE))
+
+    def test_random_texts_match_baseline(self):
+        rng = random.Random(0)
+        for i in range(300):
+            text = random_text(rng, rng.randint(0, 80))
+            self.assertEqual(NGRAMS.words(text), baseline_ngrams(text))
+            self.assertEqual(WORDS.words(text), baseline_mallet(text))
+
+    def test_streams_match_strings(self):
+        rng = random.Random(1)
+        for i in range(100):
+            text = random_text(rng, rng.randint(0, 80))
+            for chunk_size in (1, 2, 7):
+                self.assertEqual(streamed(NGRAMS, text, chunk_size),
+                                 baseline_ngrams(text))
+                self.assertEqual(streamed(WORDS, text, chunk_size),
+                                 baseline_mallet(text))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Token store updates: changed texts are appended, runs updating one store
+at once take turns, and what an unfinished run left behind is ignored.
+
+    python -m unittest discover tests/processors
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+
+PROCESSORS_DIR = os.path.join(os.path.dirname(os.path.dirname(
+                              os.path.dirname(os.path.abspath(__file__)))),
+                              'chrome', 'content', 'papermachines',
+                              'processors')
+if PROCESSORS_DIR not in sys.path:
+    sys.path.insert(0, PROCESSORS_DIR)
+
+from lib.tokenstore import TokenStore
+
+
+class Signatures:
+
+    """Signatures set by the test, so no test waits on mtimes"""
+
+    def __init__(self):
+        self.versions = {}
+
+    def __call__(self, filename):
+        return [self.versions.get(filename, 0), os.path.getsize(filename)]
+
+
+class TokenStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store_dir = os.path.join(self.directory, 'store')
+        self.signature = Signatures()
+        self.files = []
+        for i in range(5):
+            filename = os.path.join(self.directory, 'doc%d.txt' % i)
+            self.files.append(filename)
+            self.write(filename, u'text number %d here\n' % i)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, filename, text):
+        with open(filename, 'w') as f:
+            f.write(text.encode('utf-8'))
+        self.signature.versions[filename] = \
+            self.signature.versions.get(filename, 0) + 1
+
+    def store(self):
+        return TokenStore(self.store_dir, self.signature)
+
+    def tokens_on_disk(self):
+        return os.path.getsize(os.path.join(self.store_dir, 'tokens.bin')) \
+            // 4
+
+    def test_changed_text_is_appended(self):
+        first = self.store()
+        self.assertEqual(first.update(self.files), 5)
+        size = self.tokens_on_disk()
+        self.write(self.files[1], u'a changed text\n')
+        second = self.store()
+        self.assertEqual(second.update(self.files), 1)
+        self.assertEqual(self.tokens_on_disk(), size + 3)
+        self.assertEqual(second.doc_words(self.files[1]), [u'a',
+                         u'changed', u'text'])
+        self.assertEqual(first.doc_words(self.files[3]), [u'text',
+                         u'number', u'3', u'here'])
+
+    def test_concurrent_updates_take_turns(self):
+        counts = []
+
+        def update():
+            counts.append(self.store().update(self.files))
+
+        threads = [threading.Thread(target=update) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(counts), [0, 0, 0, 5])
+        store = self.store()
+        for (i, filename) in enumerate(self.files):
+            self.assertEqual(store.doc_words(filename), [u'text',
+                             u'number', unicode(i), u'here'])
+        self.assertEqual(sorted(os.listdir(self.store_dir)), ['docs.json'
+                         , 'tokens.bin', 'vocab.txt'])
+
+    def test_unsaved_tokens_are_dropped(self):
+        self.store().update(self.files)
+        size = self.tokens_on_disk()
+        unfinished = self.store()
+        unfinished.tokens.append(unfinished.encode([u'left', u'over']))
+        unfinished.close()
+        self.write(self.files[0], u'new\n')
+        store = self.store()
+        store.update(self.files)
+        self.assertEqual(self.tokens_on_disk(), size + 1)
+        self.assertEqual(store.doc_words(self.files[0]), [u'new'])
+        self.assertEqual(store.vocab.count(u'left'), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()